@@ -3,6 +3,6 @@ Routes
 Módulos de rutas para diferentes recursos de la API.
 """
 
-from app.api.routes import rooms, auth
+from app.api.routes import rooms, auth, history
 
-__all__ = ["rooms", "auth"]
\ No newline at end of file
+__all__ = ["rooms", "auth", "history"]
\ No newline at end of file
@@ -0,0 +1,242 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from app.core.config import settings
+from app.core.connection_manager import connection_manager
+from app.core.memory_accounting import memory_accounting
+from app.core.room_manager import room_manager
+from app.core.security import require_admin
+from app.models.room import Room
+import asyncio
+import json
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+class RoomFilter:
+    """Filtros del listado de salas (tamaño, antigüedad y si está vacía)"""
+
+    def __init__(
+        self,
+        min_users: Optional[int],
+        max_users: Optional[int],
+        min_age_seconds: Optional[float],
+        max_age_seconds: Optional[float],
+        empty: Optional[bool]
+    ):
+        self.min_users = min_users
+        self.max_users = max_users
+        self.min_age_seconds = min_age_seconds
+        self.max_age_seconds = max_age_seconds
+        self.empty = empty
+
+    def matches(self, room: Room, now: datetime) -> bool:
+        users = len(room.users)
+        if self.min_users is not None and users < self.min_users:
+            return False
+        if self.max_users is not None and users > self.max_users:
+            return False
+        if self.empty is not None and (users == 0) != self.empty:
+            return False
+        if self.min_age_seconds is not None or self.max_age_seconds is not None:
+            age = (now - room.created_at).total_seconds()
+            if self.min_age_seconds is not None and age < self.min_age_seconds:
+                return False
+            if self.max_age_seconds is not None and age > self.max_age_seconds:
+                return False
+        return True
+
+
+def room_filter(
+    min_users: Optional[int] = Query(None, ge=0, description="Mínimo de usuarios"),
+    max_users: Optional[int] = Query(None, ge=0, description="Máximo de usuarios"),
+    min_age_seconds: Optional[float] = Query(None, ge=0, description="Salas creadas hace al menos N segundos"),
+    max_age_seconds: Optional[float] = Query(None, ge=0, description="Salas creadas hace como mucho N segundos"),
+    empty: Optional[bool] = Query(None, description="Solo vacías (true) o solo con usuarios (false)")
+) -> RoomFilter:
+    return RoomFilter(min_users, max_users, min_age_seconds, max_age_seconds, empty)
+
+
+def _room_line(room: Room, now: datetime) -> str:
+    """Serializa una sala como una línea NDJSON"""
+    return json.dumps({
+        "code": room.code,
+        "users": len(room.users),
+        "usernames": [user.username for user in room.users],
+        # Sockets del radar abiertos en este proceso
+        "sockets": len(connection_manager.rooms.get(room.code, ())),
+        "created_at": room.created_at.isoformat(),
+        "last_activity": room.last_activity.isoformat(),
+        "age_seconds": round((now - room.created_at).total_seconds(), 1),
+        "idle_seconds": round((now - room.last_activity).total_seconds(), 1)
+    }) + "\n"
+
+
+async def _stream_rooms(after: int, limit: Optional[int], filters: RoomFilter) -> AsyncIterator[str]:
+    """
+    Recorre las salas en orden de creación desde el cursor, en bloques de
+    `admin_rooms_chunk_size`, cediendo el event loop entre bloques. Termina
+    con una línea {"next_cursor": ..., "scanned": ..., "matched": ...};
+    next_cursor es null cuando no quedan salas.
+    """
+    chunk_size = settings.admin_rooms_chunk_size
+    cursor = after
+    scanned = matched = 0
+    exhausted = False
+    while limit is None or matched < limit:
+        page = room_manager.page_rooms(cursor, chunk_size)
+        if not page:
+            exhausted = True
+            break
+        now = datetime.utcnow()
+        lines = []
+        for seq, room in page:
+            cursor = seq
+            scanned += 1
+            if filters.matches(room, now):
+                lines.append(_room_line(room, now))
+                matched += 1
+                if limit is not None and matched >= limit:
+                    break
+        if lines:
+            yield "".join(lines)
+        # Dejar trabajar al resto de la aplicación entre bloques
+        await asyncio.sleep(0)
+
+    # La página se llenó justo al final: confirmar si quedan salas
+    if not exhausted and not room_manager.page_rooms(cursor, 1):
+        exhausted = True
+    yield json.dumps({
+        "next_cursor": None if exhausted else str(cursor),
+        "scanned": scanned,
+        "matched": matched
+    }) + "\n"
+
+
+def _parse_cursor(cursor: Optional[str]) -> int:
+    if cursor is None:
+        return 0
+    try:
+        value = int(cursor)
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido"
+        )
+    return value
+
+
+@router.get("/rooms")
+async def list_rooms(
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior"),
+    limit: Optional[int] = Query(None, gt=0, description="Salas por página"),
+    filters: RoomFilter = Depends(room_filter)
+):
+    """
+    Lista las salas vivas en orden de creación, una página por llamada.
+
+    La respuesta es NDJSON en streaming: una línea por sala y al final
+    `{"next_cursor": ..., "scanned": ..., "matched": ...}`. Para la página
+    siguiente se pasa `cursor=next_cursor`; el cursor es estable aunque se
+    creen o borren salas entre páginas (ninguna sala que siga viva se repite
+    ni se salta). Con filtros una página puede recorrer muchas salas: se leen
+    en bloques cediendo el event loop entre ellos.
+
+    Returns:
+        StreamingResponse: Salas en formato application/x-ndjson
+    """
+    limit = limit or settings.admin_rooms_page_size
+    if limit > settings.admin_rooms_max_page_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El máximo por página es {settings.admin_rooms_max_page_size} salas"
+        )
+    return StreamingResponse(
+        _stream_rooms(_parse_cursor(cursor), limit, filters),
+        media_type="application/x-ndjson"
+    )
+
+
+@router.get("/rooms/export")
+async def export_rooms(
+    cursor: Optional[str] = Query(None, description="Empezar después de este cursor"),
+    filters: RoomFilter = Depends(room_filter)
+):
+    """
+    Exporta todas las salas que cumplen los filtros en una sola respuesta
+    NDJSON (mismo formato que /admin/rooms, sin límite de página).
+
+    Returns:
+        StreamingResponse: Salas en formato application/x-ndjson
+    """
+    return StreamingResponse(
+        _stream_rooms(_parse_cursor(cursor), None, filters),
+        media_type="application/x-ndjson"
+    )
+
+
+@router.get("/memory")
+async def memory_report(top: Optional[int] = Query(None, gt=0, le=1000, description="Salas y sockets más pesados")):
+    """
+    Memoria aproximada que retiene cada sala y cada socket del proceso.
+
+    Returns:
+        dict: RSS del proceso, bytes contabilizados por componente (miembros,
+        posiciones, agregados, historial, eventos, geocercas, colas...),
+        mensajes encolados y las `top` salas y sockets más pesados
+    """
+    return await memory_accounting.report(top or settings.memory_report_top_n)
+
+
+@router.get("/memory/rooms/{code}")
+async def room_memory_report(code: str):
+    """
+    Desglose de la memoria de una sala por componente.
+
+    Returns:
+        dict: Bytes totales, desglose, sockets y mensajes encolados
+    """
+    report = memory_accounting.room_report(code.upper())
+    if report is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="La sala no tiene nada en memoria en este proceso"
+        )
+    return report
+
+
+@router.post("/memory/snapshot")
+async def take_memory_snapshot():
+    """
+    Activa tracemalloc (si no lo estaba) y guarda un snapshot de referencia
+    para /admin/memory/diff. Mientras está activo cada asignación cuesta más:
+    detenerlo con DELETE al terminar.
+    """
+    return await asyncio.to_thread(memory_accounting.take_baseline)
+
+
+@router.get("/memory/diff")
+async def memory_diff(
+    top: Optional[int] = Query(None, gt=0, le=1000, description="Ubicaciones que más crecieron"),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$")
+):
+    """
+    Diferencia entre la memoria actual y el snapshot de referencia, por
+    línea, archivo o pila de asignación.
+    """
+    diff = await asyncio.to_thread(memory_accounting.diff, top or settings.memory_report_top_n, group_by)
+    if diff is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="No hay snapshot de referencia: llama antes a POST /admin/memory/snapshot"
+        )
+    return diff
+
+
+@router.delete("/memory/snapshot")
+async def stop_memory_tracing():
+    """Detiene tracemalloc y descarta el snapshot de referencia"""
+    return {"stopped": memory_accounting.stop()}
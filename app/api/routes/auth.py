@@ -10,6 +10,7 @@ from app.services.auth_service import (
     get_current_user
 )
 from app.core.config import settings
+from app.core.rate_limiter import rate_limit, enforce_rate_limit
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
@@ -21,7 +22,12 @@ class RegisterRequest(BaseModel):
     password: str
 
 
-@router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/register",
+    response_model=TokenResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("register"))]
+)
 async def register(request: RegisterRequest, session: Session = Depends(get_session)):
     """
     Registra un nuevo usuario.
@@ -32,6 +38,8 @@ async def register(request: RegisterRequest, session: Session = Depends(get_sess
     Returns:
         TokenResponse: Token de acceso JWT, user_id y username
     """
+    enforce_rate_limit("register", f"user:{request.email.lower()}")
+    
     # Verificar si el email ya existe
     statement = select(User).where(User.email == request.email)
     existing_user = session.exec(statement).first()
@@ -65,7 +73,7 @@ async def register(request: RegisterRequest, session: Session = Depends(get_sess
     # Crear token de acceso
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
-        data={"sub": new_user.id, "username": new_user.username},
+        data={"sub": str(new_user.id), "username": new_user.username},
         expires_delta=access_token_expires
     )
     
@@ -77,7 +85,7 @@ async def register(request: RegisterRequest, session: Session = Depends(get_sess
     )
 
 
-@router.post("/login", response_model=TokenResponse)
+@router.post("/login", response_model=TokenResponse, dependencies=[Depends(rate_limit("login"))])
 async def login(request: LoginRequest, session: Session = Depends(get_session)):
     """
     Autentica un usuario y retorna un JWT token.
@@ -88,6 +96,9 @@ async def login(request: LoginRequest, session: Session = Depends(get_session)):
     Returns:
         TokenResponse: Token de acceso JWT, user_id y username
     """
+    # Limitar también por cuenta para frenar credential stuffing desde varias IPs
+    enforce_rate_limit("login", f"user:{request.email.lower()}")
+    
     user = authenticate_user(request.email, request.password, session)
     
     if not user:
@@ -100,7 +111,7 @@ async def login(request: LoginRequest, session: Session = Depends(get_session)):
     # Crear token de acceso
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
-        data={"sub": user.id, "username": user.username},
+        data={"sub": str(user.id), "username": user.username},
         expires_delta=access_token_expires
     )
     
@@ -0,0 +1,153 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, select
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional
+from app.core.config import settings
+from app.core.room_manager import room_manager
+from app.database.connection import get_engine
+from app.models.location import LocationPoint, LocationTrack
+from app.models.user import User
+from app.services.auth_service import get_current_user
+from app.core.track_compactor import RawPoint, build_tracks
+import json
+
+router = APIRouter(prefix="/rooms", tags=["history"])
+
+
+def _track_line(track: dict, compacted: bool) -> str:
+    """Serializa un tramo como una línea NDJSON"""
+    return json.dumps({
+        "username": track["username"],
+        "start_at": track["start_at"].isoformat(),
+        "end_at": track["end_at"].isoformat(),
+        "point_count": track["point_count"],
+        "polyline": track["polyline"],
+        "compacted": compacted
+    }) + "\n"
+
+
+def _stream_tracks(
+    engine,
+    code: str,
+    start: datetime,
+    end: datetime,
+    username: Optional[str]
+) -> Iterator[str]:
+    """
+    Genera los tramos de la sala en la ventana [start, end].
+    Primero los tramos ya compactados y después los puntos crudos recientes,
+    simplificados al vuelo con el mismo formato. Los puntos crudos llegan
+    ordenados por (usuario, hora) y cada tramo se emite en cuanto termina
+    (cambia el usuario o hay un hueco mayor a `track_segment_gap_seconds`):
+    en memoria solo está el tramo en curso.
+    """
+    with Session(engine) as session:
+        statement = (
+            select(LocationTrack)
+            .where(LocationTrack.room_code == code)
+            .where(LocationTrack.start_at <= end)
+            .where(LocationTrack.end_at >= start)
+            .order_by(LocationTrack.start_at)
+            .execution_options(yield_per=500)
+        )
+        if username:
+            statement = statement.where(LocationTrack.username == username)
+
+        for track in session.exec(statement):
+            yield _track_line(track.model_dump(), compacted=True)
+
+        statement = (
+            select(LocationPoint.username, LocationPoint.recorded_at, LocationPoint.lat, LocationPoint.lon)
+            .where(LocationPoint.room_code == code)
+            .where(LocationPoint.recorded_at >= start)
+            .where(LocationPoint.recorded_at <= end)
+            .order_by(LocationPoint.username, LocationPoint.recorded_at)
+            .execution_options(yield_per=2000)
+        )
+        if username:
+            statement = statement.where(LocationPoint.username == username)
+
+        gap = timedelta(seconds=settings.track_segment_gap_seconds)
+        segment_username: Optional[str] = None
+        segment: List[RawPoint] = []
+        for point_username, recorded_at, lat, lon in session.exec(statement):
+            if segment and (point_username != segment_username or recorded_at - segment[-1][0] > gap):
+                for track in build_tracks(code, segment_username, segment):
+                    yield _track_line(track, compacted=False)
+                segment = []
+            segment_username = point_username
+            segment.append((recorded_at, lat, lon))
+
+        if segment:
+            for track in build_tracks(code, segment_username, segment):
+                yield _track_line(track, compacted=False)
+
+
+@router.get("/{code}/history")
+async def get_room_history(
+    code: str,
+    start: datetime = Query(..., description="Inicio de la ventana (ISO 8601, UTC)"),
+    end: datetime = Query(..., description="Fin de la ventana (ISO 8601, UTC)"),
+    username: Optional[str] = Query(None, description="Filtrar por usuario"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Obtiene las trayectorias simplificadas de una sala en una ventana de tiempo.
+
+    La respuesta es NDJSON (una línea por tramo) y se envía en streaming.
+    Cada `polyline` codifica (lat, lon, segundos desde start_at).
+
+    Requiere token y ser miembro de la sala. Los códigos se reutilizan cuando
+    una sala expira, así que solo se devuelve lo registrado desde que se creó
+    la sala actual (nunca el historial de ocupantes anteriores del código).
+
+    Args:
+        code: Código de la sala
+        start: Inicio de la ventana
+        end: Fin de la ventana
+        username: Usuario opcional para filtrar
+
+    Returns:
+        StreamingResponse: Tramos en formato application/x-ndjson
+    """
+    # Las fechas se guardan en UTC sin zona horaria
+    if start.tzinfo:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    if end.tzinfo:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    if end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El fin de la ventana debe ser posterior al inicio"
+        )
+
+    code = code.upper()
+    room = room_manager.get_room(code)
+    if room is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="La sala no existe o ha expirado"
+        )
+    if not any(user.user_id == current_user.id for user in room.users):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No perteneces a esta sala"
+        )
+    # Solo la instancia actual de la sala: lo anterior es de otra sala con el mismo código
+    start = max(start, room.created_at)
+    if end <= start:
+        return StreamingResponse(iter(()), media_type="application/x-ndjson")
+
+    engine = get_engine()
+    if not engine:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Base de datos no inicializada"
+        )
+
+    return StreamingResponse(
+        _stream_tracks(engine, code, start, end, username),
+        media_type="application/x-ndjson"
+    )
@@ -1,24 +1,46 @@
-from fastapi import APIRouter, HTTPException, status, Query
+from fastapi import APIRouter, HTTPException, status, Query, Depends, Request
 from app.models.room import (
     CreateRoomResponse,
     JoinRoomRequest,
     JoinRoomResponse,
     LeaveRoomResponse,
-    Room
+    NearbyResponse,
+    Geofence,
+    GeofenceCreate,
+    FanoutPolicy,
+    LocationBatchResponse,
+    Room,
+    RoomDetail
 )
 from app.services.room_service import room_service
 from app.core.room_manager import room_manager
-from typing import Optional
+from app.core.room_store import RoomStoreBusy
+from app.core.rate_limiter import rate_limit
+from app.core.spatial_index import spatial_index
+from app.core.geofences import geofence_manager
+from app.core.interest import interest_manager
+from app.core.room_aggregates import room_aggregates
+from app.core.location_batch import decompress_body, location_batches
+from app.core.config import settings
+from app.models.radar import decode_location_batch
+from typing import List, Optional
+import msgspec
+import zlib
 
 router = APIRouter(prefix="/rooms", tags=["rooms"])
 
 
-@router.post("/create", response_model=CreateRoomResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/create",
+    response_model=CreateRoomResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("room_create"))]
+)
 async def create_room():
     """
     Crea una nueva sala con un código único de 6 caracteres alfanuméricos.
     
-    El código se genera usando milisegundos del sistema como seed.
+    El código se genera con el generador aleatorio del sistema operativo.
     La sala permanecerá activa hasta 2 minutos después de quedar vacía.
     
     Returns:
@@ -27,6 +49,8 @@ async def create_room():
     try:
         response = room_service.create_room()
         return response
+    except RoomStoreBusy:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -88,7 +112,7 @@ async def leave_room(user_id: int = Query(..., description="ID del usuario que s
     return response
 
 
-@router.get("/{code}", response_model=Room)
+@router.get("/{code}", response_model=RoomDetail)
 async def get_room_info(code: str):
     """
     Obtiene información detallada de una sala.
@@ -97,7 +121,8 @@ async def get_room_info(code: str):
         code: Código de la sala
     
     Returns:
-        Room: Información completa de la sala incluyendo usuarios activos
+        RoomDetail: Información completa de la sala incluyendo usuarios activos
+        y los agregados de sus posiciones (centroide, bounding box, dispersión)
     """
     code = code.upper()
     room = room_service.get_room_info(code)
@@ -108,7 +133,278 @@ async def get_room_info(code: str):
             detail="La sala no existe o ha expirado"
         )
     
-    return room
+    return RoomDetail(**room.model_dump(), aggregates=room_aggregates.get(code))
+
+
+@router.get("/{code}/nearby", response_model=NearbyResponse)
+async def get_nearby_friends(
+    code: str,
+    lat: Optional[float] = Query(None, ge=-90, le=90, description="Latitud del punto de consulta"),
+    lon: Optional[float] = Query(None, ge=-180, le=180, description="Longitud del punto de consulta"),
+    username: Optional[str] = Query(None, description="Consultar desde la última ubicación de este usuario"),
+    radius: Optional[float] = Query(None, gt=0, description="Radio en metros"),
+    k: Optional[int] = Query(None, gt=0, description="Número de amigos más cercanos")
+):
+    """
+    Obtiene los amigos cercanos a un punto usando el índice espacial de la sala.
+    
+    El punto es (lat, lon) o la última ubicación de `username` (que se excluye
+    del resultado). Con `radius` devuelve todos los amigos dentro del radio;
+    con `k` los k más cercanos; con ambos, los k más cercanos dentro del radio.
+    
+    Returns:
+        NearbyResponse: Amigos ordenados del más cercano al más lejano
+    """
+    if radius is None and k is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Indica radius, k o ambos"
+        )
+    if radius is not None and radius > settings.nearby_max_radius_meters:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El radio máximo es {settings.nearby_max_radius_meters} metros"
+        )
+    if k is not None and k > settings.nearby_max_k:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El máximo de amigos es {settings.nearby_max_k}"
+        )
+    
+    code = code.upper()
+    if lat is None or lon is None:
+        position = spatial_index.position(code, username) if username else None
+        if position is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Indica lat y lon, o un username con ubicación conocida en la sala"
+            )
+        lat, lon = position
+    
+    friends = spatial_index.nearby(code, lat, lon, radius=radius, k=k, exclude=username)
+    return NearbyResponse(code=code, friends=friends)
+
+
+async def read_limited_body(request: Request, max_bytes: int) -> Optional[bytes]:
+    """
+    Lee el cuerpo sin pasar de max_bytes (None si lo supera). Se corta por
+    Content-Length antes de leer nada y, si no viene, al acumular el stream.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+        return None
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            return None
+    return bytes(body)
+
+
+@router.post(
+    "/{code}/locations/batch",
+    response_model=LocationBatchResponse,
+    dependencies=[Depends(rate_limit("location_batch"))]
+)
+async def upload_location_batch(code: str, request: Request):
+    """
+    Sube los puntos que el radar acumuló sin conexión.
+    
+    Cuerpo: `{"username": "ana", "points": [{"lat": ..., "lon": ..., "ts": ms}, ...]}`,
+    opcionalmente comprimido (`Content-Encoding: gzip` o `deflate`). Todos los
+    puntos van al historial con su hora original; solo el más reciente pasa a
+    ser la última ubicación del usuario y se reenvía a la sala. El usuario
+    tiene que ser miembro de la sala.
+    
+    Returns:
+        LocationBatchResponse: Puntos aceptados y descartados, y si se
+        actualizó la última ubicación
+    """
+    code = code.upper()
+    room = room_manager.get_room(code)
+    if room is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="La sala no existe o ha expirado"
+        )
+    
+    # El cuerpo comprimido tampoco puede pasar del límite del descomprimido
+    max_bytes = settings.location_batch_max_bytes
+    body = await read_limited_body(request, max_bytes)
+    if body is None:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"El lote supera {max_bytes} bytes"
+        )
+    try:
+        data = decompress_body(body, request.headers.get("content-encoding"), max_bytes)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+    except zlib.error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El cuerpo no se pudo descomprimir"
+        )
+    if data is None:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"El lote descomprimido supera {max_bytes} bytes"
+        )
+    
+    try:
+        batch = decode_location_batch(data)
+    except msgspec.DecodeError as e:
+        # Incluye ValidationError: coordenadas fuera de rango, campos faltantes...
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Lote inválido: {e}"
+        )
+    if len(batch.points) > settings.location_batch_max_points:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El máximo por lote es {settings.location_batch_max_points} puntos"
+        )
+    if not any(user.username == batch.username for user in room.users):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="El usuario no pertenece a la sala"
+        )
+    
+    location_batches.bytes_received += len(body)
+    location_batches.bytes_decoded += len(data)
+    result = location_batches.ingest(code, batch.username, batch.points)
+    return LocationBatchResponse(code=code, username=batch.username, **result)
+
+
+@router.post("/{code}/geofences", response_model=Geofence, status_code=status.HTTP_201_CREATED)
+async def create_geofence(code: str, request: GeofenceCreate):
+    """
+    Crea una geocerca circular en la sala (ej: punto de encuentro).
+    
+    El servidor avisa por el WebSocket a toda la sala cuando un miembro entra
+    (GEOFENCE_ENTER) o sale (GEOFENCE_EXIT) de la geocerca.
+    
+    Args:
+        code: Código de la sala
+        request: Nombre, centro (lat, lon) y radio en metros
+    
+    Returns:
+        Geofence: Geocerca creada con su id
+    """
+    code = code.upper()
+    if not room_manager.room_exists(code):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="La sala no existe o ha expirado"
+        )
+    if request.radius_m > settings.geofence_max_radius_meters:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El radio máximo es {settings.geofence_max_radius_meters} metros"
+        )
+    
+    try:
+        return geofence_manager.add_fence(code, request)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+@router.get("/{code}/geofences", response_model=List[Geofence])
+async def list_geofences(code: str):
+    """
+    Lista las geocercas de una sala.
+    
+    Returns:
+        List[Geofence]: Geocercas de la sala (vacía si no tiene)
+    """
+    return geofence_manager.list_fences(code.upper())
+
+
+@router.delete("/{code}/geofences/{fence_id}", response_model=dict)
+async def delete_geofence(code: str, fence_id: int):
+    """
+    Elimina una geocerca de la sala.
+    
+    Returns:
+        dict: Confirmación
+    """
+    if not geofence_manager.remove_fence(code.upper(), fence_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="La geocerca no existe"
+        )
+    return {"message": "Geocerca eliminada exitosamente"}
+
+
+@router.put("/{code}/fanout-policy", response_model=FanoutPolicy)
+async def set_fanout_policy(code: str, policy: FanoutPolicy):
+    """
+    Activa el reenvío por distancia en una sala grande.
+    
+    Cada actualización se envía al momento (FRIEND_MOVED) solo a los amigos a
+    menos de `radius_m` y/o a los `k` más cercanos; el resto de la sala recibe
+    las posiciones agrupadas cada `far_interval_seconds` (FRIENDS_MOVED).
+    
+    Returns:
+        FanoutPolicy: Política aplicada
+    """
+    code = code.upper()
+    if not room_manager.room_exists(code):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="La sala no existe o ha expirado"
+        )
+    if policy.radius_m is None and policy.k is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Indica radius_m, k o ambos"
+        )
+    if policy.radius_m is not None and policy.radius_m > settings.nearby_max_radius_meters:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El radio máximo es {settings.nearby_max_radius_meters} metros"
+        )
+    if policy.k is not None and policy.k > settings.nearby_max_k:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El máximo de amigos es {settings.nearby_max_k}"
+        )
+    
+    interest_manager.set_policy(code, policy)
+    return policy
+
+
+@router.get("/{code}/fanout-policy", response_model=FanoutPolicy)
+async def get_fanout_policy(code: str):
+    """
+    Obtiene la política de reenvío de la sala.
+    
+    Returns:
+        FanoutPolicy: Política activa (404 si la sala reenvía a todos)
+    """
+    policy = interest_manager.get_policy(code.upper())
+    if policy is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="La sala no tiene política de reenvío"
+        )
+    return policy
+
+
+@router.delete("/{code}/fanout-policy", response_model=dict)
+async def delete_fanout_policy(code: str):
+    """
+    Vuelve a reenviar cada actualización a toda la sala.
+    
+    Returns:
+        dict: Confirmación
+    """
+    if not interest_manager.clear_policy(code.upper()):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="La sala no tiene política de reenvío"
+        )
+    return {"message": "Política de reenvío eliminada exitosamente"}
 
 
 @router.get("/user/{user_id}/current", response_model=Optional[Room])
@@ -1,62 +1,393 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+import bisect
 import json
-from typing import Dict, List
+import logging
+import time
+import msgspec
+from typing import Optional
+from app.core.config import settings
+from app.core.connection_manager import connection_manager, DEFLATE_SUBPROTOCOL
+from app.core.interest import interest_manager
+from app.core.location_history import location_history
+from app.core.rate_hints import rate_hints
+from app.core.room_aggregates import room_aggregates
+from app.core.room_events import room_events
+from app.core.spatial_index import spatial_index
+from app.services.code_generator import code_generator
+from app.models.radar import (
+    NearbyQuery,
+    NearbyQueryData,
+    Subscribe,
+    Unsubscribe,
+    UpdateLocation,
+    decode_inbound,
+    decode_mux_inbound
+)
+from app.core.metrics import (
+    metrics,
+    ws_invalid_messages,
+    ws_messages_received,
+    ws_messages_forwarded,
+    ws_fanout_latency,
+    ws_connections_opened,
+    ws_disconnects,
+    disconnect_reason
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Diccionario para guardar las conexiones vivas: { "UPCH77": [websocket1, websocket2] }
-# (Si él ya tiene un RoomManager, puede mover este diccionario ahí)
-active_connections: Dict[str, List[WebSocket]] = {}
+@router.websocket("/ws/mux/{username}")
+async def radar_mux_websocket(websocket: WebSocket, username: str):
+    """
+    Un solo socket para varias salas (ej: familia y trabajo).
+    
+    Control: {"event": "SUBSCRIBE", "room": "UPCH77", "last_seq": N} y
+    {"event": "UNSUBSCRIBE", "room": "UPCH77"}. UPDATE_LOCATION y
+    NEARBY_QUERY llevan "room"; todo lo que envía el servidor por una sala
+    lleva "room". La cola, el escritor y la compresión son del socket.
+    """
+    compressed = wants_shared_compression(websocket)
+    offered = DEFLATE_SUBPROTOCOL in websocket.scope.get("subprotocols", ())
+    await websocket.accept(subprotocol=DEFLATE_SUBPROTOCOL if compressed and offered else None)
+    
+    if connection_manager.draining:
+        await connection_manager.reject(websocket)
+        return
+    
+    ws_connections_opened.inc()
+    socket = connection_manager.open_mux(websocket, username, compressed=compressed)
+    memberships = connection_manager.mux_sockets[socket]
+    logger.info(
+        "Radar multiplexado conectado: %s", username,
+        extra={"event": "ws.connect", "room": None}
+    )
+    
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            ws_messages_received.inc()
+            
+            try:
+                message = decode_mux_inbound(frame.get("text") or frame.get("bytes") or b"")
+            except msgspec.ValidationError as e:
+                reject_frame(socket, "invalid_message", e)
+                continue
+            except msgspec.DecodeError as e:
+                reject_frame(socket, "invalid_json", e)
+                continue
+            
+            # Los endpoints REST usan el código en mayúsculas: mismas claves
+            room = message.room.upper() if message.room is not None else None
+            
+            if type(message) is Subscribe:
+                if not code_generator.is_valid_code(room):
+                    reject_frame(socket, "invalid_room", f"Código de sala inválido: {room}")
+                    continue
+                if room not in memberships and len(memberships) >= settings.ws_mux_max_rooms:
+                    reject_frame(socket, "too_many_rooms", f"Máximo {settings.ws_mux_max_rooms} salas por socket")
+                    continue
+                if room in memberships:
+                    membership = memberships[room]
+                else:
+                    membership = connection_manager.subscribe(socket, room)
+                    logger.info(
+                        "Radar %s suscrito a sala %s", username, room,
+                        extra={"event": "ws.subscribe", "room": room}
+                    )
+                membership.send(json.dumps({"event": "SUBSCRIBED", "data": {"rooms": sorted(memberships)}}))
+                join_room(membership, message.last_seq)
+                continue
+            
+            membership = memberships.get(room) if room is not None else None
+            if membership is None:
+                reject_frame(socket, "not_subscribed", f"No hay suscripción a la sala {room}")
+                continue
+            
+            if type(message) is Unsubscribe:
+                leave_room(membership)
+                socket.send(json.dumps({
+                    "event": "UNSUBSCRIBED", "room": room, "data": {"rooms": sorted(memberships)}
+                }))
+            elif type(message) is UpdateLocation:
+                handle_location(membership, message)
+            elif type(message) is NearbyQuery:
+                handle_nearby(membership, message)
+    
+    except WebSocketDisconnect as e:
+        ws_disconnects.labels(disconnect_reason(e.code)).inc()
+        logger.info(
+            "Radar multiplexado desconectado: %s (código %s)", username, e.code,
+            extra={"event": "ws.disconnect", "room": None}
+        )
+    except Exception as e:
+        ws_disconnects.labels("error").inc()
+        logger.error(
+            "Error en el radar multiplexado de %s: %s", username, e,
+            extra={"event": "ws.error", "room": None}
+        )
+    finally:
+        # Se sale de cada sala suscrita, avisando en cada una
+        for membership in connection_manager.close_mux(socket):
+            leave_room(membership)
+        await socket.close()
+
 
 @router.websocket("/ws/{room_code}/{username}")
 async def radar_websocket(websocket: WebSocket, room_code: str, username: str):
-    # Aceptar la conexión del celular
-    await websocket.accept()
+    # Los endpoints REST usan el código en mayúsculas: mismas claves. Un código
+    # mal formado se rechaza antes de aceptar (el historial tiene largo fijo)
+    room_code = room_code.upper()
+    if not code_generator.is_valid_code(room_code):
+        ws_invalid_messages.labels("invalid_room").inc()
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    # Aceptar la conexión del celular (con frames comprimidos compartidos si los pide)
+    compressed = wants_shared_compression(websocket)
+    offered = DEFLATE_SUBPROTOCOL in websocket.scope.get("subprotocols", ())
+    await websocket.accept(subprotocol=DEFLATE_SUBPROTOCOL if compressed and offered else None)
     
-    # Crear la sala si no existe en las conexiones activas
-    if room_code not in active_connections:
-        active_connections[room_code] = []
+    # Durante el apagado no se aceptan radares nuevos: se les indica cuándo reconectar
+    if connection_manager.draining:
+        await connection_manager.reject(websocket)
+        return
     
-    active_connections[room_code].append(websocket)
+    ws_connections_opened.inc()
+    connection = connection_manager.add(websocket, room_code, username, compressed=compressed)
+    join_room(connection, parse_last_seq(websocket))
+    logger.info(
+        "Radar conectado: %s en sala %s", username, room_code,
+        extra={"event": "ws.connect", "room": room_code}
+    )
     
     try:
         # Bucle infinito escuchando lo que manda tu celular Android
         while True:
-            data = await websocket.receive_text()
-            payload = json.loads(data)
-            
-            # Si recibe tu ubicación...
-            if payload.get("event") == "UPDATE_LOCATION":
-                
-                # Prepara el JSON para reenviarlo (El contrato que tú esperas en Android)
-                response = {
-                    "event": "FRIEND_MOVED",
-                    "data": {
-                        "username": username,
-                        "lat": payload["data"].get("lat"),
-                        "lon": payload["data"].get("lon")
-                    }
-                }
-                
-                # Se lo manda a TODOS los que estén en la sala, EXCEPTO al que lo mandó
-                for connection in active_connections[room_code]:
-                    if connection != websocket:
-                        await connection.send_text(json.dumps(response))
-
-    except WebSocketDisconnect:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            ws_messages_received.inc()
+            
+            # Decodificar a un struct tipado; un frame inválido se rechaza con
+            # un ERROR sin cortar la conexión
+            try:
+                message = decode_inbound(frame.get("text") or frame.get("bytes") or b"")
+            except msgspec.ValidationError as e:
+                reject_frame(connection, "invalid_message", e)
+                continue
+            except msgspec.DecodeError as e:
+                reject_frame(connection, "invalid_json", e)
+                continue
+            
+            # Si recibe tu ubicación (coordenadas ya validadas)...
+            if type(message) is UpdateLocation:
+                handle_location(connection, message)
+            
+            # Amigos cercanos calculados en el servidor (solo se responde al que pregunta)
+            elif type(message) is NearbyQuery:
+                handle_nearby(connection, message)
+
+    except WebSocketDisconnect as e:
+        ws_disconnects.labels(disconnect_reason(e.code)).inc()
+        logger.info(
+            "Radar desconectado: %s de sala %s (código %s)", username, room_code, e.code,
+            extra={"event": "ws.disconnect", "room": room_code}
+        )
+    except Exception as e:
+        ws_disconnects.labels("error").inc()
+        logger.error(
+            "Error en el radar de %s en sala %s: %s", username, room_code, e,
+            extra={"event": "ws.error", "room": room_code}
+        )
+    finally:
         # Si el usuario cierra la app o pierde internet, lo sacamos de la sala
-        if websocket in active_connections.get(room_code, []):
-            active_connections[room_code].remove(websocket)
-        
-        # Si la sala quedó vacía, la borramos para no gastar memoria RAM
-        if not active_connections.get(room_code):
-            if room_code in active_connections:
-                del active_connections[room_code]
-        else:
-            # Si alguien sigue en la sala, le avisamos que su amigo se fue (Tu Rollback optimista)
-            disconnect_msg = {
-                "event": "FRIEND_DISCONNECTED",
-                "data": {"message": f"{username} se ha desconectado"}
-            }
-            for connection in active_connections[room_code]:
-                await connection.send_text(json.dumps(disconnect_msg))
\ No newline at end of file
+        # (si la sala quedó vacía se borra para no gastar memoria RAM)
+        leave_room(connection)
+        await connection.close()
+
+
+def join_room(connection, last_seq: Optional[int]):
+    """Lo que recibe un socket al entrar en una sala (directo o por SUBSCRIBE)"""
+    room_code = connection.room_code
+    # Intervalo de GPS recomendado vigente en la sala
+    if settings.rate_hint_enabled:
+        connection.send(rate_hints.hint_message(room_code))
+    # Reconexión: reenviar lo que se perdió (o el estado completo si el hueco es muy grande)
+    if last_seq is not None:
+        connection.send(
+            room_events.replay(room_code, last_seq)
+            or room_events.resync(room_code, room_state(room_code))
+        )
+
+
+def leave_room(connection):
+    """Saca un socket (o una suscripción) de su sala y avisa a los que quedan"""
+    room_code, username = connection.room_code, connection.username
+    if connection.multiplexed:
+        others_remain = connection_manager.unsubscribe(connection)
+    else:
+        others_remain = connection_manager.remove(connection)
+    spatial_index.remove(room_code, username)
+    room_aggregates.remove(room_code, username)
+    
+    # Si alguien sigue en la sala, le avisamos que su amigo se fue (Tu Rollback optimista)
+    # Durante el drain todos se van: no se avisa
+    if others_remain and not connection_manager.draining:
+        disconnect_msg = {
+            "event": "FRIEND_DISCONNECTED",
+            "data": {"message": f"{username} se ha desconectado"}
+        }
+        room_events.broadcast(room_code, disconnect_msg)
+
+
+def handle_location(connection, message: UpdateLocation):
+    """UPDATE_LOCATION: guardar la posición y reenviarla a la sala"""
+    room_code, username = connection.room_code, connection.username
+    lat, lon = message.data.lat, message.data.lon
+    
+    # Prepara el JSON para reenviarlo (El contrato que tú esperas en Android)
+    response = {
+        "event": "FRIEND_MOVED",
+        "data": {
+            "username": username,
+            "lat": lat,
+            "lon": lon
+        }
+    }
+    
+    # Formato diferido: si DEBUG está filtrado no se construye el mensaje
+    logger.debug(
+        "Ubicación de %s en sala %s", username, room_code,
+        extra={"event": "ws.location", "room": room_code}
+    )
+    
+    # Guardar en el historial (solo agrega a un buffer, no toca la BD)
+    # y en el índice espacial y los agregados de la sala (amigos
+    # cercanos, centroide y bounding box), todo en O(1)
+    location_history.record(room_code, username, lat, lon)
+    spatial_index.update(room_code, username, lat, lon)
+    room_aggregates.update(room_code, username, lat, lon)
+    
+    # Se lo manda a TODOS los que estén en la sala, EXCEPTO al que lo mandó
+    # (el JSON se serializa una sola vez y solo se encola en cada socket).
+    # Si la sala tiene política de reenvío, solo a los cercanos al momento:
+    # esos envíos no llevan secuencia (los cubre el FRIENDS_MOVED agrupado)
+    fanout_start = time.perf_counter()
+    if interest_manager.get_policy(room_code) is None:
+        outbound = room_events.record(room_code, response)
+    else:
+        outbound = json.dumps(response)
+    sent = interest_manager.fanout(room_code, username, lat, lon, outbound, exclude=connection)
+    fanout_seconds = time.perf_counter() - fanout_start
+    ws_messages_forwarded.inc(sent)
+    ws_fanout_latency.observe(fanout_seconds)
+    rate_hints.observe_fanout(room_code, fanout_seconds)
+
+
+def handle_nearby(connection, message: NearbyQuery):
+    """NEARBY_QUERY: amigos cercanos, solo para el que pregunta"""
+    connection.send(json.dumps({
+        "event": "NEARBY_RESULT",
+        "data": {"friends": nearby_query(connection.room_code, connection.username, message.data)}
+    }))
+
+
+def parse_last_seq(websocket: WebSocket) -> Optional[int]:
+    """Último número de secuencia recibido antes de reconectar (?last_seq=N)"""
+    value = websocket.query_params.get("last_seq")
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def room_state(room_code: str) -> dict:
+    """Estado completo de la sala para un RESYNC"""
+    index = spatial_index.get(room_code)
+    positions = index.positions if index is not None else {}
+    return {
+        "connected": sorted(connection_manager.users.get(room_code, {})),
+        "friends": [
+            {"username": username, "lat": position[0], "lon": position[1]}
+            for username, position in positions.items()
+        ],
+        "aggregates": room_aggregates.get(room_code)
+    }
+
+
+def wants_shared_compression(websocket: WebSocket) -> bool:
+    """
+    El radar pide frames comprimidos con el subprotocolo radar.deflate o,
+    si su cliente no permite subprotocolos, con ?compression=deflate.
+    """
+    if not settings.ws_shared_compression_enabled:
+        return False
+    return (
+        DEFLATE_SUBPROTOCOL in websocket.scope.get("subprotocols", ())
+        or websocket.query_params.get("compression") == "deflate"
+    )
+
+
+def reject_frame(connection, reason: str, error):
+    """Cuenta el frame inválido y responde ERROR solo al que lo envió"""
+    ws_invalid_messages.labels(reason).inc()
+    connection.send(json.dumps({
+        "event": "ERROR",
+        "data": {"code": reason, "message": "Mensaje rechazado", "detail": str(error)}
+    }))
+
+
+def nearby_query(room_code: str, username: str, query: NearbyQueryData) -> list:
+    """
+    Resuelve un NEARBY_QUERY: {"radius": metros, "k": n, "lat": ..., "lon": ...}
+    Sin lat/lon se usa la última ubicación del que pregunta; sin radius ni k,
+    los 10 más cercanos. Los límites son los mismos que en REST.
+    """
+    radius = query.radius
+    k = query.k
+    if radius is None and k is None:
+        k = 10
+    if radius is not None:
+        radius = min(radius, settings.nearby_max_radius_meters)
+    if k is not None:
+        k = min(k, settings.nearby_max_k)
+    
+    lat, lon = query.lat, query.lon
+    if lat is None or lon is None:
+        position = spatial_index.position(room_code, username)
+        if position is None:
+            return []
+        lat, lon = position
+    return spatial_index.nearby(room_code, lat, lon, radius=radius, k=k, exclude=username)
+
+
+# Límites para la distribución de tamaño de sala
+ROOM_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+def collect_socket_metrics():
+    """Sockets activos y distribución de tamaño de sala, calculados al hacer scrape"""
+    sizes = [len(connections) for connections in connection_manager.rooms.values()]
+    counts = [0] * (len(ROOM_SIZE_BUCKETS) + 1)
+    for size in sizes:
+        counts[bisect.bisect_left(ROOM_SIZE_BUCKETS, size)] += 1
+
+    bucket_samples = []
+    cumulative = 0
+    for bound, count in zip(ROOM_SIZE_BUCKETS + ("+Inf",), counts):
+        cumulative += count
+        bucket_samples.append(("radar_rooms_by_size", {"le": str(bound)}, cumulative))
+
+    yield ("radar_active_sockets", "gauge", "Sockets del radar abiertos",
+           [("radar_active_sockets", {}, len(connection_manager.sockets()))])
+    yield ("radar_active_rooms", "gauge", "Salas con al menos un socket abierto",
+           [("radar_active_rooms", {}, len(sizes))])
+    yield ("radar_rooms_by_size", "gauge", "Salas con tamaño menor o igual a le (acumulado)",
+           bucket_samples)
+
+
+metrics.register_collector(collect_socket_metrics)
\ No newline at end of file
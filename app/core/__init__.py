@@ -5,5 +5,6 @@ Componentes centrales de la aplicación.
 
 from app.core.config import settings
 from app.core.room_manager import room_manager
+from app.core.rate_limiter import rate_limiter
 
-__all__ = ["settings", "room_manager"]
\ No newline at end of file
+__all__ = ["settings", "room_manager", "rate_limiter"]
\ No newline at end of file
@@ -10,6 +10,15 @@ class Settings(BaseSettings):
     database_url: Optional[str] = None
     db_password: Optional[str] = None
     db_root_password: Optional[str] = None
+    db_pool_size: int = 10  # Número de conexiones en el pool
+    db_max_overflow: int = 20  # Conexiones adicionales permitidas
+    db_pool_timeout_seconds: float = 30  # Espera máxima por una conexión libre
+    db_pool_recycle_seconds: int = 3600  # Reciclar conexiones cada hora (importante para MySQL)
+    db_pool_pre_ping: bool = True  # Verificar conexión antes de usar
+    # Creación del esquema al arrancar: "startup" (create_all antes de aceptar
+    # peticiones), "deferred" (create_all en background tras arrancar) o
+    # "skip" (el esquema lo gestiona init_mysql.sql / migraciones)
+    db_schema_mode: str = "startup"
     
     # Configuración de CORS (como string, lo parseamos después)
     allowed_origins: str = "*"
@@ -18,12 +27,140 @@ class Settings(BaseSettings):
     room_code_length: int = 6
     room_cleanup_interval_seconds: int = 60
     room_empty_timeout_seconds: int = 120
+    # Dónde viven las salas: "memory" (dict del proceso) o "sqlite" (archivo
+    # en modo WAL compartido por todos los workers de la máquina)
+    room_store_backend: str = "memory"
+    room_store_sqlite_path: str = "rooms.db"
+    room_store_sqlite_busy_timeout_seconds: float = 0.1  # Espera por el lock de escritura de otro worker (bloquea el loop)
+    room_store_cache_ttl_seconds: float = 1.0  # Caché de lecturas sobre sqlite (0 = sin caché)
+    room_store_cache_max_entries: int = 100000
+    
+    # Configuración del WebSocket del radar
+    ws_send_queue_size: int = 256  # Mensajes pendientes por socket antes de descartar los viejos
+    ws_per_message_deflate: bool = True  # permessage-deflate de uvicorn (comprime por socket)
+    ws_shared_compression_enabled: bool = True  # Aceptar el subprotocolo radar.deflate (comprime una vez por broadcast)
+    ws_shared_compression_level: int = 6  # Nivel de zlib (1 = más rápido, 9 = más pequeño)
+    ws_shared_compression_min_bytes: int = 128  # Mensajes más cortos se envían como texto
+    ws_mux_max_rooms: int = 10  # Salas por socket multiplexado (/ws/mux/{username})
+    
+    # Configuración del índice espacial por sala (amigos cercanos)
+    spatial_index_enabled: bool = True
+    spatial_cell_meters: float = 250  # Lado de cada celda de la rejilla
+    nearby_max_radius_meters: float = 50000
+    nearby_max_k: int = 100
+    
+    # Configuración del reenvío por distancia (salas con política de fan-out)
+    interest_tick_seconds: float = 1.0  # Cada cuánto se revisan los envíos agrupados pendientes
+    
+    # Configuración de los agregados por sala (centroide, bounding box, dispersión)
+    room_aggregates_enabled: bool = True
+    room_aggregates_interval_seconds: float = 5.0  # Cada cuánto se envía ROOM_AGGREGATES (solo si cambió)
+    room_aggregates_rebuild_updates: int = 10000  # Recalcular las sumas cada N actualizaciones (redondeo)
+    room_aggregates_chunk_size: int = 250  # Salas por bloque del envío antes de ceder el event loop
+    
+    # Configuración del intervalo de GPS recomendado por sala (RATE_HINT)
+    rate_hint_enabled: bool = True
+    rate_hint_tick_seconds: float = 2.0
+    rate_hint_chunk_size: int = 250  # Salas por bloque antes de ceder el event loop
+    rate_hint_min_interval_ms: int = 1000  # Intervalo sin carga
+    rate_hint_max_interval_ms: int = 30000
+    rate_hint_step_ms: int = 250  # Redondeo del intervalo (evita cambios mínimos)
+    rate_hint_room_size_target: int = 50  # Miembros a partir de los que se alarga el intervalo
+    rate_hint_fanout_p95_target_ms: float = 5.0  # p95 de reenvío por sala aceptable
+    rate_hint_loop_lag_target_ms: float = 50.0  # Lag del event loop aceptable
+    rate_hint_hysteresis: float = 0.25  # Cambio relativo mínimo para enviar un RATE_HINT nuevo
+    rate_hint_relax_seconds: float = 30.0  # Tiempo mínimo entre cambios antes de acortar el intervalo
+    
+    # Configuración del registro de eventos por sala (reanudar con ?last_seq=)
+    room_event_buffer_size: int = 512  # Eventos recientes por sala que se pueden reenviar
+    room_event_retention_seconds: float = 120  # Conservar el registro de salas sin sockets
+    
+    # Configuración de geocercas por sala (usa las posiciones del índice espacial)
+    geofence_enabled: bool = True
+    geofence_tick_interval_seconds: float = 1.0
+    geofence_max_per_room: int = 5000
+    geofence_max_radius_meters: float = 50000
+    geofence_chunk_pairs: int = 1_000_000  # Pares candidatos por bloque de NumPy (acota memoria)
+    geofence_tick_chunk_size: int = 25  # Salas por bloque del tick antes de ceder el event loop
+    
+    # Configuración del apagado ordenado (drain)
+    shutdown_drain_on_sigterm: bool = True
+    shutdown_drain_timeout_seconds: float = 10  # Plazo total para avisar, vaciar colas y cerrar
+    shutdown_reconnect_min_ms: int = 1000  # Rango del retraso aleatorio de reconexión
+    shutdown_reconnect_max_ms: int = 15000
+    room_state_file: Optional[str] = None  # JSON para pasar las salas al siguiente proceso
+    
+    # Configuración del historial de ubicaciones (write-behind)
+    location_history_enabled: bool = False
+    location_history_batch_size: int = 500
+    location_history_flush_interval_seconds: float = 5
+    location_history_max_buffered_points: int = 50000
+    location_history_max_flush_attempts: int = 3  # Intentos por lote antes de descartarlo
+    
+    # Configuración de la subida de puntos acumulados sin conexión
+    location_batch_max_points: int = 5000
+    location_batch_max_bytes: int = 1048576  # Cuerpo recibido y ya descomprimido
+    location_batch_max_age_seconds: int = 86400  # Puntos más antiguos se descartan
+    location_batch_max_clock_skew_seconds: int = 300  # Tolerancia para puntos "del futuro"
+    
+    # Configuración de la compactación del historial
+    track_compaction_enabled: bool = False
+    track_compaction_interval_seconds: int = 300
+    track_compaction_age_seconds: int = 3600  # Solo se compactan puntos más antiguos
+    track_compaction_batch_size: int = 5000
+    track_compaction_max_batches_per_run: int = 20
+    track_simplify_tolerance_meters: float = 5.0
+    track_segment_gap_seconds: int = 300  # Un hueco mayor empieza un tramo nuevo
+    
+    # Configuración de logging
+    log_level: str = "INFO"
+    log_format: str = "text"  # "text" o "json"
+    log_queue_enabled: bool = True  # Escribir los logs desde un hilo en background
+    # Muestreo de eventos frecuentes: "evento=fracción" separados por coma
+    log_sample_rates: str = "room.join=0.1,room.leave=0.1,ws.location=0.01"
+    
+    # Configuración de métricas (/metrics)
+    metrics_enabled: bool = True
+    metrics_loop_lag_interval_seconds: float = 0.5
+    
+    # Configuración de administración (endpoints /debug y /admin)
+    admin_token: Optional[str] = None  # Sin token, los endpoints quedan desactivados
+    admin_rooms_page_size: int = 500  # Salas por página en GET /admin/rooms (por defecto)
+    admin_rooms_max_page_size: int = 10000
+    admin_rooms_chunk_size: int = 250  # Salas leídas entre cesiones del event loop
+    memory_report_top_n: int = 20  # Salas y sockets más pesados en GET /admin/memory
+    memory_report_slice_ms: float = 5.0  # Tiempo máximo recorriendo salas antes de ceder el event loop
+    memory_tracemalloc_frames: int = 10  # Profundidad de las pilas guardadas por tracemalloc
+    
+    # Configuración del profiler bajo demanda
+    profiler_sample_interval_ms: float = 5
+    profiler_block_threshold_ms: float = 100
+    profiler_slow_step_ms: float = 20
+    profiler_top_slow_steps: int = 20
+    profiler_max_seconds: int = 60
+    profiler_signal: str = "SIGUSR1"
+    profiler_signal_seconds: int = 10
+    profiler_output_dir: str = "logs"
     
     # Configuración de JWT
     secret_key: str = "your-secret-key-change-this-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     
+    # Configuración de rate limiting (token bucket en memoria)
+    rate_limit_enabled: bool = True
+    rate_limit_trust_proxy_headers: bool = False  # Activar detrás de nginx (X-Real-IP)
+    rate_limit_eviction_interval_seconds: int = 60
+    rate_limit_eviction_chunk_size: int = 5000  # Cubetas revisadas antes de ceder el event loop
+    rate_limit_login_per_minute: float = 10
+    rate_limit_login_burst: int = 5
+    rate_limit_register_per_minute: float = 5
+    rate_limit_register_burst: int = 3
+    rate_limit_room_create_per_minute: float = 10
+    rate_limit_room_create_burst: int = 5
+    rate_limit_location_batch_per_minute: float = 30
+    rate_limit_location_batch_burst: int = 10
+    
     class Config:
         env_file = ".env"
         extra = "allow"
@@ -33,6 +170,15 @@ class Settings(BaseSettings):
         if self.allowed_origins == "*":
             return ["*"]
         return [origin.strip() for origin in self.allowed_origins.split(",")]
+    
+    def get_log_sample_rates(self):
+        """Convierte la string de muestreo de logs a diccionario {evento: fracción}"""
+        rates = {}
+        for item in self.log_sample_rates.split(","):
+            if "=" in item:
+                event, rate = item.split("=", 1)
+                rates[event.strip()] = float(rate)
+        return rates
 
 
 settings = Settings()
@@ -0,0 +1,441 @@
+"""
+Gestor de los sockets del radar.
+
+Cada socket tiene una cola de salida y una tarea escritora propias: reenviar
+una ubicación a la sala solo encola el mensaje, así que un teléfono lento no
+frena al resto. Si la cola se llena se descartan los mensajes más viejos.
+
+Compresión. Además del permessage-deflate de uvicorn (que comprime por
+socket, con su propio contexto: un broadcast a N sockets se comprime N
+veces), el radar puede negociar el subprotocolo `radar.deflate` (o
+`?compression=deflate`). En esos sockets los mensajes se envían como frames
+binarios con el JSON en DEFLATE crudo sin contexto compartido, así que el
+mismo frame sirve para todos: cada broadcast se comprime una sola vez.
+
+Multiplexado. Un socket de /ws/mux/{username} puede estar suscrito a varias
+salas: la cola, la tarea escritora y la compresión son del socket y cada
+sala solo guarda una MuxMembership (room_code + username) que apunta a él.
+Los mensajes que le llegan por una sala van etiquetados con `"room"`; en un
+broadcast la etiqueta (y la compresión) se aplica una sola vez.
+
+Al apagar el servidor (SIGTERM) se hace un drain: no se aceptan sockets
+nuevos, cada teléfono recibe SERVER_DRAINING con un retraso de reconexión
+aleatorio (para que no reconecten todos a la vez contra el siguiente worker),
+se vacían las colas y se cierran los sockets, todo dentro de
+`shutdown_drain_timeout_seconds`.
+"""
+
+from typing import Dict, Iterable, List, Optional
+from fastapi import WebSocket
+from app.core.config import settings
+from app.core.metrics import ws_send_dropped
+import asyncio
+import json
+import logging
+import random
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Código de cierre "Service Restart" (RFC 6455)
+CLOSE_SERVICE_RESTART = 1012
+
+# Subprotocolo del radar con frames comprimidos una vez y compartidos
+DEFLATE_SUBPROTOCOL = "radar.deflate"
+
+
+def tag_room(message: str, room_code: str) -> str:
+    """Añade "room" a un mensaje ya serializado (un objeto JSON) sin volver a codificarlo"""
+    return '{"room": ' + json.dumps(room_code) + ", " + message[1:]
+
+
+def deflate_frame(message: str) -> Optional[bytes]:
+    """
+    Comprime un mensaje en DEFLATE crudo (sin cabecera zlib ni contexto previo).
+
+    Returns:
+        Optional[bytes]: El frame comprimido, o None si el mensaje es tan
+        corto que no vale la pena (se envía como texto)
+    """
+    if len(message) < settings.ws_shared_compression_min_bytes:
+        return None
+    data = message.encode()
+    compressor = zlib.compressobj(settings.ws_shared_compression_level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+class RadarConnection:
+    """Socket del radar con su cola de salida"""
+
+    multiplexed = False
+
+    __slots__ = ("websocket", "room_code", "username", "compressed", "queue", "closed", "_writer")
+
+    def __init__(self, websocket: WebSocket, room_code: str, username: str, compressed: bool = False):
+        self.websocket = websocket
+        self.room_code = room_code
+        self.username = username
+        self.compressed = compressed  # Negoció radar.deflate
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.ws_send_queue_size)
+        self.closed = False
+        self._writer: Optional[asyncio.Task] = None
+
+    @property
+    def socket(self) -> "RadarConnection":
+        """El socket que tiene la cola (él mismo; en MuxMembership, el compartido)"""
+        return self
+
+    def start(self):
+        """Inicia la tarea escritora"""
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, message: str, frame: Optional[bytes] = None) -> bool:
+        """
+        Encola un mensaje sin bloquear.
+
+        Args:
+            message: JSON ya serializado
+            frame: El mismo mensaje ya comprimido (broadcast); si el socket
+                está comprimido y no se pasa, se comprime aquí
+
+        Returns:
+            bool: False si el socket está cerrado
+        """
+        if self.closed:
+            return False
+        if self.compressed:
+            if frame is None:
+                frame = deflate_frame(message)
+            if frame is not None:
+                message = frame
+        if self.queue.full():
+            # Cliente lento: la ubicación más vieja ya no sirve
+            self.queue.get_nowait()
+            self.queue.task_done()
+            ws_send_dropped.inc()
+        self.queue.put_nowait(message)
+        return True
+
+    async def _write_loop(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                if isinstance(message, bytes):
+                    await self.websocket.send_bytes(message)
+                else:
+                    await self.websocket.send_text(message)
+            except Exception:
+                # El socket se cerró: lo pendiente ya no se puede entregar
+                self.closed = True
+                self.queue.task_done()
+                self._discard_pending()
+                return
+            self.queue.task_done()
+
+    def _discard_pending(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.queue.task_done()
+
+    async def flush(self):
+        """Espera a que la cola de salida quede vacía"""
+        await self.queue.join()
+
+    async def close(self, code: int = 1000):
+        """Detiene la tarea escritora y cierra el socket"""
+        self.closed = True
+        if self._writer is not None and not self._writer.done():
+            self._writer.cancel()
+        self._discard_pending()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass  # Ya estaba cerrado
+
+
+class MuxMembership:
+    """Suscripción de un socket multiplexado a una sala (comparte su cola y escritor)"""
+
+    __slots__ = ("socket", "room_code", "username")
+
+    multiplexed = True
+
+    def __init__(self, socket: RadarConnection, room_code: str):
+        self.socket = socket
+        self.room_code = room_code
+        self.username = socket.username
+
+    @property
+    def compressed(self) -> bool:
+        return self.socket.compressed
+
+    @property
+    def closed(self) -> bool:
+        return self.socket.closed
+
+    def send(self, message: str, frame: Optional[bytes] = None) -> bool:
+        """Encola un mensaje de la sala etiquetado con "room" (el frame sin etiqueta no sirve)"""
+        return self.socket.send(tag_room(message, self.room_code))
+
+    async def flush(self):
+        await self.socket.flush()
+
+
+class ConnectionManager:
+    """Sockets del radar agrupados por sala: { "UPCH77": [conexión1, conexión2] }"""
+
+    def __init__(self):
+        self.rooms: Dict[str, List[RadarConnection]] = {}
+        # Sockets por sala y username (envíos dirigidos): { "UPCH77": { "ana": [conexión] } }
+        self.users: Dict[str, Dict[str, List[RadarConnection]]] = {}
+        # Sockets multiplexados abiertos (con o sin salas suscritas)
+        self.mux_sockets: Dict[RadarConnection, Dict[str, MuxMembership]] = {}
+        self.draining = False
+        self._drain_task: Optional[asyncio.Task] = None
+        # Frames comprimidos una vez y compartidos (radar.deflate)
+        self.shared_frames = 0
+        self.shared_frame_recipients = 0
+        self.shared_bytes_saved = 0
+
+    def add(self, websocket: WebSocket, room_code: str, username: str, compressed: bool = False) -> RadarConnection:
+        """Registra un socket ya aceptado e inicia su escritor"""
+        connection = RadarConnection(websocket, room_code, username, compressed)
+        connection.start()
+        self.rooms.setdefault(room_code, []).append(connection)
+        self.users.setdefault(room_code, {}).setdefault(username, []).append(connection)
+        return connection
+
+    def open_mux(self, websocket: WebSocket, username: str, compressed: bool = False) -> RadarConnection:
+        """Registra un socket multiplexado (aún sin salas) e inicia su escritor"""
+        socket = RadarConnection(websocket, None, username, compressed)
+        socket.start()
+        self.mux_sockets[socket] = {}
+        return socket
+
+    def subscribe(self, socket: RadarConnection, room_code: str) -> MuxMembership:
+        """Suscribe un socket multiplexado a una sala (si ya lo estaba, devuelve la suscripción)"""
+        memberships = self.mux_sockets[socket]
+        membership = memberships.get(room_code)
+        if membership is None:
+            membership = memberships[room_code] = MuxMembership(socket, room_code)
+            self.rooms.setdefault(room_code, []).append(membership)
+            self.users.setdefault(room_code, {}).setdefault(socket.username, []).append(membership)
+        return membership
+
+    def unsubscribe(self, membership: MuxMembership) -> bool:
+        """
+        Quita la suscripción a una sala.
+
+        Returns:
+            bool: True si quedan otros sockets en la sala
+        """
+        self.mux_sockets.get(membership.socket, {}).pop(membership.room_code, None)
+        return self.remove(membership)
+
+    def close_mux(self, socket: RadarConnection) -> List[MuxMembership]:
+        """
+        Olvida un socket multiplexado.
+
+        Returns:
+            List[MuxMembership]: Las suscripciones que tenía; siguen en sus
+            salas hasta que el llamador las quita con unsubscribe (para avisar
+            en cada sala)
+        """
+        return list(self.mux_sockets.pop(socket, {}).values())
+
+    def remove(self, connection: RadarConnection) -> bool:
+        """
+        Quita un socket de su sala (borra la sala si queda vacía).
+
+        Returns:
+            bool: True si quedan otros sockets en la sala
+        """
+        room_users = self.users.get(connection.room_code, {})
+        user_connections = room_users.get(connection.username)
+        if user_connections is not None and connection in user_connections:
+            user_connections.remove(connection)
+            if not user_connections:
+                del room_users[connection.username]
+        
+        connections = self.rooms.get(connection.room_code)
+        if connections is None:
+            return False
+        if connection in connections:
+            connections.remove(connection)
+        if not connections:
+            del self.rooms[connection.room_code]
+            self.users.pop(connection.room_code, None)
+            return False
+        return True
+
+    def broadcast(self, room_code: str, message: str, exclude: Optional[RadarConnection] = None) -> int:
+        """
+        Encola un mensaje ya serializado para todos los sockets de la sala.
+
+        Returns:
+            int: Número de sockets a los que se encoló
+        """
+        return self._send_all(self.rooms.get(room_code, ()), message, exclude)
+
+    def send_to_users(self, room_code: str, usernames, message: str) -> int:
+        """
+        Encola un mensaje solo para los sockets de ciertos usuarios de la sala.
+
+        Returns:
+            int: Número de sockets a los que se encoló
+        """
+        room_users = self.users.get(room_code)
+        if not room_users:
+            return 0
+        return self._send_all(
+            (connection for username in usernames for connection in room_users.get(username, ())), message
+        )
+
+    def _send_all(self, connections: Iterable, message: str, exclude=None) -> int:
+        """
+        Encola el mensaje. La etiqueta "room" de los sockets multiplexados y
+        la compresión de radar.deflate se calculan una sola vez por broadcast,
+        al encontrar el primer socket que las necesita.
+        """
+        # (mensaje, frame comprimido) sin etiqueta y con etiqueta
+        variants = [[message, None], [None, None]]
+        sent = 0
+        for connection in connections:
+            if connection is exclude:
+                continue
+            variant = variants[connection.multiplexed]
+            if variant[0] is None:
+                variant[0] = tag_room(message, connection.room_code)
+            if connection.compressed and variant[1] is None:
+                variant[1] = deflate_frame(variant[0])
+                if variant[1] is not None:
+                    self.shared_frames += 1
+            if connection.socket.send(variant[0], variant[1]):
+                sent += 1
+                if connection.compressed and variant[1] is not None:
+                    self.shared_frame_recipients += 1
+                    self.shared_bytes_saved += len(variant[0]) - len(variant[1])
+        return sent
+
+    @staticmethod
+    def reconnect_delay_ms() -> int:
+        """Retraso de reconexión aleatorio (reparte las reconexiones en el tiempo)"""
+        return random.randint(settings.shutdown_reconnect_min_ms, settings.shutdown_reconnect_max_ms)
+
+    def draining_message(self) -> str:
+        return json.dumps({
+            "event": "SERVER_DRAINING",
+            "data": {
+                "message": "El servidor se está reiniciando",
+                "reconnect_after_ms": self.reconnect_delay_ms()
+            }
+        })
+
+    async def reject(self, websocket: WebSocket):
+        """Rechaza un socket nuevo durante el drain (ya aceptado) con la pista de reconexión"""
+        try:
+            await websocket.send_text(self.draining_message())
+            await websocket.close(code=CLOSE_SERVICE_RESTART)
+        except Exception:
+            pass
+
+    def sockets(self) -> List[RadarConnection]:
+        """Sockets abiertos sin repetir (un socket multiplexado cuenta una vez)"""
+        sockets = {c.socket: None for room in self.rooms.values() for c in room}
+        sockets.update(dict.fromkeys(self.mux_sockets))
+        return list(sockets)
+
+    async def drain(self, timeout: Optional[float] = None) -> dict:
+        """
+        Avisa a todos los sockets, vacía sus colas y los cierra.
+
+        Args:
+            timeout: Plazo máximo (default: shutdown_drain_timeout_seconds)
+
+        Returns:
+            dict: Sockets avisados, si se cumplió el plazo y duración
+        """
+        if timeout is None:
+            timeout = settings.shutdown_drain_timeout_seconds
+        self.draining = True
+        start = time.perf_counter()
+        connections = self.sockets()
+        logger.info("Drain iniciado: %d sockets", len(connections))
+
+        for connection in connections:
+            connection.send(self.draining_message())
+
+        # Reservar parte del plazo para los cierres
+        timed_out = False
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(c.flush() for c in connections)), timeout=timeout * 0.8
+            )
+        except asyncio.TimeoutError:
+            timed_out = True
+
+        remaining = max(0.1, timeout - (time.perf_counter() - start))
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(c.close(CLOSE_SERVICE_RESTART) for c in connections)), timeout=remaining
+            )
+        except asyncio.TimeoutError:
+            timed_out = True
+
+        duration = time.perf_counter() - start
+        logger.info("Drain terminado en %.2fs (plazo agotado: %s)", duration, timed_out)
+        return {"sockets": len(connections), "timed_out": timed_out, "duration_s": round(duration, 3)}
+
+    async def _drain_then_exit(self):
+        try:
+            await self.drain()
+        finally:
+            # Seguir con el apagado normal de uvicorn (SIGINT) y el lifespan
+            import signal
+            signal.raise_signal(signal.SIGINT)
+
+    def handle_sigterm(self):
+        """Primer SIGTERM: drain y luego apagado; un segundo SIGTERM no espera"""
+        if self._drain_task is None:
+            self._drain_task = asyncio.get_running_loop().create_task(self._drain_then_exit())
+        else:
+            import signal
+            signal.raise_signal(signal.SIGINT)
+
+    def install_signal_handler(self):
+        """
+        Sustituye el handler de SIGTERM de uvicorn. uvicorn corta todos los
+        sockets (1012) antes del shutdown del lifespan, así que el drain tiene
+        que ocurrir antes de entregarle el control.
+        """
+        if not settings.shutdown_drain_on_sigterm:
+            return
+        import signal
+
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.handle_sigterm)
+            logger.info("Drain de WebSockets activado con SIGTERM")
+        except (NotImplementedError, RuntimeError, ValueError) as e:
+            # Windows o loop fuera del hilo principal
+            logger.warning(f"No se pudo registrar SIGTERM para el drain: {e}")
+
+    def get_stats(self) -> dict:
+        """Obtiene estadísticas de los sockets"""
+        connections = self.sockets()
+        return {
+            "active_sockets": len(connections),
+            "mux_sockets": len(self.mux_sockets),
+            "mux_subscriptions": sum(len(memberships) for memberships in self.mux_sockets.values()),
+            "active_rooms": len(self.rooms),
+            "pending_messages": sum(c.queue.qsize() for c in connections),
+            "compressed_sockets": sum(1 for c in connections if c.compressed),
+            "shared_frames": self.shared_frames,
+            "shared_frame_recipients": self.shared_frame_recipients,
+            "shared_bytes_saved": self.shared_bytes_saved,
+            "draining": self.draining
+        }
+
+
+# Instancia global del gestor de sockets
+connection_manager = ConnectionManager()
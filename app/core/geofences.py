@@ -0,0 +1,328 @@
+"""
+Geocercas por sala evaluadas en el servidor.
+
+Cada tick se evalúan de una vez, con NumPy, todas las geocercas de una sala
+contra las últimas posiciones de todos sus miembros (las del índice
+espacial). El resultado es el conjunto de pares (miembro, geocerca) que están
+dentro; la diferencia con el del tick anterior genera GEOFENCE_ENTER /
+GEOFENCE_EXIT, que se envían a toda la sala por el socket del radar (con
+número de secuencia, ver app/core/room_events.py).
+
+Las salas cuyas posiciones y geocercas no cambiaron desde el último tick no
+se vuelven a evaluar. El tick recorre las salas por bloques (una consulta al
+store por bloque para descartar las que expiraron) y cede el event loop entre
+bloques.
+
+NumPy se importa al crear la primera geocerca y no al arrancar: la mayoría de
+workers nunca evalúa una.
+"""
+
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from datetime import datetime
+from app.core.config import settings
+from app.core.room_events import room_events
+from app.core.room_manager import room_manager
+from app.core.spatial_index import GridIndex, spatial_index
+from app.models.room import Geofence, GeofenceCreate
+import asyncio
+import logging
+import time
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# (evento, geocerca, username)
+GeofenceEvent = Tuple[str, Geofence, str]
+
+
+class RoomGeofences:
+    """Geocercas de una sala y los pares (miembro, geocerca) que estaban dentro en el último tick"""
+
+    def __init__(self):
+        import numpy as np
+
+        self.fences: Dict[int, Geofence] = {}
+        # Ids estables por miembro para codificar cada par como un entero:
+        # (id del miembro << 32) | id de la geocerca
+        self.member_ids: Dict[str, int] = {}
+        self.member_names: Dict[int, str] = {}
+        self._next_member_id = 0
+        self.inside_keys = np.empty(0, dtype=np.int64)  # Ordenado
+        # Índice evaluado y (su versión, versión de las geocercas) en ese momento
+        self.index: Optional[GridIndex] = None
+        self.evaluated: Optional[Tuple[int, int]] = None
+        self.version = 0
+        # Arrays de las geocercas; se reconstruyen solo cuando cambian
+        self._fence_arrays: Optional[tuple] = None
+        self._fence_arrays_key: Optional[Tuple[int, float]] = None
+
+    def reset(self):
+        """
+        Olvida quién estaba dentro: el índice de la sala desapareció (se fue
+        el último miembro) y uno nuevo empieza otra vez en la versión 0
+        """
+        import numpy as np
+
+        self.inside_keys = np.empty(0, dtype=np.int64)
+        self.index = None
+        self.evaluated = None
+
+    def _fence_arrays_for(self, index: GridIndex) -> tuple:
+        """Centros proyectados con la misma proyección que el índice, radios e ids"""
+        import numpy as np
+
+        key = (self.version, index.kx)
+        if self._fence_arrays_key != key:
+            fences = list(self.fences.values())
+            count = len(fences)
+            self._fence_arrays = (
+                np.fromiter((fence.lon * index.kx for fence in fences), dtype=np.float64, count=count),
+                np.fromiter((fence.lat * index.ky for fence in fences), dtype=np.float64, count=count),
+                np.fromiter((fence.radius_m for fence in fences), dtype=np.float64, count=count),
+                np.fromiter((fence.id for fence in fences), dtype=np.int64, count=count),
+            )
+            self._fence_arrays_key = key
+        return self._fence_arrays
+
+    def _ids_for(self, members: List[str]) -> "np.ndarray":
+        """Ids de los miembros actuales; olvida los de miembros que ya no están"""
+        import numpy as np
+
+        member_ids = self.member_ids
+        for username in members:
+            if username not in member_ids:
+                member_ids[username] = self._next_member_id
+                self.member_names[self._next_member_id] = username
+                self._next_member_id += 1
+        if len(member_ids) > 2 * len(members) + 64:
+            current = set(members)
+            for username in [u for u in member_ids if u not in current]:
+                del self.member_names[member_ids.pop(username)]
+        return np.fromiter((member_ids[u] for u in members), dtype=np.int64, count=len(members))
+
+    def _inside_keys(self, xs: "np.ndarray", ys: "np.ndarray", ids: "np.ndarray", index: GridIndex) -> "np.ndarray":
+        """
+        Pares (miembro, geocerca) dentro, codificados y ordenados.
+
+        Los miembros se agrupan en columnas de ancho igual al radio máximo y se
+        ordenan por (columna, y). Cada geocerca solo se compara con los miembros
+        de las columnas que cruza y dentro de ellas con los de [y - r, y + r]
+        (searchsorted), no con toda la sala.
+        """
+        import numpy as np
+
+        fx, fy, radius, fence_ids = self._fence_arrays_for(index)
+        width = max(float(radius.max()), 1.0)
+        y_min = min(float(ys.min()), float((fy - radius).min()))
+        # Clave de orden: columna * alto + y (alto mayor que todo el rango en y)
+        height = max(float(ys.max()), float((fy + radius).max())) - y_min + 1.0
+        x_min = min(float(xs.min()), float((fx - radius).min()))
+
+        member_columns = np.floor((xs - x_min) / width)
+        member_keys = member_columns * height + (ys - y_min)
+        order = np.argsort(member_keys, kind="stable")
+        sorted_keys = member_keys[order]
+
+        first_column = np.floor((fx - radius - x_min) / width)
+        last_column = np.floor((fx + radius - x_min) / width)
+        bottom = fy - radius - y_min
+        top = fy + radius - y_min
+
+        # Una franja [lo, hi) de miembros por cada (geocerca, columna que cruza)
+        fence_index, lo, hi = [], [], []
+        for offset in range(int((last_column - first_column).max()) + 1):
+            column = first_column + offset
+            spans = np.nonzero(column <= last_column)[0]
+            fence_index.append(spans)
+            lo.append(np.searchsorted(sorted_keys, column[spans] * height + bottom[spans], side="left"))
+            hi.append(np.searchsorted(sorted_keys, column[spans] * height + top[spans], side="right"))
+        fence_index = np.concatenate(fence_index)
+        lo = np.concatenate(lo)
+        counts = np.concatenate(hi) - lo
+
+        # Expandir las franjas a pares candidatos (miembro, geocerca), por
+        # bloques de ~geofence_chunk_pairs para acotar la memoria si todos
+        # los miembros caen dentro de todas las geocercas
+        ends = np.cumsum(counts)
+        cuts = np.searchsorted(ends, np.arange(settings.geofence_chunk_pairs, int(ends[-1]), settings.geofence_chunk_pairs))
+        keys = []
+        for first, last in zip(np.concatenate(([0], cuts + 1)), np.concatenate((cuts + 1, [len(counts)]))):
+            chunk_counts = counts[first:last]
+            total = int(chunk_counts.sum())
+            if not total:
+                continue
+            starts = np.repeat(lo[first:last] - (np.cumsum(chunk_counts) - chunk_counts), chunk_counts)
+            members = order[starts + np.arange(total)]
+            fences = np.repeat(fence_index[first:last], chunk_counts)
+            dx = xs[members] - fx[fences]
+            dy = ys[members] - fy[fences]
+            hit = dx * dx + dy * dy <= radius[fences] ** 2
+            keys.append((ids[members[hit]] << 32) | fence_ids[fences[hit]])
+
+        if not keys:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(keys))
+
+    def evaluate(self, index: GridIndex) -> List[GeofenceEvent]:
+        """
+        Evalúa todas las geocercas contra todas las posiciones.
+
+        Returns:
+            List[GeofenceEvent]: Entradas y salidas desde el tick anterior
+        """
+        import numpy as np
+
+        if index is not self.index:
+            self.reset()
+            self.index = index
+        state = (index.version, self.version)
+        if state == self.evaluated:
+            return []
+        self.evaluated = state
+
+        members = list(index.positions)
+        positions = index.positions.values()
+        xs = np.fromiter((position[2] for position in positions), dtype=np.float64, count=len(members))
+        ys = np.fromiter((position[3] for position in positions), dtype=np.float64, count=len(members))
+        ids = self._ids_for(members)
+
+        keys = self._inside_keys(xs, ys, ids, index) if self.fences else np.empty(0, dtype=np.int64)
+        entered = np.setdiff1d(keys, self.inside_keys, assume_unique=True)
+        exited = np.setdiff1d(self.inside_keys, keys, assume_unique=True)
+        self.inside_keys = keys
+
+        # Miembros desconectados y geocercas borradas no generan salida
+        if len(exited):
+            present = np.isin(exited >> 32, ids)
+            present &= np.isin(exited & 0xFFFFFFFF, self._fence_arrays_for(index)[3])
+            exited = exited[present]
+
+        events = []
+        for name, selected in (("GEOFENCE_ENTER", entered), ("GEOFENCE_EXIT", exited)):
+            for key in selected.tolist():
+                events.append((name, self.fences[key & 0xFFFFFFFF], self.member_names[key >> 32]))
+        return events
+
+
+class GeofenceManager:
+    """Geocercas de todas las salas y la tarea que las evalúa periódicamente"""
+
+    def __init__(self):
+        self.rooms: Dict[str, RoomGeofences] = {}
+        self._next_id = 1
+        self._tick_task: Optional[asyncio.Task] = None
+        self.events_emitted = 0
+        self.last_tick_ms = 0.0
+
+    def add_fence(self, room_code: str, data: GeofenceCreate) -> Geofence:
+        """
+        Crea una geocerca en la sala.
+
+        Raises:
+            ValueError: Si la sala ya tiene el máximo de geocercas
+        """
+        room = self.rooms.setdefault(room_code, RoomGeofences())
+        if len(room.fences) >= settings.geofence_max_per_room:
+            raise ValueError(f"La sala ya tiene el máximo de {settings.geofence_max_per_room} geocercas")
+
+        fence = Geofence(id=self._next_id, created_at=datetime.utcnow(), **data.model_dump())
+        self._next_id += 1
+        room.fences[fence.id] = fence
+        room.version += 1
+        logger.info("Geocerca %s (%s) creada en sala %s", fence.id, fence.name, room_code)
+        return fence
+
+    def remove_fence(self, room_code: str, fence_id: int) -> bool:
+        """Elimina una geocerca; False si no existe"""
+        room = self.rooms.get(room_code)
+        if room is None or room.fences.pop(fence_id, None) is None:
+            return False
+        room.version += 1
+        if not room.fences:
+            del self.rooms[room_code]
+        logger.info("Geocerca %s eliminada de sala %s", fence_id, room_code)
+        return True
+
+    def list_fences(self, room_code: str) -> List[Geofence]:
+        room = self.rooms.get(room_code)
+        return list(room.fences.values()) if room is not None else []
+
+    async def tick(self) -> int:
+        """
+        Evalúa las salas con geocercas y envía las entradas/salidas a sus sockets.
+        Recorre las salas por bloques y cede el event loop entre uno y otro.
+
+        Returns:
+            int: Número de eventos emitidos
+        """
+        start = time.perf_counter()
+        emitted = 0
+        room_codes = list(self.rooms)
+        chunk_size = max(1, settings.geofence_tick_chunk_size)
+        for i in range(0, len(room_codes), chunk_size):
+            if i:
+                await asyncio.sleep(0)
+            chunk = room_codes[i:i + chunk_size]
+            existing = room_manager.existing_room_codes(chunk)
+            for room_code in chunk:
+                # Pudo perder sus geocercas mientras se cedía el loop
+                room = self.rooms.get(room_code)
+                if room is None:
+                    continue
+                # La sala expiró: sus geocercas también
+                if room_code not in existing:
+                    del self.rooms[room_code]
+                    continue
+                index = spatial_index.get(room_code)
+                if index is None:
+                    room.reset()
+                    continue
+                for event, fence, username in room.evaluate(index):
+                    room_events.broadcast(room_code, {
+                        "event": event,
+                        "data": {"fence_id": fence.id, "name": fence.name, "username": username}
+                    })
+                    emitted += 1
+        self.events_emitted += emitted
+        self.last_tick_ms = (time.perf_counter() - start) * 1000
+        return emitted
+
+    async def run_tick_loop(self):
+        """Tarea en background que evalúa las geocercas cada tick"""
+        while True:
+            try:
+                await asyncio.sleep(settings.geofence_tick_interval_seconds)
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error al evaluar geocercas: {e}")
+
+    def start_tick_task(self):
+        """Inicia la evaluación periódica (si está activada)"""
+        if not settings.geofence_enabled:
+            return
+        if self._tick_task is None or self._tick_task.done():
+            self._tick_task = asyncio.create_task(self.run_tick_loop())
+            logger.info("Evaluación de geocercas iniciada")
+
+    def stop_tick_task(self):
+        """Detiene la evaluación periódica"""
+        if self._tick_task and not self._tick_task.done():
+            self._tick_task.cancel()
+            logger.info("Evaluación de geocercas detenida")
+
+    def get_stats(self) -> dict:
+        """Obtiene estadísticas de las geocercas"""
+        return {
+            "rooms": len(self.rooms),
+            "fences": sum(len(room.fences) for room in self.rooms.values()),
+            "events_emitted": self.events_emitted,
+            "last_tick_ms": round(self.last_tick_ms, 3)
+        }
+
+
+# Instancia global de las geocercas
+geofence_manager = GeofenceManager()
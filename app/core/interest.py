@@ -0,0 +1,152 @@
+"""
+Reenvío por distancia (interest management) para salas grandes.
+
+Sin política, cada UPDATE_LOCATION se reenvía a toda la sala (O(N) por
+actualización). Con una política activada para la sala:
+
+- Cercanos: la actualización se envía al momento como FRIEND_MOVED solo a
+  los amigos a menos de `radius_m` y/o a los `k` más cercanos del que se
+  mueve (consultando el índice espacial), O(k) por actualización.
+- Lejanos: la última posición de cada miembro se acumula y cada
+  `far_interval_seconds` se envía a toda la sala un único FRIENDS_MOVED con
+  todas las posiciones que cambiaron. El JSON se serializa una vez por sala.
+
+"Los k más cercanos" se calcula desde el que se mueve (aproximación
+simétrica del k-vecinos de cada receptor, que costaría O(N) calcular).
+"""
+
+from typing import Dict, Optional
+from app.core.config import settings
+from app.core.connection_manager import connection_manager
+from app.core.room_events import room_events
+from app.core.room_manager import room_manager
+from app.core.spatial_index import spatial_index
+from app.models.room import FanoutPolicy
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class InterestManager:
+    """Políticas de reenvío por sala y posiciones pendientes del envío agrupado"""
+
+    def __init__(self):
+        self.policies: Dict[str, FanoutPolicy] = {}
+        # Última posición de cada miembro desde el último envío agrupado
+        self.pending_far: Dict[str, Dict[str, dict]] = {}
+        self.last_far_flush: Dict[str, float] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self.near_messages = 0
+        self.far_batches = 0
+
+    def set_policy(self, room_code: str, policy: FanoutPolicy):
+        self.policies[room_code] = policy
+        self.last_far_flush[room_code] = time.monotonic()
+        logger.info("Política de reenvío en sala %s: %s", room_code, policy.model_dump())
+
+    def clear_policy(self, room_code: str) -> bool:
+        """Vuelve al reenvío a toda la sala (envía antes lo pendiente)"""
+        if self.policies.pop(room_code, None) is None:
+            return False
+        self._flush_room(room_code)
+        self.last_far_flush.pop(room_code, None)
+        logger.info("Política de reenvío eliminada en sala %s", room_code)
+        return True
+
+    def get_policy(self, room_code: str) -> Optional[FanoutPolicy]:
+        return self.policies.get(room_code)
+
+    def fanout(self, room_code: str, username: str, lat, lon, message: str, exclude=None) -> int:
+        """
+        Reenvía un FRIEND_MOVED ya serializado según la política de la sala.
+
+        Returns:
+            int: Número de sockets a los que se envió al momento
+        """
+        policy = self.policies.get(room_code)
+        if policy is None or lat is None or lon is None:
+            return connection_manager.broadcast(room_code, message, exclude=exclude)
+
+        index = spatial_index.get(room_code)
+        sent = 0
+        if index is not None:
+            if policy.k is not None:
+                near = index.nearest(lat, lon, policy.k, max_radius=policy.radius_m, exclude=username)
+            else:
+                near = index.within(lat, lon, policy.radius_m, exclude=username)
+            sent = connection_manager.send_to_users(room_code, (name for _, name in near), message)
+            self.near_messages += sent
+
+        self.pending_far.setdefault(room_code, {})[username] = {"username": username, "lat": lat, "lon": lon}
+        return sent
+
+    def _flush_room(self, room_code: str) -> int:
+        friends = self.pending_far.pop(room_code, None)
+        if not friends:
+            return 0
+        self.far_batches += 1
+        return room_events.broadcast(room_code, {
+            "event": "FRIENDS_MOVED",
+            "data": {"friends": list(friends.values())}
+        })
+
+    def flush_due(self, now: Optional[float] = None) -> int:
+        """
+        Envía los FRIENDS_MOVED de las salas cuyo intervalo ya pasó.
+
+        Returns:
+            int: Número de salas enviadas
+        """
+        if now is None:
+            now = time.monotonic()
+        flushed = 0
+        for room_code, policy in list(self.policies.items()):
+            # La sala expiró: su política también
+            if not room_manager.room_exists(room_code):
+                del self.policies[room_code]
+                self.pending_far.pop(room_code, None)
+                self.last_far_flush.pop(room_code, None)
+                continue
+            if now - self.last_far_flush.get(room_code, 0) >= policy.far_interval_seconds:
+                self.last_far_flush[room_code] = now
+                if self._flush_room(room_code):
+                    flushed += 1
+        return flushed
+
+    async def run_flush_loop(self):
+        """Tarea en background que envía las actualizaciones agrupadas"""
+        while True:
+            try:
+                await asyncio.sleep(settings.interest_tick_seconds)
+                self.flush_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en el envío agrupado de posiciones: {e}")
+
+    def start_flush_task(self):
+        """Inicia el envío agrupado en background"""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self.run_flush_loop())
+            logger.info("Envío agrupado de posiciones iniciado")
+
+    def stop_flush_task(self):
+        """Detiene el envío agrupado"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            logger.info("Envío agrupado de posiciones detenido")
+
+    def get_stats(self) -> dict:
+        """Obtiene estadísticas del reenvío por distancia"""
+        return {
+            "rooms_with_policy": len(self.policies),
+            "pending_far_updates": sum(len(friends) for friends in self.pending_far.values()),
+            "near_messages": self.near_messages,
+            "far_batches": self.far_batches
+        }
+
+
+# Instancia global del reenvío por distancia
+interest_manager = InterestManager()
@@ -0,0 +1,146 @@
+"""
+Subida de puntos acumulados sin conexión.
+
+Sin señal el radar guarda sus puntos de GPS en el teléfono; al reconectar los
+sube en un solo POST (JSON, normalmente comprimido con gzip) en lugar de
+tirarlos. El lote se procesa en una sola pasada:
+
+- los puntos fuera de la ventana aceptada (más antiguos que
+  `location_batch_max_age_seconds` o con fecha futura más allá de
+  `location_batch_max_clock_skew_seconds`) se descartan;
+- el resto va al historial (write-behind) con su hora original;
+- solo el más reciente pasa a ser la última ubicación (índice espacial y
+  agregados de la sala) y se reenvía a la sala como FRIEND_MOVED.
+
+Si el usuario ya tiene un socket en la sala y una ubicación conocida, esa
+ubicación viene del socket y es más nueva que cualquier punto acumulado sin
+conexión: el lote solo llena el historial.
+"""
+
+from operator import attrgetter
+from datetime import datetime
+from typing import List, Optional
+from app.core.config import settings
+from app.core.connection_manager import connection_manager
+from app.core.interest import interest_manager
+from app.core.location_history import location_history
+from app.core.room_aggregates import room_aggregates
+from app.core.room_events import room_events
+from app.core.spatial_index import spatial_index
+from app.models.radar import BatchPoint
+import json
+import time
+import zlib
+
+# wbits para zlib.decompressobj: gzip o zlib, detectado por la cabecera
+_WBITS = {"gzip": 47, "x-gzip": 47, "deflate": 47}
+
+
+def decompress_body(body: bytes, encoding: Optional[str], max_bytes: int) -> Optional[bytes]:
+    """
+    Descomprime el cuerpo según Content-Encoding sin pasar de max_bytes
+    (un cuerpo pequeño puede descomprimirse en gigas).
+
+    Returns:
+        Optional[bytes]: El cuerpo descomprimido, o None si supera max_bytes
+
+    Raises:
+        ValueError: Si la codificación no se soporta
+        zlib.error: Si el cuerpo no es gzip/deflate válido
+    """
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return body if len(body) <= max_bytes else None
+    wbits = _WBITS.get(encoding)
+    if wbits is None:
+        raise ValueError(f"Content-Encoding no soportado: {encoding}")
+
+    decompressor = zlib.decompressobj(wbits)
+    data = decompressor.decompress(body, max_bytes + 1)
+    if len(data) > max_bytes:
+        return None
+    data += decompressor.flush()
+    if len(data) > max_bytes:
+        return None
+    return data
+
+
+class LocationBatchIngestor:
+    """Procesa los lotes de puntos y lleva sus estadísticas"""
+
+    def __init__(self):
+        self.batches = 0
+        self.points = 0
+        self.rejected_points = 0
+        self.position_updates = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+
+    def ingest(self, room_code: str, username: str, points: List[BatchPoint], now: Optional[float] = None) -> dict:
+        """
+        Procesa un lote de puntos de un usuario.
+
+        Args:
+            now: Hora actual en segundos desde epoch (default: time.time())
+
+        Returns:
+            dict: accepted, rejected, position_updated y forwarded
+        """
+        if now is None:
+            now = time.time()
+        min_ts = (now - settings.location_batch_max_age_seconds) * 1000
+        max_ts = (now + settings.location_batch_max_clock_skew_seconds) * 1000
+
+        valid = [point for point in points if min_ts <= point.ts <= max_ts]
+        # El teléfono los manda en orden: ordenar una lista ya ordenada es O(n)
+        valid.sort(key=attrgetter("ts"))
+        self.batches += 1
+        self.points += len(valid)
+        self.rejected_points += len(points) - len(valid)
+        result = {"accepted": len(valid), "rejected": len(points) - len(valid), "position_updated": False, "forwarded": 0}
+        if not valid:
+            return result
+
+        if settings.location_history_enabled:
+            utcfromtimestamp = datetime.utcfromtimestamp
+            location_history.record_many(room_code, username, [
+                (point.lat, point.lon, utcfromtimestamp(point.ts / 1000)) for point in valid
+            ])
+
+        # Con un socket abierto que ya reportó su ubicación, la del lote es más vieja
+        live = (
+            username in connection_manager.users.get(room_code, ())
+            and spatial_index.position(room_code, username) is not None
+        )
+        if live:
+            return result
+
+        latest = valid[-1]
+        spatial_index.update(room_code, username, latest.lat, latest.lon)
+        room_aggregates.update(room_code, username, latest.lat, latest.lon)
+        self.position_updates += 1
+        result["position_updated"] = True
+
+        # Mismo contrato y misma política de reenvío que un UPDATE_LOCATION del socket
+        response = {"event": "FRIEND_MOVED", "data": {"username": username, "lat": latest.lat, "lon": latest.lon}}
+        if interest_manager.get_policy(room_code) is None:
+            outbound = room_events.record(room_code, response)
+        else:
+            outbound = json.dumps(response)
+        result["forwarded"] = interest_manager.fanout(room_code, username, latest.lat, latest.lon, outbound)
+        return result
+
+    def get_stats(self) -> dict:
+        """Obtiene estadísticas de los lotes recibidos"""
+        return {
+            "batches": self.batches,
+            "points": self.points,
+            "rejected_points": self.rejected_points,
+            "position_updates": self.position_updates,
+            "bytes_received": self.bytes_received,
+            "bytes_decoded": self.bytes_decoded
+        }
+
+
+# Instancia global de la subida de lotes
+location_batches = LocationBatchIngestor()
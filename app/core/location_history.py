@@ -0,0 +1,282 @@
+"""
+Historial de ubicaciones con escritura diferida (write-behind).
+
+Los puntos que llegan por el WebSocket se guardan en buffers en memoria por
+sala y una tarea en background los vuelca a la base de datos con INSERTs
+multi-fila. Registrar un punto es O(1) y nunca espera a la base de datos,
+así que el reenvío a los amigos de la sala no se ve afectado.
+
+Cada lote se confirma en su propia transacción: si uno falla (ej: la BD se
+cayó a mitad del volcado) solo ese lote vuelve a la cola y se reintenta en
+el siguiente volcado, hasta `location_history_max_flush_attempts` veces y
+sin pasar de `location_history_max_buffered_points` puntos en memoria.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import insert
+from app.core.config import settings
+from app.database.connection import get_engine
+from app.models.location import ROOM_CODE_MAX_LENGTH, USERNAME_MAX_LENGTH, LocationPoint
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (username, lat, lon, recorded_at)
+BufferedPoint = Tuple[str, float, float, datetime]
+
+
+class LocationHistorySink:
+    """
+    Buffer de puntos de ubicación por sala con volcado por tamaño o tiempo.
+    Si el buffer está lleno los puntos nuevos se descartan y se cuentan.
+    """
+
+    def __init__(self):
+        self.buffers: Dict[str, List[BufferedPoint]] = {}
+        self.buffered = 0
+        self.recorded = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.batches = 0
+        self.flush_errors = 0
+        self.retried = 0
+        # Lotes que fallaron: (intentos, filas); cuentan en `buffered`
+        self.failed_batches: List[Tuple[int, List[dict]]] = []
+        self.engine = None  # Permite usar otro engine (ej: SQLite local)
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_event: Optional[asyncio.Event] = None
+
+    def record(
+        self,
+        room_code: str,
+        username: str,
+        lat: float,
+        lon: float,
+        recorded_at: Optional[datetime] = None
+    ) -> bool:
+        """
+        Agrega un punto al buffer de la sala.
+
+        Returns:
+            bool: True si se guardó, False si el historial está desactivado
+            o el buffer está lleno (el punto se descarta)
+        """
+        if not settings.location_history_enabled:
+            return False
+
+        # Un código que no cabe en la columna haría fallar el lote de todas las salas
+        if self.buffered >= settings.location_history_max_buffered_points or len(room_code) > ROOM_CODE_MAX_LENGTH:
+            self.dropped += 1
+            return False
+
+        buffer = self.buffers.get(room_code)
+        if buffer is None:
+            buffer = self.buffers[room_code] = []
+        # Los usernames del WebSocket no tienen límite y la columna sí: en
+        # MySQL estricto un nombre largo haría fallar el lote entero
+        buffer.append((username[:USERNAME_MAX_LENGTH], lat, lon, recorded_at or datetime.utcnow()))
+        self.buffered += 1
+        self.recorded += 1
+
+        # Disparador por tamaño: despertar al volcador sin esperar al intervalo
+        if self.buffered >= settings.location_history_batch_size and self._flush_event is not None:
+            self._flush_event.set()
+        return True
+
+    def record_many(self, room_code: str, username: str, points: List[Tuple[float, float, datetime]]) -> int:
+        """
+        Agrega varios puntos de un usuario (ej: un lote subido al reconectar)
+        con una sola comprobación de capacidad.
+
+        Args:
+            points: (lat, lon, recorded_at) de cada punto
+
+        Returns:
+            int: Número de puntos guardados (el resto se descarta y se cuenta)
+        """
+        if not settings.location_history_enabled or not points:
+            return 0
+        if len(room_code) > ROOM_CODE_MAX_LENGTH:
+            self.dropped += len(points)
+            return 0
+
+        capacity = settings.location_history_max_buffered_points - self.buffered
+        kept = points[:max(capacity, 0)]
+        self.dropped += len(points) - len(kept)
+        if not kept:
+            return 0
+
+        buffer = self.buffers.get(room_code)
+        if buffer is None:
+            buffer = self.buffers[room_code] = []
+        username = username[:USERNAME_MAX_LENGTH]
+        buffer.extend([(username, lat, lon, recorded_at) for lat, lon, recorded_at in kept])
+        self.buffered += len(kept)
+        self.recorded += len(kept)
+
+        if self.buffered >= settings.location_history_batch_size and self._flush_event is not None:
+            self._flush_event.set()
+        return len(kept)
+
+    def _take_buffered(self, batch_size: int) -> List[Tuple[int, List[dict]]]:
+        """
+        Vacía los buffers y devuelve los lotes a insertar: primero los que
+        fallaron antes, con sus intentos, y después los puntos nuevos
+        agrupados por sala
+        """
+        buffers = self.buffers
+        batches = self.failed_batches
+        self.buffers = {}
+        self.failed_batches = []
+        self.buffered = 0
+
+        rows = []
+        for room_code, points in buffers.items():
+            for username, lat, lon, recorded_at in points:
+                rows.append({
+                    "room_code": room_code,
+                    "username": username,
+                    "lat": lat,
+                    "lon": lon,
+                    "recorded_at": recorded_at
+                })
+        batches.extend((0, rows[start:start + batch_size]) for start in range(0, len(rows), batch_size))
+        return batches
+
+    @staticmethod
+    def _insert_batches(engine, batches: List[Tuple[int, List[dict]]]) -> List[Tuple[int, List[dict], Exception]]:
+        """
+        Inserta cada lote con un INSERT multi-fila en su propia transacción
+        (se ejecuta en un hilo).
+
+        Returns:
+            List[Tuple[int, List[dict], Exception]]: Lotes que fallaron, con
+            sus intentos previos y el error
+        """
+        table = LocationPoint.__table__
+        failed = []
+        for attempts, rows in batches:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(insert(table).values(rows))
+            except Exception as e:
+                failed.append((attempts, rows, e))
+        return failed
+
+    def _requeue(self, failed: List[Tuple[int, List[dict], Exception]]) -> int:
+        """
+        Devuelve a la cola los lotes fallidos que aún tienen intentos y caben
+        en el buffer; el resto se descarta.
+
+        Returns:
+            int: Puntos descartados
+        """
+        dropped = 0
+        for attempts, rows, _ in failed:
+            attempts += 1
+            capacity = settings.location_history_max_buffered_points - self.buffered
+            if attempts >= settings.location_history_max_flush_attempts or len(rows) > capacity:
+                dropped += len(rows)
+                continue
+            self.failed_batches.append((attempts, rows))
+            self.buffered += len(rows)
+            self.retried += len(rows)
+        self.dropped += dropped
+        return dropped
+
+    async def flush(self) -> int:
+        """
+        Vuelca todos los puntos pendientes a la base de datos.
+
+        Returns:
+            int: Número de puntos insertados
+        """
+        if not self.buffered:
+            return 0
+
+        batches = self._take_buffered(settings.location_history_batch_size)
+        total = sum(len(rows) for _, rows in batches)
+        engine = self.engine or get_engine()
+        if engine is None:
+            self.dropped += total
+            logger.warning("Historial: BD no disponible, %d puntos descartados", total)
+            return 0
+
+        failed = await asyncio.to_thread(self._insert_batches, engine, batches)
+        if failed:
+            self.flush_errors += len(failed)
+            failed_points = sum(len(rows) for _, rows, _ in failed)
+            dropped = self._requeue(failed)
+            logger.error(
+                "Error al volcar historial de ubicaciones (%d de %d lotes, %d puntos, %d descartados): %s",
+                len(failed), len(batches), failed_points, dropped, failed[-1][2]
+            )
+        else:
+            failed_points = 0
+
+        inserted = total - failed_points
+        self.flushed += inserted
+        self.batches += len(batches) - len(failed)
+        return inserted
+
+    async def run_flush_loop(self):
+        """
+        Tarea que vuelca el historial cada `location_history_flush_interval_seconds`
+        o antes si el buffer alcanza `location_history_batch_size` puntos.
+        """
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(
+                        self._flush_event.wait(),
+                        timeout=settings.location_history_flush_interval_seconds
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_event.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error en volcado de historial: %s", e)
+
+    def start_flush_task(self):
+        """Inicia la tarea de volcado en background (si el historial está activo)"""
+        if not settings.location_history_enabled:
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_event = asyncio.Event()
+            self._flush_task = asyncio.create_task(self.run_flush_loop())
+            logger.info("Tarea de volcado de historial iniciada")
+
+    async def stop_flush_task(self):
+        """Detiene la tarea de volcado y vuelca los puntos pendientes"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            logger.info("Tarea de volcado de historial detenida")
+        self._flush_event = None
+        await self.flush()
+
+    def get_stats(self) -> dict:
+        """Obtiene estadísticas del historial"""
+        return {
+            "enabled": settings.location_history_enabled,
+            "buffered_points": self.buffered,
+            "buffered_rooms": len(self.buffers),
+            "recorded_points": self.recorded,
+            "flushed_points": self.flushed,
+            "dropped_points": self.dropped,
+            "batches": self.batches,
+            "flush_errors": self.flush_errors,
+            "retried_points": self.retried
+        }
+
+
+# Instancia global del historial
+location_history = LocationHistorySink()
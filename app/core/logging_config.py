@@ -0,0 +1,165 @@
+"""
+Configuración de logging sin bloquear el event loop.
+
+Los registros se encolan con un QueueHandler y un hilo en background
+(QueueListener) los formatea y escribe en stderr. El mensaje no se formatea
+en el hilo que llama: solo se crea el LogRecord y se encola. Por eso los
+argumentos deben ser inmutables (str, números, None...): si alguno no lo es
+(ej: un dict que se modifica después) el mensaje se formatea al encolar, y las
+excepciones se convierten a texto al encolar para no retener sus frames.
+
+Los eventos de alta frecuencia se marcan con `extra={"event": "..."}` y se
+muestrean según `settings.log_sample_rates` antes de encolarse:
+
+    logger.info("Usuario %s se unió a sala %s", username, code,
+                extra={"event": "room.join"})
+"""
+
+from typing import Dict, Optional
+from logging.handlers import QueueHandler, QueueListener
+from datetime import datetime, timezone
+from app.core.config import settings
+import atexit
+import json
+import logging
+import queue
+import sys
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Atributos estándar de LogRecord que no se copian como campos extra
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+# Argumentos que se pueden formatear más tarde en el hilo del listener
+_IMMUTABLE_ARGS = (str, int, float, bool, type(None), bytes)
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro; los campos de `extra` se incluyen tal cual"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Conserva 1 de cada N registros de los eventos configurados.
+    Es determinista (contador por evento), sin llamadas a random.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.every: Dict[str, int] = {
+            event: max(1, round(1 / rate)) if rate > 0 else 0
+            for event, rate in rates.items()
+        }
+        self.seen: Dict[str, int] = {}
+        self.dropped: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None:
+            return True
+        every = self.every.get(event)
+        if every is None or every == 1:
+            return True
+
+        seen = self.seen.get(event, 0)
+        self.seen[event] = seen + 1
+        if every and seen % every == 0:
+            return True
+        self.dropped[event] = self.dropped.get(event, 0) + 1
+        return False
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler que no formatea el mensaje al encolar (el QueueHandler
+    estándar llama a format() en el hilo que registra). El formateo ocurre
+    en el hilo del QueueListener, salvo que los argumentos sean mutables.
+    """
+
+    _exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        # Un argumento mutable podría cambiar antes de que el listener lo formatee
+        if args and (type(args) is not tuple or any(type(arg) not in _IMMUTABLE_ARGS for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        # El traceback retiene los frames (y sus variables) mientras esté en la cola
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[QueueListener] = None
+sampling_filter: Optional[SamplingFilter] = None
+
+
+def setup_logging():
+    """
+    Configura el logging raíz según Settings (log_level, log_format,
+    log_queue_enabled, log_sample_rates). Es idempotente.
+    """
+    global _listener, sampling_filter
+
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if settings.log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(formatter)
+
+    sampling_filter = SamplingFilter(settings.get_log_sample_rates())
+
+    if settings.log_queue_enabled:
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        handler: logging.Handler = LazyQueueHandler(log_queue)
+        _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    else:
+        handler = stream_handler
+    handler.addFilter(sampling_filter)
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.log_level.upper())
+
+    # Los loggers de uvicorn tienen handlers propios que escriben en el loop
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        if uvicorn_logger.handlers:
+            uvicorn_logger.handlers = [handler]
+
+
+def shutdown_logging():
+    """Detiene el hilo escritor después de vaciar la cola"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logging_stats() -> dict:
+    """Registros descartados por muestreo, por evento"""
+    return {
+        "queue_enabled": settings.log_queue_enabled,
+        "sampled_out": dict(sampling_filter.dropped) if sampling_filter else {}
+    }
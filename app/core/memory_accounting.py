@@ -0,0 +1,318 @@
+"""
+Contabilidad aproximada de memoria por sala y por socket.
+
+Para cada sala se suman los bytes de lo que el proceso guarda de ella en
+cada estructura: miembros (RoomManager, solo con el store en memoria),
+últimas posiciones (índice espacial), agregados, buffer del historial,
+registro de eventos, geocercas, posiciones pendientes de FRIENDS_MOVED,
+muestras de RATE_HINT y sockets con sus colas de salida. Los bytes se miden
+con sys.getsizeof recorriendo cada estructura; un objeto compartido entre
+estructuras de la misma sala se cuenta una sola vez. No incluye los buffers
+de uvicorn/websockets ni la fragmentación del allocator: para eso está la
+diferencia de snapshots de tracemalloc.
+
+Recorrer todas las salas es O(memoria total) y medir una sala con muchos
+eventos puede costar milisegundos: el recorrido cede el event loop cada
+`memory_report_slice_ms` de trabajo, no cada N salas.
+"""
+
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+from app.core.config import settings
+from app.core.connection_manager import connection_manager
+from app.core.geofences import geofence_manager
+from app.core.interest import interest_manager
+from app.core.location_history import location_history
+from app.core.rate_hints import rate_hints
+from app.core.room_aggregates import room_aggregates
+from app.core.room_events import room_events
+from app.core.room_manager import room_manager
+from app.core.room_store import MemoryRoomStore
+from app.core.spatial_index import spatial_index
+from pydantic import BaseModel
+import asyncio
+import heapq
+import os
+import sys
+import time
+import tracemalloc
+
+_ATOMIC = (str, bytes, int, float, bool, type(None), datetime)
+
+
+def deep_sizeof(obj, seen: Optional[Set[int]] = None) -> int:
+    """
+    Bytes de un objeto y de todo lo que contiene (contenedores, objetos con
+    __dict__ o __slots__, modelos de pydantic y arrays de NumPy). Los objetos
+    ya vistos en `seen` no se vuelven a contar.
+    """
+    if seen is None:
+        seen = set()
+    # Sin NumPy importado no puede haber arrays (no se importa solo para esto)
+    np = sys.modules.get("numpy")
+    ndarray = np.ndarray if np is not None else ()
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, _ATOMIC):
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        elif isinstance(item, ndarray):
+            # getsizeof ya incluye los datos si el array es dueño de ellos
+            if item.base is not None:
+                size += item.nbytes
+        elif isinstance(item, BaseModel):
+            stack.append(item.__dict__)
+        else:
+            if hasattr(item, "__dict__"):
+                stack.append(item.__dict__)
+            for slot in getattr(type(item), "__slots__", ()):
+                value = getattr(item, slot, None)
+                if value is not None:
+                    stack.append(value)
+    return size
+
+
+def queue_stats(connection) -> tuple:
+    """(mensajes, bytes) en la cola de salida de un socket"""
+    # asyncio.Queue no expone su contenido: se lee el deque interno
+    pending = connection.queue._queue
+    return len(pending), sum(sys.getsizeof(message) for message in pending)
+
+
+def connection_bytes(connection) -> int:
+    """
+    Bytes de un socket: el objeto, su cola y los mensajes encolados. No
+    incluye el WebSocket de Starlette ni los buffers de uvicorn.
+    """
+    _, queued_bytes = queue_stats(connection)
+    return (
+        sys.getsizeof(connection)
+        + sys.getsizeof(connection.queue)
+        + sys.getsizeof(connection.queue._queue)
+        + queued_bytes
+    )
+
+
+def rss_bytes() -> Optional[int]:
+    """Memoria residente del proceso (None si no hay /proc)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class MemoryAccountant:
+    """Reportes de memoria por sala/socket y snapshots de tracemalloc"""
+
+    def __init__(self):
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.baseline_taken_at: Optional[datetime] = None
+        self.reports = 0
+
+    def _room_sources(self, room_code: str) -> Dict[str, object]:
+        """Lo que cada estructura guarda de la sala"""
+        store = room_manager.store
+        return {
+            "members": store.rooms.get(room_code) if isinstance(store, MemoryRoomStore) else None,
+            "positions": spatial_index.rooms.get(room_code),
+            "aggregates": room_aggregates.rooms.get(room_code),
+            "history_buffer": location_history.buffers.get(room_code),
+            "events": room_events.rooms.get(room_code),
+            "geofences": geofence_manager.rooms.get(room_code),
+            "fanout_pending": interest_manager.pending_far.get(room_code),
+            "rate_hints": rate_hints.rooms.get(room_code),
+        }
+
+    def room_report(self, room_code: str) -> Optional[dict]:
+        """
+        Bytes por componente de una sala.
+
+        Returns:
+            Optional[dict]: code, bytes totales, desglose y sockets; None si
+            ninguna estructura tiene la sala
+        """
+        sources = self._room_sources(room_code)
+        connections = connection_manager.rooms.get(room_code, ())
+        if not connections and all(source is None for source in sources.values()):
+            return None
+
+        seen: Set[int] = set()
+        breakdown = {
+            name: deep_sizeof(source, seen) if source is not None else 0
+            for name, source in sources.items()
+        }
+        queued_messages = 0
+        connection_total = 0
+        for connection in connections:
+            # Un socket multiplexado se cuenta una vez aunque esté en varias salas
+            if connection.multiplexed:
+                connection_total += sys.getsizeof(connection)
+                continue
+            messages, _ = queue_stats(connection)
+            queued_messages += messages
+            connection_total += connection_bytes(connection)
+        breakdown["connections"] = connection_total
+        return {
+            "code": room_code,
+            "bytes": sum(breakdown.values()),
+            "breakdown": breakdown,
+            "sockets": len(connections),
+            "queued_messages": queued_messages
+        }
+
+    def _room_codes(self) -> List[str]:
+        """Salas presentes en cualquiera de las estructuras del proceso"""
+        store = room_manager.store
+        codes = set(store.rooms) if isinstance(store, MemoryRoomStore) else set()
+        for registry in (
+            spatial_index.rooms, room_aggregates.rooms, location_history.buffers, room_events.rooms,
+            geofence_manager.rooms, interest_manager.pending_far, rate_hints.rooms, connection_manager.rooms
+        ):
+            codes.update(registry)
+        return list(codes)
+
+    async def report(self, top: int) -> dict:
+        """
+        Totales por componente y las `top` salas y sockets más pesados.
+        Cede el event loop cada `memory_report_slice_ms` de trabajo.
+        """
+        slice_seconds = settings.memory_report_slice_ms / 1000
+        totals: Dict[str, int] = {}
+        heaviest_rooms: List[tuple] = []
+        codes = self._room_codes()
+        deadline = time.perf_counter() + slice_seconds
+        for room_code in codes:
+            if time.perf_counter() >= deadline:
+                await asyncio.sleep(0)
+                deadline = time.perf_counter() + slice_seconds
+            report = self.room_report(room_code)
+            if report is None:
+                continue
+            for name, size in report["breakdown"].items():
+                totals[name] = totals.get(name, 0) + size
+            entry = (report["bytes"], room_code, report)
+            if len(heaviest_rooms) < top:
+                heapq.heappush(heaviest_rooms, entry)
+            elif entry > heaviest_rooms[0]:
+                heapq.heapreplace(heaviest_rooms, entry)
+
+        sockets = connection_manager.sockets()
+        socket_reports = []
+        queued_messages = queued_bytes = 0
+        for connection in sockets:
+            if time.perf_counter() >= deadline:
+                await asyncio.sleep(0)
+                deadline = time.perf_counter() + slice_seconds
+            messages, message_bytes = queue_stats(connection)
+            queued_messages += messages
+            queued_bytes += message_bytes
+            size = connection_bytes(connection)
+            socket_reports.append((size, id(connection), {
+                "room": connection.room_code,
+                "username": connection.username,
+                "bytes": size,
+                "queued_messages": messages,
+                "queued_bytes": message_bytes,
+                "compressed": connection.compressed,
+                "multiplexed_rooms": len(connection_manager.mux_sockets.get(connection, ()))
+            }))
+
+        self.reports += 1
+        return {
+            "rss_bytes": rss_bytes(),
+            "accounted_bytes": sum(totals.values()),
+            "totals": totals,
+            "rooms": len(codes),
+            "sockets": len(sockets),
+            "queued_messages": queued_messages,
+            "queued_bytes": queued_bytes,
+            "top_rooms": [report for _, _, report in sorted(heaviest_rooms, reverse=True)],
+            "top_connections": [report for _, _, report in heapq.nlargest(top, socket_reports)]
+        }
+
+    def take_baseline(self) -> dict:
+        """Activa tracemalloc (si no lo estaba) y guarda un snapshot de referencia"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(settings.memory_tracemalloc_frames)
+        self.baseline = self._snapshot()
+        self.baseline_taken_at = datetime.utcnow()
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "taken_at": self.baseline_taken_at.isoformat(),
+            "traced_bytes": current,
+            "peak_traced_bytes": peak,
+            "frames": tracemalloc.get_traceback_limit()
+        }
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        # Sin las asignaciones del propio tracemalloc ni del import
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def diff(self, top: int, group_by: str = "lineno") -> Optional[dict]:
+        """
+        Compara el estado actual con el snapshot de referencia.
+
+        Returns:
+            Optional[dict]: Las `top` ubicaciones que más crecieron, o None
+            si no hay referencia
+        """
+        if self.baseline is None or not tracemalloc.is_tracing():
+            return None
+        stats = self._snapshot().compare_to(self.baseline, group_by)
+        return {
+            "baseline_taken_at": self.baseline_taken_at.isoformat(),
+            "group_by": group_by,
+            "size_diff_bytes": sum(stat.size_diff for stat in stats),
+            "count_diff": sum(stat.count_diff for stat in stats),
+            "top": [
+                {
+                    "location": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                    "size_bytes": stat.size,
+                    "size_diff_bytes": stat.size_diff,
+                    "count": stat.count,
+                    "count_diff": stat.count_diff
+                }
+                for stat in stats[:top]
+            ]
+        }
+
+    def stop(self) -> bool:
+        """Detiene tracemalloc y olvida la referencia (trazar cuesta CPU y memoria)"""
+        was_tracing = tracemalloc.is_tracing()
+        self.baseline = None
+        self.baseline_taken_at = None
+        if was_tracing:
+            tracemalloc.stop()
+        return was_tracing
+
+    def get_stats(self) -> dict:
+        """Estado de tracemalloc y memoria residente"""
+        tracing = tracemalloc.is_tracing()
+        return {
+            "rss_bytes": rss_bytes(),
+            "tracemalloc": tracing,
+            "traced_bytes": tracemalloc.get_traced_memory()[0] if tracing else None,
+            "baseline": self.baseline is not None,
+            "reports": self.reports
+        }
+
+
+# Instancia global de la contabilidad de memoria
+memory_accounting = MemoryAccountant()
@@ -0,0 +1,378 @@
+"""
+Registro de métricas en memoria con exposición en formato de texto de Prometheus.
+
+Las métricas se actualizan desde el event loop (un solo hilo), así que los
+contadores son simples sumas de atributos sin locks. Los valores que ya
+existen en otros componentes (salas, pool de BD, rate limiter...) no se
+duplican: se leen en el momento del scrape mediante collectors.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from app.core.config import settings
+import asyncio
+import bisect
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+# Límites por defecto para latencias (segundos)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# (nombre, etiquetas, valor)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def histogram_samples(
+    name: str,
+    buckets: Sequence[float],
+    counts: Sequence[int],
+    total: float,
+    labels: Optional[Dict[str, str]] = None
+) -> List[Sample]:
+    """Construye las muestras de un histograma a partir de contadores por bucket"""
+    labels = labels or {}
+    samples: List[Sample] = []
+    cumulative = 0
+    for bound, count in zip(tuple(buckets) + (math.inf,), counts):
+        cumulative += count
+        samples.append((f"{name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+    samples.append((f"{name}_sum", labels, total))
+    samples.append((f"{name}_count", labels, cumulative))
+    return samples
+
+
+class Counter:
+    """Contador monótono. Con etiquetas, usar `labels(...)` para obtener el hijo."""
+
+    type_name = "counter"
+    __slots__ = ("name", "help", "labelnames", "value", "_children")
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.value = 0
+        self._children: Dict[Tuple[str, ...], "Counter"] = {}
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def labels(self, *values: str) -> "Counter":
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = Counter(self.name, self.help)
+        return child
+
+    def samples(self) -> Iterable[Sample]:
+        if not self.labelnames:
+            yield f"{self.name}_total", {}, self.value
+            return
+        for values, child in self._children.items():
+            yield f"{self.name}_total", dict(zip(self.labelnames, values)), child.value
+
+
+class Gauge:
+    """Valor que puede subir y bajar"""
+
+    type_name = "gauge"
+    __slots__ = ("name", "help", "labelnames", "value", "_children")
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.value = 0
+        self._children: Dict[Tuple[str, ...], "Gauge"] = {}
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def labels(self, *values: str) -> "Gauge":
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = Gauge(self.name, self.help)
+        return child
+
+    def samples(self) -> Iterable[Sample]:
+        if not self.labelnames:
+            yield self.name, {}, self.value
+            return
+        for values, child in self._children.items():
+            yield self.name, dict(zip(self.labelnames, values)), child.value
+
+
+class Histogram:
+    """Histograma con límites fijos; `observe` es un bisect y dos sumas"""
+
+    type_name = "histogram"
+    __slots__ = ("name", "help", "labelnames", "buckets", "counts", "sum", "count", "_children")
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        labelnames: Sequence[str] = ()
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._children: Dict[Tuple[str, ...], "Histogram"] = {}
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def labels(self, *values: str) -> "Histogram":
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = Histogram(self.name, self.help, self.buckets)
+        return child
+
+    def quantile(self, q: float) -> float:
+        """Cuantil aproximado (límite superior del bucket que lo contiene)"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return self.buckets[-1]
+
+    def _own_samples(self, labels: Dict[str, str]) -> Iterable[Sample]:
+        return histogram_samples(self.name, self.buckets, self.counts, self.sum, labels)
+
+    def samples(self) -> Iterable[Sample]:
+        if not self.labelnames:
+            yield from self._own_samples({})
+            return
+        for values, child in self._children.items():
+            yield from child._own_samples(dict(zip(self.labelnames, values)))
+
+
+# Un collector devuelve familias (nombre, tipo, ayuda, muestras) calculadas al vuelo
+Family = Tuple[str, str, str, List[Sample]]
+Collector = Callable[[], Iterable[Family]]
+
+
+class MetricsRegistry:
+    """Registro de métricas y collectors con render en formato de texto"""
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self.collectors: List[Collector] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        labelnames: Sequence[str] = ()
+    ) -> Histogram:
+        return self._register(Histogram(name, help, buckets, labelnames))
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collector: Collector):
+        """Registra una función que calcula métricas en el momento del scrape"""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """Genera la exposición en formato de texto (version 0.0.4)"""
+        lines: List[str] = []
+
+        def write_family(name: str, type_name: str, help: str, samples: Iterable[Sample]):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type_name}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+
+        for metric in self.metrics.values():
+            name = f"{metric.name}_total" if metric.type_name == "counter" else metric.name
+            write_family(name, metric.type_name, metric.help, metric.samples())
+
+        for collector in self.collectors:
+            try:
+                for name, type_name, help, samples in collector():
+                    write_family(name, type_name, help, samples)
+            except Exception as e:
+                logger.error(f"Error en collector de métricas: {e}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Instancia global del registro
+metrics = MetricsRegistry()
+
+# Métricas del WebSocket del radar (hot path: solo sumas de atributos)
+ws_messages_received = metrics.counter(
+    "radar_messages_received", "Mensajes recibidos por el WebSocket del radar"
+)
+ws_messages_forwarded = metrics.counter(
+    "radar_messages_forwarded", "Mensajes reenviados a otros miembros de la sala"
+)
+ws_fanout_latency = metrics.histogram(
+    "radar_fanout_latency_seconds", "Tiempo en reenviar una actualización a toda la sala"
+)
+ws_connections_opened = metrics.counter(
+    "radar_connections_opened", "Conexiones WebSocket aceptadas"
+)
+ws_disconnects = metrics.counter(
+    "radar_disconnects", "Desconexiones de WebSocket por motivo", labelnames=("reason",)
+)
+ws_invalid_messages = metrics.counter(
+    "radar_invalid_messages", "Frames del radar rechazados por motivo", labelnames=("reason",)
+)
+ws_send_dropped = metrics.counter(
+    "radar_send_dropped", "Mensajes descartados por cola de salida llena (cliente lento)"
+)
+
+# Métricas HTTP
+http_request_latency = metrics.histogram(
+    "http_request_duration_seconds", "Latencia de peticiones HTTP por ruta",
+    labelnames=("method", "route", "status")
+)
+
+# Lag del event loop
+event_loop_lag = metrics.histogram(
+    "event_loop_lag_seconds", "Retraso del event loop respecto al intervalo esperado",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+event_loop_lag_last = metrics.gauge(
+    "event_loop_lag_last_seconds", "Último retraso medido del event loop"
+)
+
+
+def disconnect_reason(code: Optional[int]) -> str:
+    """Traduce el código de cierre de WebSocket a un motivo legible"""
+    if code in (1000, 1001):
+        return "normal"
+    if code == 1006:
+        return "abnormal"
+    if code == 1012:
+        return "server_restart"
+    if code is None:
+        return "unknown"
+    return "other"
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mide la latencia de cada petición HTTP etiquetada con
+    la plantilla de la ruta (ej: /rooms/{code}), no con la URL concreta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Dict[object, str] = {}
+
+    def _route_path(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            path = "unknown"
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            self._route_paths[endpoint] = path
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_latency.labels(
+                scope["method"], self._route_path(scope), str(status_code)
+            ).observe(time.perf_counter() - start)
+
+
+class EventLoopMonitor:
+    """Mide el lag del event loop comparando cuánto tarda un sleep con lo esperado"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def monitor_lag(self):
+        interval = settings.metrics_loop_lag_interval_seconds
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - start - interval)
+            event_loop_lag.observe(lag)
+            event_loop_lag_last.set(lag)
+
+    def start(self):
+        """Inicia la medición del lag en background"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.monitor_lag())
+            logger.info("Monitor de lag del event loop iniciado")
+
+    def stop(self):
+        """Detiene la medición del lag"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            logger.info("Monitor de lag del event loop detenido")
+
+
+# Instancia global del monitor
+event_loop_monitor = EventLoopMonitor()
@@ -0,0 +1,245 @@
+"""
+Profiler de muestreo bajo demanda para el event loop.
+
+Durante una sesión de N segundos:
+- Un hilo muestrea la pila del hilo del event loop cada pocos milisegundos y
+  acumula pilas colapsadas (formato de flamegraph.pl / speedscope).
+- Un latido en el event loop permite detectar bloqueos: si el latido se
+  retrasa más del umbral, el hilo captura la pila del bloqueo (ej: bcrypt o
+  una consulta síncrona a la BD ejecutándose en el loop).
+- Se cronometra cada paso de corrutina/callback del loop y se guardan los más
+  lentos. Esto requiere el loop de asyncio; con uvloop solo hay muestreo y
+  detección de bloqueos (el reporte trae `slow_steps: null` y el motivo).
+"""
+
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+from app.core.config import settings
+import asyncio
+import heapq
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _collapse_stack(frame) -> str:
+    """Convierte una pila en 'raíz;...;hoja' (formato de pila colapsada)"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def _describe_handle(handle) -> str:
+    """Nombre legible de un callback del loop (corrutina si es un paso de Task)"""
+    callback = getattr(handle, "_callback", None)
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        coro = owner.get_coro()
+        return f"Task {owner.get_name()}: {getattr(coro, '__qualname__', repr(coro))}"
+    return getattr(callback, "__qualname__", repr(callback))
+
+
+class ProfileSession:
+    """Estado de una sesión de perfilado"""
+
+    def __init__(self, loop_thread_id: int, interval: float, block_threshold: float):
+        self.loop_thread_id = loop_thread_id
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.samples = 0
+        self.stacks: Dict[str, int] = {}
+        self.slow_steps: List[Tuple[float, str]] = []  # heap (duración, callback)
+        self.slow_steps_unavailable_reason: Optional[str] = None
+        self.blocking_incidents: List[dict] = []
+        self.heartbeat = time.perf_counter()
+        self.stopped = threading.Event()
+        self._current_incident: Optional[dict] = None
+
+    def sample_loop(self):
+        """Bucle del hilo muestreador"""
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is not None:
+                stack = _collapse_stack(frame)
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                self.samples += 1
+
+            lag = now - self.heartbeat
+            if lag >= self.block_threshold:
+                if self._current_incident is None:
+                    self._current_incident = {
+                        "started_at": datetime.utcnow().isoformat(),
+                        "stack": stack if frame is not None else None
+                    }
+                self._current_incident["duration_ms"] = round(lag * 1000, 1)
+            elif self._current_incident is not None:
+                self.blocking_incidents.append(self._current_incident)
+                self._current_incident = None
+
+        if self._current_incident is not None:
+            self.blocking_incidents.append(self._current_incident)
+
+    def record_step(self, duration: float, handle):
+        """Guarda un paso lento del loop (solo los N más lentos)"""
+        item = (duration, _describe_handle(handle))
+        if len(self.slow_steps) < settings.profiler_top_slow_steps:
+            heapq.heappush(self.slow_steps, item)
+        elif duration > self.slow_steps[0][0]:
+            heapq.heapreplace(self.slow_steps, item)
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in
+                         sorted(self.stacks.items(), key=lambda item: -item[1]))
+
+    def report(self, seconds: float) -> dict:
+        report = {
+            "duration_s": seconds,
+            "samples": self.samples,
+            "sample_interval_ms": round(self.interval * 1000, 2),
+            "collapsed": self.collapsed(),
+            "slow_steps": [
+                {"callback": name, "duration_ms": round(duration * 1000, 2)}
+                for duration, name in sorted(self.slow_steps, reverse=True)
+            ],
+            "blocking_incidents": self.blocking_incidents
+        }
+        # Una lista vacía diría "no hubo pasos lentos" cuando no se midieron
+        if self.slow_steps_unavailable_reason is not None:
+            report["slow_steps"] = None
+            report["slow_steps_unavailable_reason"] = self.slow_steps_unavailable_reason
+        return report
+
+
+class LoopProfiler:
+    """Profiler del event loop; solo puede haber una sesión a la vez"""
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+
+    @property
+    def running(self) -> bool:
+        return self.session is not None
+
+    def _patch_handles(self, session: ProfileSession):
+        """
+        Cronometra cada Handle._run del loop de asyncio durante la sesión.
+        Otros loops (uvloop) usan sus propios handles: ahí no se parchea nada.
+        """
+        loop = asyncio.get_running_loop()
+        if not isinstance(loop, asyncio.BaseEventLoop):
+            loop_type = f"{type(loop).__module__}.{type(loop).__qualname__}"
+            session.slow_steps_unavailable_reason = f"El loop {loop_type} no usa los handles de asyncio"
+            logger.warning("Pasos lentos no disponibles con %s: solo muestreo y bloqueos", loop_type)
+            return None
+
+        original_run = asyncio.events.Handle._run
+        threshold = settings.profiler_slow_step_ms / 1000.0
+
+        def timed_run(handle):
+            start = time.perf_counter()
+            try:
+                original_run(handle)
+            finally:
+                duration = time.perf_counter() - start
+                if duration >= threshold:
+                    session.record_step(duration, handle)
+
+        asyncio.events.Handle._run = timed_run
+        return original_run
+
+    async def profile(self, seconds: float) -> dict:
+        """
+        Perfila el event loop actual durante `seconds` segundos sin bloquearlo.
+
+        Returns:
+            dict: Pilas colapsadas, pasos más lentos e incidentes de bloqueo
+        """
+        if self.session is not None:
+            raise RuntimeError("Ya hay una sesión de perfilado en curso")
+
+        session = ProfileSession(
+            loop_thread_id=threading.get_ident(),
+            interval=settings.profiler_sample_interval_ms / 1000.0,
+            block_threshold=settings.profiler_block_threshold_ms / 1000.0
+        )
+        self.session = session
+        original_run = self._patch_handles(session)
+        sampler = threading.Thread(target=session.sample_loop, name="loop-profiler", daemon=True)
+        sampler.start()
+        logger.info("Perfilado del event loop iniciado (%ss)", seconds)
+
+        try:
+            # Latido: si el loop se bloquea, el muestreador lo nota
+            deadline = time.perf_counter() + seconds
+            beat = min(session.block_threshold / 4, 0.01)
+            while time.perf_counter() < deadline:
+                session.heartbeat = time.perf_counter()
+                await asyncio.sleep(beat)
+        finally:
+            session.stopped.set()
+            if original_run is not None:
+                asyncio.events.Handle._run = original_run
+            await asyncio.to_thread(sampler.join)
+            self.session = None
+            logger.info("Perfilado del event loop terminado")
+
+        return session.report(seconds)
+
+    async def profile_to_file(self, seconds: float) -> Optional[str]:
+        """Perfila y guarda el resultado en `profiler_output_dir` (usado por la señal)"""
+        try:
+            report = await self.profile(seconds)
+        except RuntimeError as e:
+            logger.warning(f"Perfilado ignorado: {e}")
+            return None
+
+        os.makedirs(settings.profiler_output_dir, exist_ok=True)
+        base = os.path.join(
+            settings.profiler_output_dir,
+            f"profile-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}"
+        )
+        with open(f"{base}.collapsed", "w") as f:
+            f.write(report.pop("collapsed") + "\n")
+        with open(f"{base}.json", "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Perfil guardado en {base}.collapsed / {base}.json")
+        return base
+
+    def handle_signal(self):
+        """Handler de la señal POSIX: lanza una sesión en background"""
+        asyncio.get_running_loop().create_task(
+            self.profile_to_file(settings.profiler_signal_seconds)
+        )
+
+    def install_signal_handler(self):
+        """Registra el handler de `profiler_signal` (ej: kill -USR1 <pid>)"""
+        import signal
+
+        signum = getattr(signal, settings.profiler_signal, None)
+        if signum is None:
+            logger.warning(f"Señal {settings.profiler_signal} no disponible en esta plataforma")
+            return
+        try:
+            asyncio.get_running_loop().add_signal_handler(signum, self.handle_signal)
+            logger.info(f"Profiler disponible con la señal {settings.profiler_signal}")
+        except (NotImplementedError, RuntimeError, ValueError) as e:
+            # Windows o loop fuera del hilo principal
+            logger.warning(f"No se pudo registrar la señal del profiler: {e}")
+
+
+# Instancia global del profiler
+loop_profiler = LoopProfiler()
@@ -0,0 +1,210 @@
+"""
+Intervalo de envío de GPS recomendado por sala (RATE_HINT).
+
+Cada tick se calcula para cada sala con sockets un intervalo a partir de
+tres presiones, cada una relativa a su objetivo configurado:
+
+- Tamaño de la sala: con N miembros cada uno recibe N / intervalo mensajes
+  por segundo; escalar el intervalo con N mantiene constante lo que recibe
+  cada teléfono (y el coste total del reenvío, N² / intervalo, crece solo
+  linealmente).
+- Latencia de reenvío de la sala: p95 de las últimas medidas.
+- Lag del event loop (global): último valor del monitor de métricas.
+
+intervalo = rate_hint_min_interval_ms * max(1, mayor presión), acotado a
+[min, max] y redondeado a pasos de rate_hint_step_ms.
+
+Histéresis: si la carga sube, el nuevo intervalo se envía en cuanto supera
+en `rate_hint_hysteresis` al actual (descargar rápido); si baja, solo cuando
+pasaron `rate_hint_relax_seconds` desde el último cambio (no oscilar).
+Los sockets nuevos reciben el intervalo vigente al conectarse.
+
+El p95 de cada sala se recalcula solo si llegaron medidas desde el último
+tick, y el tick recorre las salas en bloques de `rate_hint_chunk_size`
+cediendo el event loop entre ellos: el lag que mide no lo provoca él.
+"""
+
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+from app.core.config import settings
+from app.core.connection_manager import connection_manager
+from app.core.metrics import event_loop_lag_last
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Medidas de latencia de reenvío que se guardan por sala
+FANOUT_SAMPLES = 256
+
+
+class RoomRate:
+    """Latencias de reenvío recientes e intervalo vigente de una sala"""
+
+    __slots__ = ("fanout_samples", "interval_ms", "reason", "changed_at", "_p95", "_stale")
+
+    def __init__(self):
+        self.fanout_samples: Deque[float] = deque(maxlen=FANOUT_SAMPLES)
+        self.interval_ms = settings.rate_hint_min_interval_ms
+        self.reason = "default"
+        self.changed_at = 0.0
+        self._p95 = 0.0
+        self._stale = False  # Llegaron medidas desde el último cálculo del p95
+
+    def observe(self, seconds: float):
+        self.fanout_samples.append(seconds)
+        self._stale = True
+
+    def fanout_p95(self) -> float:
+        """p95 de las medidas recientes; solo se ordena si hubo medidas nuevas"""
+        if self._stale:
+            ordered = sorted(self.fanout_samples)
+            self._p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            self._stale = False
+        return self._p95
+
+
+def recommended_interval(room_size: int, fanout_p95_s: float, loop_lag_s: float) -> Tuple[int, str]:
+    """
+    Intervalo recomendado y la presión que lo determina.
+
+    Returns:
+        Tuple[int, str]: (intervalo en ms, "room_size" | "fanout_latency" | "loop_lag" | "default")
+    """
+    pressures = {
+        "room_size": room_size / settings.rate_hint_room_size_target,
+        "fanout_latency": fanout_p95_s * 1000 / settings.rate_hint_fanout_p95_target_ms,
+        "loop_lag": loop_lag_s * 1000 / settings.rate_hint_loop_lag_target_ms,
+    }
+    reason = max(pressures, key=pressures.get)
+    load = pressures[reason]
+    if load <= 1:
+        return settings.rate_hint_min_interval_ms, "default"
+
+    step = settings.rate_hint_step_ms
+    interval = settings.rate_hint_min_interval_ms * load
+    interval = int(round(interval / step) * step)
+    return max(settings.rate_hint_min_interval_ms, min(interval, settings.rate_hint_max_interval_ms)), reason
+
+
+class RateHintManager:
+    """Calcula y envía el intervalo recomendado de cada sala"""
+
+    def __init__(self):
+        self.rooms: Dict[str, RoomRate] = {}
+        self._tick_task: Optional[asyncio.Task] = None
+        self.hints_sent = 0
+
+    def observe_fanout(self, room_code: str, seconds: float):
+        """Registra cuánto tardó un reenvío en la sala (O(1))"""
+        if not settings.rate_hint_enabled:
+            return
+        room = self.rooms.get(room_code)
+        if room is None:
+            room = self.rooms[room_code] = RoomRate()
+        room.observe(seconds)
+
+    def hint_message(self, room_code: str) -> str:
+        room = self.rooms.get(room_code)
+        interval_ms = room.interval_ms if room is not None else settings.rate_hint_min_interval_ms
+        reason = room.reason if room is not None else "default"
+        return json.dumps({"event": "RATE_HINT", "data": {"interval_ms": interval_ms, "reason": reason}})
+
+    def _next_interval(self, room: RoomRate, interval_ms: int, now: float) -> bool:
+        """Aplica la histéresis; True si el intervalo vigente cambió"""
+        current = room.interval_ms
+        if interval_ms > current * (1 + settings.rate_hint_hysteresis):
+            pass  # Subir de inmediato
+        elif interval_ms < current * (1 - settings.rate_hint_hysteresis) or (
+            interval_ms < current and interval_ms == settings.rate_hint_min_interval_ms
+        ):
+            if now - room.changed_at < settings.rate_hint_relax_seconds:
+                return False
+        else:
+            return False
+        room.interval_ms = interval_ms
+        room.changed_at = now
+        return True
+
+    def _tick_room(self, room_code: str, loop_lag: float, now: float) -> bool:
+        """Recalcula el intervalo de una sala; True si se le envió RATE_HINT"""
+        connections = connection_manager.rooms.get(room_code)
+        if not connections:
+            self.rooms.pop(room_code, None)
+            return False
+        room = self.rooms.get(room_code)
+        if room is None:
+            room = self.rooms[room_code] = RoomRate()
+        interval_ms, reason = recommended_interval(len(connections), room.fanout_p95(), loop_lag)
+        if not self._next_interval(room, interval_ms, now):
+            return False
+        room.reason = reason
+        connection_manager.broadcast(room_code, self.hint_message(room_code))
+        logger.info(
+            "RATE_HINT en sala %s: %d ms (%s)", room_code, interval_ms, reason,
+            extra={"event": "ws.rate_hint", "room": room_code}
+        )
+        return True
+
+    async def tick(self) -> int:
+        """
+        Recalcula el intervalo de cada sala con sockets y envía RATE_HINT si
+        cambió, en bloques de `rate_hint_chunk_size` salas.
+
+        Returns:
+            int: Número de salas a las que se envió
+        """
+        loop_lag = event_loop_lag_last.value
+        # Salas con sockets y salas con medidas que quizá ya no tengan sockets
+        room_codes = list(connection_manager.rooms.keys() | self.rooms.keys())
+        chunk_size = settings.rate_hint_chunk_size
+        sent = 0
+        for start in range(0, len(room_codes), chunk_size):
+            now = time.monotonic()
+            for room_code in room_codes[start:start + chunk_size]:
+                sent += self._tick_room(room_code, loop_lag, now)
+            await asyncio.sleep(0)
+        self.hints_sent += sent
+        return sent
+
+    async def run_tick_loop(self):
+        """Tarea en background que ajusta los intervalos"""
+        while True:
+            try:
+                await asyncio.sleep(settings.rate_hint_tick_seconds)
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error al calcular RATE_HINT: {e}")
+
+    def start_tick_task(self):
+        """Inicia el ajuste periódico (si está activado)"""
+        if not settings.rate_hint_enabled:
+            return
+        if self._tick_task is None or self._tick_task.done():
+            self._tick_task = asyncio.create_task(self.run_tick_loop())
+            logger.info("Ajuste de RATE_HINT iniciado")
+
+    def stop_tick_task(self):
+        """Detiene el ajuste periódico"""
+        if self._tick_task and not self._tick_task.done():
+            self._tick_task.cancel()
+            logger.info("Ajuste de RATE_HINT detenido")
+
+    def get_stats(self) -> dict:
+        """Obtiene estadísticas de los intervalos recomendados"""
+        throttled = [room.interval_ms for room in self.rooms.values()
+                     if room.interval_ms > settings.rate_hint_min_interval_ms]
+        return {
+            "rooms": len(self.rooms),
+            "throttled_rooms": len(throttled),
+            "max_interval_ms": max(throttled, default=settings.rate_hint_min_interval_ms),
+            "hints_sent": self.hints_sent
+        }
+
+
+# Instancia global de los intervalos recomendados
+rate_hints = RateHintManager()
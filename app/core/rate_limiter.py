@@ -0,0 +1,239 @@
+"""
+Limitador de peticiones en memoria basado en cubetas de tokens (token bucket).
+
+Cada combinación (ámbito, clave) tiene su propia cubeta. Las cubetas se
+recargan de forma perezosa al consultarlas, así que no hay ninguna tarea
+recorriendo todas las cubetas en cada tick; las que quedan llenas (inactivas)
+se desalojan periódicamente para no crecer sin límite. El desalojo lo hace
+una tarea en background por bloques, cediendo el event loop entre ellos: en
+una ráfaga desde miles de IPs ninguna petición paga el recorrido completo.
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+from fastapi import HTTPException, Request, status
+from app.core.config import settings
+import asyncio
+import math
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Cubeta de tokens compacta (solo dos floats gracias a __slots__)"""
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class RateLimiter:
+    """
+    Limitador de peticiones por ámbito (login, register, room_create,
+    location_batch) y clave (IP del cliente o identificador de usuario).
+
+    Los límites de cada ámbito se leen de Settings:
+    `rate_limit_<ámbito>_per_minute` y `rate_limit_<ámbito>_burst`.
+    """
+
+    def __init__(self):
+        self.buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self.allowed: Dict[str, int] = {}
+        self.rejections: Dict[str, int] = {}
+        self.evicted = 0
+        self._eviction_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def get_limits(scope: str) -> Tuple[float, float]:
+        """
+        Obtiene los límites configurados para un ámbito.
+
+        Returns:
+            Tuple[float, float]: (tokens por segundo, capacidad de la cubeta)
+        """
+        per_minute = getattr(settings, f"rate_limit_{scope}_per_minute")
+        burst = getattr(settings, f"rate_limit_{scope}_burst")
+        return per_minute / 60.0, float(burst)
+
+    def hit(self, scope: str, key: str, now: Optional[float] = None) -> float:
+        """
+        Consume un token de la cubeta (scope, key).
+
+        Returns:
+            float: 0.0 si la petición se permite, o los segundos que hay que
+            esperar hasta que haya un token disponible si se rechaza
+        """
+        if now is None:
+            now = time.monotonic()
+
+        rate, capacity = self.get_limits(scope)
+        bucket = self.buckets.get((scope, key))
+
+        if bucket is None:
+            # Cubeta nueva: empieza llena y se consume el primer token
+            self.buckets[(scope, key)] = TokenBucket(capacity - 1.0, now)
+            self.allowed[scope] = self.allowed.get(scope, 0) + 1
+            return 0.0
+
+        # Recarga perezosa según el tiempo transcurrido
+        tokens = bucket.tokens + (now - bucket.updated_at) * rate
+        if tokens > capacity:
+            tokens = capacity
+        bucket.updated_at = now
+
+        if tokens >= 1.0:
+            bucket.tokens = tokens - 1.0
+            self.allowed[scope] = self.allowed.get(scope, 0) + 1
+            return 0.0
+
+        bucket.tokens = tokens
+        self.rejections[scope] = self.rejections.get(scope, 0) + 1
+        return (1.0 - tokens) / rate if rate > 0 else float(settings.rate_limit_eviction_interval_seconds)
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """
+        Elimina las cubetas que ya se habrían recargado por completo.
+        Una cubeta llena equivale a no tener cubeta, así que borrarla no
+        cambia el comportamiento del limitador.
+
+        Returns:
+            int: Número de cubetas eliminadas
+        """
+        if now is None:
+            now = time.monotonic()
+        evicted = self._evict_keys(list(self.buckets), now)
+        if evicted:
+            logger.debug("Rate limiter: %d cubetas inactivas eliminadas", evicted)
+        return evicted
+
+    def _evict_keys(self, keys: Iterable[Tuple[str, str]], now: float) -> int:
+        """Elimina, de las cubetas indicadas, las que ya estarían llenas"""
+        buckets = self.buckets
+        limits: Dict[str, Tuple[float, float]] = {}
+        evicted = 0
+        for bucket_key in keys:
+            bucket = buckets.get(bucket_key)
+            if bucket is None:
+                continue
+            scope = bucket_key[0]
+            if scope not in limits:
+                limits[scope] = self.get_limits(scope)
+            rate, capacity = limits[scope]
+            if bucket.tokens + (now - bucket.updated_at) * rate >= capacity:
+                del buckets[bucket_key]
+                evicted += 1
+        self.evicted += evicted
+        return evicted
+
+    async def run_eviction_loop(self):
+        """
+        Tarea que desaloja las cubetas inactivas cada
+        `rate_limit_eviction_interval_seconds`, en bloques de
+        `rate_limit_eviction_chunk_size` cediendo el event loop entre ellos
+        """
+        while True:
+            try:
+                await asyncio.sleep(settings.rate_limit_eviction_interval_seconds)
+                # Copia de las claves: las peticiones pueden crear cubetas entre bloques
+                keys = list(self.buckets)
+                chunk_size = settings.rate_limit_eviction_chunk_size
+                evicted = 0
+                for start in range(0, len(keys), chunk_size):
+                    evicted += self._evict_keys(keys[start:start + chunk_size], time.monotonic())
+                    await asyncio.sleep(0)
+                if evicted:
+                    logger.debug("Rate limiter: %d cubetas inactivas eliminadas", evicted)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error al desalojar cubetas del rate limiter: {e}")
+
+    def start_eviction_task(self):
+        """Inicia el desalojo periódico de cubetas inactivas (si el limitador está activo)"""
+        if not settings.rate_limit_enabled:
+            return
+        if self._eviction_task is None or self._eviction_task.done():
+            self._eviction_task = asyncio.create_task(self.run_eviction_loop())
+            logger.info("Desalojo de cubetas del rate limiter iniciado")
+
+    def stop_eviction_task(self):
+        """Detiene el desalojo periódico"""
+        if self._eviction_task and not self._eviction_task.done():
+            self._eviction_task.cancel()
+            logger.info("Desalojo de cubetas del rate limiter detenido")
+
+    def reset(self):
+        """Vacía todas las cubetas y contadores"""
+        self.buckets.clear()
+        self.allowed.clear()
+        self.rejections.clear()
+        self.evicted = 0
+
+    def get_stats(self) -> dict:
+        """Obtiene estadísticas del limitador"""
+        return {
+            "enabled": settings.rate_limit_enabled,
+            "active_buckets": len(self.buckets),
+            "evicted_buckets": self.evicted,
+            "allowed": dict(self.allowed),
+            "rejected": dict(self.rejections)
+        }
+
+
+def get_client_ip(request: Request) -> str:
+    """
+    Obtiene la IP del cliente.
+    Detrás de nginx se usan las cabeceras X-Real-IP / X-Forwarded-For
+    solo si `rate_limit_trust_proxy_headers` está activado.
+    """
+    if settings.rate_limit_trust_proxy_headers:
+        real_ip = request.headers.get("x-real-ip")
+        if real_ip:
+            return real_ip.strip()
+        forwarded_for = request.headers.get("x-forwarded-for")
+        if forwarded_for:
+            return forwarded_for.split(",")[0].strip()
+    if request.client:
+        return request.client.host
+    return "unknown"
+
+
+def enforce_rate_limit(scope: str, key: str):
+    """
+    Consume un token y lanza HTTP 429 si la cubeta está vacía.
+
+    Uso en endpoints para limitar por usuario (además de por IP):
+        enforce_rate_limit("login", f"user:{request.email.lower()}")
+    """
+    if not settings.rate_limit_enabled:
+        return
+
+    retry_after = rate_limiter.hit(scope, key)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiadas peticiones, intenta de nuevo más tarde",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+def rate_limit(scope: str):
+    """
+    Crea una dependency que limita las peticiones por IP del cliente.
+
+    Uso en endpoints:
+        @router.post("/login", dependencies=[Depends(rate_limit("login"))])
+    """
+    # Validar el ámbito al registrar la ruta y no en la primera petición
+    RateLimiter.get_limits(scope)
+
+    async def dependency(request: Request):
+        enforce_rate_limit(scope, f"ip:{get_client_ip(request)}")
+
+    return dependency
+
+
+# Instancia global del limitador
+rate_limiter = RateLimiter()
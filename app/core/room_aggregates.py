@@ -0,0 +1,267 @@
+"""
+Agregados por sala (centroide, bounding box y dispersión) mantenidos de
+forma incremental con cada UPDATE_LOCATION.
+
+- Centroide y dispersión: sumas acumuladas de lat/lon y de sus cuadrados
+  (relativas a la primera ubicación de la sala para no perder precisión).
+  Al moverse un miembro se resta su aporte anterior y se suma el nuevo: O(1).
+  Cada `room_aggregates_rebuild_updates` actualizaciones las sumas se
+  recalculan desde cero para que no se acumule error de redondeo.
+- Bounding box: se amplía en O(1) si la nueva posición queda fuera. Solo si
+  el miembro que estaba en el borde se mueve hacia dentro (o se va) la caja
+  se marca como sucia y se recalcula al leerla (O(N), pocas veces).
+
+La dispersión es la distancia cuadrática media al centroide, en metros
+(proyección equirectangular alrededor de la latitud de referencia). No se
+contemplan salas que crucen el antimeridiano.
+
+Cada `room_aggregates_interval_seconds` se envía ROOM_AGGREGATES a las salas
+cuyos agregados cambiaron desde el último envío. Solo se recorren esas salas,
+por bloques, cediendo el event loop entre uno y otro.
+"""
+
+from typing import Dict, Optional, Set, Tuple
+from app.core.config import settings
+from app.core.connection_manager import connection_manager
+from app.services.polyline import EARTH_RADIUS_METERS
+import asyncio
+import json
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+
+class RoomAggregate:
+    """Sumas acumuladas y bounding box de las posiciones de una sala"""
+
+    __slots__ = (
+        "ref_lat", "ref_lon", "kx", "ky", "positions",
+        "sum_lat", "sum_lon", "sum_lat2", "sum_lon2",
+        "bbox", "bbox_dirty", "version", "updates_since_rebuild",
+    )
+
+    def __init__(self, ref_lat: float, ref_lon: float):
+        self.ref_lat = ref_lat
+        self.ref_lon = ref_lon
+        self.kx = EARTH_RADIUS_METERS * math.cos(math.radians(ref_lat)) * math.pi / 180.0
+        self.ky = EARTH_RADIUS_METERS * math.pi / 180.0
+        # Posición de cada miembro relativa a la referencia: (dlat, dlon)
+        self.positions: Dict[str, Tuple[float, float]] = {}
+        self.sum_lat = 0.0
+        self.sum_lon = 0.0
+        self.sum_lat2 = 0.0
+        self.sum_lon2 = 0.0
+        # [min_dlat, min_dlon, max_dlat, max_dlon]
+        self.bbox: Optional[list] = None
+        self.bbox_dirty = False
+        self.version = 0
+        self.updates_since_rebuild = 0
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def _add(self, dlat: float, dlon: float):
+        self.sum_lat += dlat
+        self.sum_lon += dlon
+        self.sum_lat2 += dlat * dlat
+        self.sum_lon2 += dlon * dlon
+
+    def _subtract(self, dlat: float, dlon: float):
+        self.sum_lat -= dlat
+        self.sum_lon -= dlon
+        self.sum_lat2 -= dlat * dlat
+        self.sum_lon2 -= dlon * dlon
+
+    def _on_bbox_edge(self, dlat: float, dlon: float) -> bool:
+        bbox = self.bbox
+        return bbox is not None and (dlat == bbox[0] or dlon == bbox[1] or dlat == bbox[2] or dlon == bbox[3])
+
+    def update(self, username: str, lat: float, lon: float):
+        """Registra la nueva posición de un miembro en O(1)"""
+        dlat, dlon = lat - self.ref_lat, lon - self.ref_lon
+        old = self.positions.get(username)
+        if old is not None:
+            self._subtract(*old)
+            # Si el que se mueve definía un borde, la caja puede encogerse
+            if not self.bbox_dirty and self._on_bbox_edge(*old):
+                self.bbox_dirty = True
+        self.positions[username] = (dlat, dlon)
+        self._add(dlat, dlon)
+
+        bbox = self.bbox
+        if bbox is None:
+            if not self.bbox_dirty:
+                self.bbox = [dlat, dlon, dlat, dlon]
+        elif not self.bbox_dirty:
+            if dlat < bbox[0]:
+                bbox[0] = dlat
+            elif dlat > bbox[2]:
+                bbox[2] = dlat
+            if dlon < bbox[1]:
+                bbox[1] = dlon
+            elif dlon > bbox[3]:
+                bbox[3] = dlon
+
+        self.version += 1
+        self.updates_since_rebuild += 1
+        if self.updates_since_rebuild >= settings.room_aggregates_rebuild_updates:
+            self.rebuild_sums()
+
+    def remove(self, username: str) -> bool:
+        old = self.positions.pop(username, None)
+        if old is None:
+            return False
+        self._subtract(*old)
+        if self._on_bbox_edge(*old):
+            self.bbox_dirty = True
+        self.version += 1
+        return True
+
+    def rebuild_sums(self):
+        """Recalcula las sumas desde cero (descarta el error de redondeo acumulado)"""
+        self.sum_lat = self.sum_lon = self.sum_lat2 = self.sum_lon2 = 0.0
+        for dlat, dlon in self.positions.values():
+            self._add(dlat, dlon)
+        self.updates_since_rebuild = 0
+
+    def _rebuild_bbox(self):
+        if self.positions:
+            dlats = [position[0] for position in self.positions.values()]
+            dlons = [position[1] for position in self.positions.values()]
+            self.bbox = [min(dlats), min(dlons), max(dlats), max(dlons)]
+        else:
+            self.bbox = None
+        self.bbox_dirty = False
+
+    def snapshot(self) -> Optional[dict]:
+        """
+        Agregados actuales (la caja se recalcula aquí si quedó sucia).
+
+        Returns:
+            Optional[dict]: count, centroid, bbox y spread_m; None si no hay posiciones
+        """
+        count = len(self.positions)
+        if not count:
+            return None
+        if self.bbox_dirty or self.bbox is None:
+            self._rebuild_bbox()
+
+        mean_lat = self.sum_lat / count
+        mean_lon = self.sum_lon / count
+        # Varianza por eje en grados² (puede salir mínimamente negativa por redondeo)
+        var_lat = max(0.0, self.sum_lat2 / count - mean_lat * mean_lat)
+        var_lon = max(0.0, self.sum_lon2 / count - mean_lon * mean_lon)
+        min_dlat, min_dlon, max_dlat, max_dlon = self.bbox
+        return {
+            "count": count,
+            "centroid": {"lat": self.ref_lat + mean_lat, "lon": self.ref_lon + mean_lon},
+            "bbox": {
+                "min_lat": self.ref_lat + min_dlat,
+                "min_lon": self.ref_lon + min_dlon,
+                "max_lat": self.ref_lat + max_dlat,
+                "max_lon": self.ref_lon + max_dlon
+            },
+            "spread_m": round(math.sqrt(var_lat * self.ky * self.ky + var_lon * self.kx * self.kx), 1)
+        }
+
+
+class RoomAggregatesRegistry:
+    """Agregados de todas las salas y la tarea que los envía periódicamente"""
+
+    def __init__(self):
+        self.rooms: Dict[str, RoomAggregate] = {}
+        # Salas cuyos agregados cambiaron desde el último ROOM_AGGREGATES
+        self.changed: Set[str] = set()
+        self._broadcast_task: Optional[asyncio.Task] = None
+        self.events_sent = 0
+
+    def update(self, room_code: str, username: str, lat: float, lon: float):
+        """Actualiza la posición de un miembro (crea los agregados de la sala si no existen)"""
+        if not settings.room_aggregates_enabled:
+            return
+        aggregate = self.rooms.get(room_code)
+        if aggregate is None:
+            aggregate = self.rooms[room_code] = RoomAggregate(lat, lon)
+        aggregate.update(username, lat, lon)
+        self.changed.add(room_code)
+
+    def remove(self, room_code: str, username: str):
+        """Quita a un miembro; borra los agregados si la sala queda vacía"""
+        aggregate = self.rooms.get(room_code)
+        if aggregate is None or not aggregate.remove(username):
+            return
+        if aggregate:
+            self.changed.add(room_code)
+        else:
+            del self.rooms[room_code]
+            self.changed.discard(room_code)
+
+    def get(self, room_code: str) -> Optional[dict]:
+        aggregate = self.rooms.get(room_code)
+        return aggregate.snapshot() if aggregate is not None else None
+
+    async def broadcast_changed(self) -> int:
+        """
+        Envía ROOM_AGGREGATES a las salas cuyos agregados cambiaron.
+        Recorre solo esas salas, por bloques, y cede el event loop entre uno y otro.
+
+        Returns:
+            int: Número de salas a las que se envió
+        """
+        sent = 0
+        room_codes = list(self.changed)
+        self.changed.clear()
+        chunk_size = max(1, settings.room_aggregates_chunk_size)
+        for i in range(0, len(room_codes), chunk_size):
+            if i:
+                await asyncio.sleep(0)
+            for room_code in room_codes[i:i + chunk_size]:
+                # Pudo quedarse vacía mientras se cedía el loop
+                aggregate = self.rooms.get(room_code)
+                if aggregate is None:
+                    continue
+                snapshot = aggregate.snapshot()
+                if snapshot is None:
+                    continue
+                connection_manager.broadcast(room_code, json.dumps({"event": "ROOM_AGGREGATES", "data": snapshot}))
+                sent += 1
+        self.events_sent += sent
+        return sent
+
+    async def run_broadcast_loop(self):
+        """Tarea en background que envía los agregados que cambiaron"""
+        while True:
+            try:
+                await asyncio.sleep(settings.room_aggregates_interval_seconds)
+                await self.broadcast_changed()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error al enviar agregados de salas: {e}")
+
+    def start_broadcast_task(self):
+        """Inicia el envío periódico (si está activado)"""
+        if not settings.room_aggregates_enabled:
+            return
+        if self._broadcast_task is None or self._broadcast_task.done():
+            self._broadcast_task = asyncio.create_task(self.run_broadcast_loop())
+            logger.info("Envío de agregados de salas iniciado")
+
+    def stop_broadcast_task(self):
+        """Detiene el envío periódico"""
+        if self._broadcast_task and not self._broadcast_task.done():
+            self._broadcast_task.cancel()
+            logger.info("Envío de agregados de salas detenido")
+
+    def get_stats(self) -> dict:
+        """Obtiene estadísticas de los agregados"""
+        return {
+            "rooms": len(self.rooms),
+            "dirty_bboxes": sum(1 for aggregate in self.rooms.values() if aggregate.bbox_dirty),
+            "events_sent": self.events_sent
+        }
+
+
+# Instancia global de los agregados por sala
+room_aggregates = RoomAggregatesRegistry()
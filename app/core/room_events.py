@@ -0,0 +1,187 @@
+"""
+Registro de eventos por sala con números de secuencia, para reanudar tras
+una reconexión sin perder nada.
+
+Los eventos que van a toda la sala (FRIEND_MOVED sin política de reenvío,
+FRIENDS_MOVED, FRIEND_DISCONNECTED, GEOFENCE_ENTER/EXIT) llevan un campo
+`seq` creciente y se guardan ya serializados en un buffer circular de los
+últimos `room_event_buffer_size` de la sala.
+
+Al reconectar con `?last_seq=N`:
+- si N sigue en el buffer, el socket recibe un único REPLAY con los eventos
+  posteriores a N, en orden;
+- si no (se perdieron más eventos de los que caben, o la secuencia es de
+  otro proceso), recibe RESYNC con el estado completo de la sala.
+
+La secuencia de cada registro empieza en el instante de su creación en
+microsegundos: un registro nuevo (sala recreada o servidor reiniciado)
+siempre empieza por encima de cualquier número que tuviera un cliente, así
+que nunca se confunde con un hueco pequeño. Los registros de salas sin
+sockets se conservan `room_event_retention_seconds` (tormentas de
+reconexión en las que todos caen a la vez).
+"""
+
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.connection_manager import connection_manager
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RoomEventLog:
+    """Secuencia y buffer circular de los eventos de una sala"""
+
+    __slots__ = ("seq", "events", "last_event_at")
+
+    def __init__(self):
+        self.seq = time.time_ns() // 1000
+        self.events: Deque[Tuple[int, str]] = deque(maxlen=settings.room_event_buffer_size)
+        self.last_event_at = time.monotonic()
+
+    def append(self, event: dict) -> str:
+        """Asigna el siguiente número de secuencia y guarda el evento serializado"""
+        self.seq += 1
+        event["seq"] = self.seq
+        message = json.dumps(event)
+        self.events.append((self.seq, message))
+        self.last_event_at = time.monotonic()
+        return message
+
+    def since(self, last_seq: int) -> Optional[List[str]]:
+        """
+        Eventos posteriores a last_seq.
+
+        Returns:
+            Optional[List[str]]: Los eventos (puede ser vacía), o None si hay
+            un hueco que el buffer ya no cubre
+        """
+        if last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+        if not self.events or last_seq < self.events[0][0] - 1:
+            return None
+        # Los números son consecutivos: el evento last_seq + 1 está en una posición conocida
+        start = last_seq + 1 - self.events[0][0]
+        return [message for _, message in islice(self.events, start, None)]
+
+
+class RoomEventRegistry:
+    """Registros de eventos de todas las salas"""
+
+    def __init__(self):
+        self.rooms: Dict[str, RoomEventLog] = {}
+        self._cleanup_task: Optional[asyncio.Task] = None
+        self.replays = 0
+        self.replayed_events = 0
+        self.resyncs = 0
+
+    def record(self, room_code: str, event: dict) -> str:
+        """
+        Numera un evento de la sala y lo guarda.
+
+        Returns:
+            str: El evento serializado (con `seq`), listo para el broadcast
+        """
+        log = self.rooms.get(room_code)
+        if log is None:
+            log = self.rooms[room_code] = RoomEventLog()
+        return log.append(event)
+
+    def broadcast(self, room_code: str, event: dict, exclude=None) -> int:
+        """Numera el evento y lo envía a toda la sala"""
+        return connection_manager.broadcast(room_code, self.record(room_code, event), exclude=exclude)
+
+    def current_seq(self, room_code: str) -> Optional[int]:
+        log = self.rooms.get(room_code)
+        return log.seq if log is not None else None
+
+    def replay(self, room_code: str, last_seq: int) -> Optional[str]:
+        """
+        Mensaje REPLAY con los eventos posteriores a last_seq.
+
+        Returns:
+            Optional[str]: El REPLAY, o None si hace falta un RESYNC
+        """
+        log = self.rooms.get(room_code)
+        if log is None:
+            return None
+        missed = log.since(last_seq)
+        if missed is None:
+            return None
+        self.replays += 1
+        self.replayed_events += len(missed)
+        # Los eventos ya están serializados: se concatenan sin volver a codificarlos
+        return (
+            '{"event": "REPLAY", "seq": ' + str(log.seq) +
+            ', "data": {"events": [' + ", ".join(missed) + "]}}"
+        )
+
+    def resync(self, room_code: str, state: dict) -> str:
+        """Mensaje RESYNC con el estado completo y la secuencia desde la que seguir"""
+        log = self.rooms.get(room_code)
+        if log is None:
+            log = self.rooms[room_code] = RoomEventLog()
+        self.resyncs += 1
+        return json.dumps({"event": "RESYNC", "seq": log.seq, "data": state})
+
+    def purge_idle(self, now: Optional[float] = None) -> int:
+        """
+        Borra los registros de salas sin sockets y sin eventos recientes.
+
+        Returns:
+            int: Número de registros borrados
+        """
+        if now is None:
+            now = time.monotonic()
+        idle = [
+            room_code for room_code, log in self.rooms.items()
+            if room_code not in connection_manager.rooms
+            and now - log.last_event_at > settings.room_event_retention_seconds
+        ]
+        for room_code in idle:
+            del self.rooms[room_code]
+        return len(idle)
+
+    async def run_cleanup_loop(self):
+        """Tarea en background que borra los registros de salas inactivas"""
+        while True:
+            try:
+                await asyncio.sleep(settings.room_cleanup_interval_seconds)
+                self.purge_idle()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error al limpiar registros de eventos: {e}")
+
+    def start_cleanup_task(self):
+        """Inicia la limpieza periódica"""
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.create_task(self.run_cleanup_loop())
+            logger.info("Limpieza de registros de eventos iniciada")
+
+    def stop_cleanup_task(self):
+        """Detiene la limpieza periódica"""
+        if self._cleanup_task and not self._cleanup_task.done():
+            self._cleanup_task.cancel()
+            logger.info("Limpieza de registros de eventos detenida")
+
+    def get_stats(self) -> dict:
+        """Obtiene estadísticas de los registros de eventos"""
+        return {
+            "rooms": len(self.rooms),
+            "buffered_events": sum(len(log.events) for log in self.rooms.values()),
+            "replays": self.replays,
+            "replayed_events": self.replayed_events,
+            "resyncs": self.resyncs
+        }
+
+
+# Instancia global de los registros de eventos por sala
+room_events = RoomEventRegistry()
@@ -1,26 +1,31 @@
-from typing import Dict, Optional
+from typing import Iterable, List, Optional, Set, Tuple
 from datetime import datetime, timedelta
 from app.models.room import Room, RoomUser
 from app.core.config import settings
+from app.core.room_store import RoomStore, create_room_store
 import asyncio
+import json
 import logging
+import os
+import tempfile
 
 logger = logging.getLogger(__name__)
 
 
 class RoomManager:
     """
-    Gestor centralizado de salas activas en memoria.
-    Maneja la limpieza automática de salas vacías.
+    Gestor centralizado de salas activas.
+    Las salas viven en un RoomStore (ver app/core/room_store.py): en memoria
+    del proceso o compartidas entre workers. Maneja la limpieza automática
+    de salas vacías.
     """
     
-    def __init__(self):
-        self.rooms: Dict[str, Room] = {}
-        self.user_to_room: Dict[int, str] = {}  # Mapeo user_id -> room_code
+    def __init__(self, store: Optional[RoomStore] = None):
+        self.store = store if store is not None else create_room_store()
         self._cleanup_task: Optional[asyncio.Task] = None
     
-    def create_room(self, code: str) -> Room:
-        """Crea una nueva sala"""
+    def create_room(self, code: str) -> Optional[Room]:
+        """Crea una nueva sala (None si el código ya está ocupado)"""
         now = datetime.utcnow()
         room = Room(
             code=code,
@@ -28,50 +33,62 @@ class RoomManager:
             last_activity=now,
             users=[]
         )
-        self.rooms[code] = room
-        logger.info(f"Sala creada: {code}")
+        if not self.store.create_room(room):
+            return None
+        logger.info("Sala creada: %s", code, extra={"event": "room.create", "room": code})
         return room
     
     def get_room(self, code: str) -> Optional[Room]:
-        """Obtiene una sala por su código"""
-        return self.rooms.get(code)
+        """Obtiene una sala por su código (de solo lectura)"""
+        return self.store.get_room(code)
     
     def room_exists(self, code: str) -> bool:
         """Verifica si existe una sala con el código dado"""
-        return code in self.rooms
+        return self.store.room_exists(code)
+    
+    def room_codes(self) -> List[str]:
+        """Códigos de todas las salas"""
+        return self.store.room_codes()
+    
+    def existing_room_codes(self, codes: Iterable[str]) -> Set[str]:
+        """Los códigos de la lista que siguen existiendo (una consulta para todos)"""
+        return self.store.existing_codes(codes)
+    
+    def page_rooms(self, after: int, limit: int) -> List[Tuple[int, Room]]:
+        """
+        Salas en orden de creación a partir de un cursor (ver RoomStore.page).
+        
+        Returns:
+            List[Tuple[int, Room]]: (cursor, sala)
+        """
+        return self.store.page(after, limit)
     
     def add_user_to_room(self, code: str, user_id: int, username: str) -> bool:
         """
-        Agrega un usuario a una sala.
+        Agrega un usuario a una sala (si estaba en otra, sale de ella).
         
         Returns:
             bool: True si se agregó exitosamente, False si la sala no existe
         """
-        room = self.get_room(code)
-        if not room:
-            return False
-        
-        # Remover usuario de sala anterior si existe
-        self.remove_user_from_current_room(user_id)
-        
-        # Verificar si el usuario ya está en la sala
-        if any(u.user_id == user_id for u in room.users):
-            logger.warning(f"Usuario {user_id} ya está en sala {code}")
-            return True
-        
-        # Agregar usuario
+        now = datetime.utcnow()
         room_user = RoomUser(
             user_id=user_id,
             username=username,
-            joined_at=datetime.utcnow()
+            joined_at=now
         )
-        room.users.append(room_user)
-        room.last_activity = datetime.utcnow()
-        
-        # Actualizar mapeo
-        self.user_to_room[user_id] = code
+        added, previous = self.store.add_user(code, room_user, now)
+        if not added:
+            return False
         
-        logger.info(f"Usuario {username} ({user_id}) se unió a sala {code}")
+        if previous is not None and previous != code:
+            logger.info(
+                "Usuario %s salió de sala %s", user_id, previous,
+                extra={"event": "room.leave", "room": previous}
+            )
+        logger.info(
+            "Usuario %s (%s) se unió a sala %s", username, user_id, code,
+            extra={"event": "room.join", "room": code}
+        )
         return True
     
     def remove_user_from_room(self, code: str, user_id: int) -> bool:
@@ -81,19 +98,13 @@ class RoomManager:
         Returns:
             bool: True si se removió exitosamente
         """
-        room = self.get_room(code)
-        if not room:
+        if not self.store.remove_user(code, user_id, datetime.utcnow()):
             return False
         
-        # Remover usuario de la lista
-        room.users = [u for u in room.users if u.user_id != user_id]
-        room.last_activity = datetime.utcnow()
-        
-        # Actualizar mapeo
-        if user_id in self.user_to_room and self.user_to_room[user_id] == code:
-            del self.user_to_room[user_id]
-        
-        logger.info(f"Usuario {user_id} salió de sala {code}")
+        logger.info(
+            "Usuario %s salió de sala %s", user_id, code,
+            extra={"event": "room.leave", "room": code}
+        )
         return True
     
     def remove_user_from_current_room(self, user_id: int) -> Optional[str]:
@@ -103,32 +114,44 @@ class RoomManager:
         Returns:
             Optional[str]: Código de la sala de la que salió, o None
         """
-        if user_id not in self.user_to_room:
+        current_room_code = self.store.get_user_room(user_id)
+        if current_room_code is None:
             return None
         
-        current_room_code = self.user_to_room[user_id]
         self.remove_user_from_room(current_room_code, user_id)
         return current_room_code
     
     def get_user_current_room(self, user_id: int) -> Optional[str]:
         """Obtiene el código de la sala actual del usuario"""
-        return self.user_to_room.get(user_id)
+        return self.store.get_user_room(user_id)
     
     def delete_room(self, code: str) -> bool:
-        """Elimina una sala"""
-        if code not in self.rooms:
+        """Elimina una sala (y el mapeo de sus usuarios)"""
+        if not self.store.delete_room(code):
             return False
+        logger.info("Sala eliminada: %s", code, extra={"event": "room.delete", "room": code})
+        return True
+    
+    def purge_empty_rooms(self, now: Optional[datetime] = None) -> List[str]:
+        """
+        Elimina las salas vacías cuya última actividad supera el timeout configurado.
         
-        # Remover todos los usuarios del mapeo
-        room = self.rooms[code]
-        for user in room.users:
-            if user.user_id in self.user_to_room:
-                del self.user_to_room[user.user_id]
+        Returns:
+            List[str]: Códigos de las salas eliminadas
+        """
+        if now is None:
+            now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=settings.room_empty_timeout_seconds)
+        rooms_to_delete = self.store.expired_rooms(cutoff)
         
-        # Eliminar sala
-        del self.rooms[code]
-        logger.info(f"Sala eliminada: {code}")
-        return True
+        # Eliminar salas (con varios workers otro pudo borrarla antes: no se cuenta)
+        deleted = []
+        for code in rooms_to_delete:
+            if self.delete_room(code):
+                deleted.append(code)
+                logger.info("Sala %s eliminada por inactividad", code, extra={"event": "room.expire", "room": code})
+        
+        return deleted
     
     async def cleanup_empty_rooms(self):
         """
@@ -139,27 +162,13 @@ class RoomManager:
             try:
                 await asyncio.sleep(settings.room_cleanup_interval_seconds)
                 
-                now = datetime.utcnow()
-                timeout = timedelta(seconds=settings.room_empty_timeout_seconds)
-                rooms_to_delete = []
-                
-                for code, room in self.rooms.items():
-                    # Si la sala está vacía y ha pasado el timeout
-                    if len(room.users) == 0:
-                        time_since_activity = now - room.last_activity
-                        if time_since_activity > timeout:
-                            rooms_to_delete.append(code)
-                
-                # Eliminar salas
-                for code in rooms_to_delete:
-                    self.delete_room(code)
-                    logger.info(f"Sala {code} eliminada por inactividad")
+                rooms_to_delete = self.purge_empty_rooms()
                 
                 if rooms_to_delete:
-                    logger.info(f"Limpieza completada: {len(rooms_to_delete)} salas eliminadas")
+                    logger.info("Limpieza completada: %d salas eliminadas", len(rooms_to_delete))
                     
             except Exception as e:
-                logger.error(f"Error en limpieza de salas: {e}")
+                logger.error("Error en limpieza de salas: %s", e)
     
     def start_cleanup_task(self):
         """Inicia la tarea de limpieza en background"""
@@ -173,14 +182,64 @@ class RoomManager:
             self._cleanup_task.cancel()
             logger.info("Tarea de limpieza de salas detenida")
     
+    def save_state(self, path: str) -> int:
+        """
+        Guarda las salas en un JSON para que las cargue el siguiente proceso.
+        Se escribe a un temporal propio del proceso (varios workers pueden
+        cerrar a la vez) y se renombra para no dejar archivos a medias.
+        Con un store compartido las salas ya sobreviven al proceso: no se guarda.
+        
+        Returns:
+            int: Número de salas guardadas
+        """
+        if self.store.shared:
+            logger.info("Store %s compartido: no se guarda el estado de salas", self.store.name)
+            return 0
+        
+        rooms = self.store.all_rooms()
+        state = {
+            "saved_at": datetime.utcnow().isoformat(),
+            "rooms": [room.model_dump(mode="json") for room in rooms]
+        }
+        directory, name = os.path.split(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile("w", dir=directory, prefix=f"{name}.", suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            try:
+                json.dump(state, f)
+            except BaseException:
+                f.close()
+                os.remove(tmp_path)
+                raise
+        os.replace(tmp_path, path)
+        logger.info("Estado de %d salas guardado en %s", len(rooms), path)
+        return len(rooms)
+    
+    def load_state(self, path: str) -> int:
+        """
+        Carga las salas guardadas por save_state y borra el archivo (el
+        estado se entrega una sola vez).
+        
+        Returns:
+            int: Número de salas cargadas (0 si no hay archivo o el store es compartido)
+        """
+        if self.store.shared or not os.path.exists(path):
+            return 0
+        
+        with open(path) as f:
+            state = json.load(f)
+        
+        for data in state.get("rooms", []):
+            self.store.create_room(Room.model_validate(data))
+        
+        os.remove(path)
+        logger.info("Estado de %d salas cargado desde %s", len(state.get("rooms", [])), path)
+        return len(state.get("rooms", []))
+    
     def get_stats(self) -> dict:
         """Obtiene estadísticas del gestor de salas"""
-        total_users = sum(len(room.users) for room in self.rooms.values())
-        return {
-            "total_rooms": len(self.rooms),
-            "total_users": total_users,
-            "empty_rooms": sum(1 for room in self.rooms.values() if len(room.users) == 0)
-        }
+        stats = self.store.get_stats()
+        stats["store"] = self.store.name
+        return stats
 
 
 # Instancia global del gestor de salas
@@ -0,0 +1,589 @@
+"""
+Almacenamiento de las salas detrás de RoomManager.
+
+RoomManager (y por él RoomService) no toca diccionarios directamente: habla
+con un RoomStore que guarda las salas, sus miembros, el mapeo
+user_id -> sala y la última actividad (para la expiración). Implementaciones:
+
+- MemoryRoomStore: los diccionarios del proceso, como hasta ahora. Con un
+  solo worker es lo más rápido.
+- SQLiteRoomStore: un archivo SQLite en modo WAL que comparten todos los
+  workers de la máquina (`uvicorn --workers N`): un `/rooms/{code}/join`
+  puede caer en cualquier proceso y encuentra la sala. Cada operación de
+  escritura es una transacción, así que un usuario nunca queda en dos salas.
+- CachedRoomStore: caché de lecturas calientes (sala por código, sala de un
+  usuario) con TTL corto delante de otro store. Solo guarda aciertos (una
+  sala recién creada en otro worker se ve al momento) y se invalida con las
+  escrituras del propio proceso; las de otros workers se ven como mucho
+  `room_store_cache_ttl_seconds` después.
+
+Las salas que devuelven los stores son de solo lectura: cualquier cambio
+pasa por los métodos del store.
+
+Los sockets del radar (ConnectionManager) siguen siendo de cada proceso.
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.models.room import Room, RoomUser
+import bisect
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RoomStoreBusy(Exception):
+    """Otro worker tiene el lock de escritura más tiempo del que se espera"""
+
+
+class RoomStore(ABC):
+    """Operaciones sobre salas y miembros que necesita RoomManager"""
+
+    name = "base"
+    # True si otros procesos ven las mismas salas (no hace falta handoff)
+    shared = False
+
+    @abstractmethod
+    def create_room(self, room: Room) -> bool:
+        """
+        Guarda una sala nueva. Nunca pisa una existente: otro worker puede
+        haber creado el mismo código entre la comprobación y la escritura.
+
+        Returns:
+            bool: False si el código ya estaba ocupado
+        """
+
+    @abstractmethod
+    def get_room(self, code: str) -> Optional[Room]:
+        """Sala con sus miembros, o None"""
+
+    def room_exists(self, code: str) -> bool:
+        return self.get_room(code) is not None
+
+    def existing_codes(self, codes: Iterable[str]) -> Set[str]:
+        """Los códigos de la lista que siguen existiendo"""
+        return {code for code in codes if self.room_exists(code)}
+
+    @abstractmethod
+    def room_codes(self) -> List[str]:
+        """Códigos de todas las salas"""
+
+    @abstractmethod
+    def add_user(self, code: str, user: RoomUser, now: datetime) -> Tuple[bool, Optional[str]]:
+        """
+        Mueve al usuario a la sala (sacándolo de la que tuviera) en una sola
+        operación.
+
+        Returns:
+            Tuple[bool, Optional[str]]: (False si la sala no existe, sala de
+            la que salió)
+        """
+
+    @abstractmethod
+    def remove_user(self, code: str, user_id: int, now: datetime) -> bool:
+        """Saca al usuario de la sala. False si la sala no existe"""
+
+    @abstractmethod
+    def get_user_room(self, user_id: int) -> Optional[str]:
+        """Código de la sala actual del usuario"""
+
+    @abstractmethod
+    def delete_room(self, code: str) -> bool:
+        """Borra la sala y el mapeo de sus miembros"""
+
+    @abstractmethod
+    def expired_rooms(self, cutoff: datetime) -> List[str]:
+        """Salas vacías cuya última actividad es anterior a cutoff"""
+
+    @abstractmethod
+    def all_rooms(self) -> List[Room]:
+        """Todas las salas con sus miembros (para save_state)"""
+
+    @abstractmethod
+    def page(self, after: int, limit: int) -> List[Tuple[int, Room]]:
+        """
+        Recorrido paginado en orden de creación.
+
+        Args:
+            after: Cursor (secuencia de la última sala vista, 0 para empezar)
+            limit: Máximo de salas
+
+        Returns:
+            List[Tuple[int, Room]]: (secuencia, sala); la secuencia es el
+            cursor para seguir. Una sala que existe durante todo el recorrido
+            aparece exactamente una vez
+        """
+
+    @abstractmethod
+    def get_stats(self) -> dict:
+        """total_rooms, total_users y empty_rooms"""
+
+
+class MemoryRoomStore(RoomStore):
+    """Salas en diccionarios del proceso"""
+
+    name = "memory"
+
+    def __init__(self):
+        self.rooms: Dict[str, Room] = {}
+        self.user_to_room: Dict[int, str] = {}  # Mapeo user_id -> room_code
+        # Orden de creación para page(): listas paralelas (secuencia, código)
+        # de solo agregar; las salas borradas quedan como huecos hasta compactar
+        self._seq_of: Dict[str, int] = {}
+        self._seqs: List[int] = []
+        self._codes: List[str] = []
+        self._next_seq = 0
+
+    def create_room(self, room: Room) -> bool:
+        if room.code in self.rooms:
+            return False
+        self.rooms[room.code] = room
+        for user in room.users:
+            self.user_to_room[user.user_id] = room.code
+        self._next_seq += 1
+        self._seq_of[room.code] = self._next_seq
+        self._seqs.append(self._next_seq)
+        self._codes.append(room.code)
+        return True
+
+    def get_room(self, code: str) -> Optional[Room]:
+        return self.rooms.get(code)
+
+    def room_exists(self, code: str) -> bool:
+        return code in self.rooms
+
+    def room_codes(self) -> List[str]:
+        return list(self.rooms)
+
+    def add_user(self, code: str, user: RoomUser, now: datetime) -> Tuple[bool, Optional[str]]:
+        room = self.rooms.get(code)
+        if room is None:
+            return False, None
+        previous = self.user_to_room.get(user.user_id)
+        if previous is not None:
+            self.remove_user(previous, user.user_id, now)
+        room.users.append(user)
+        room.last_activity = now
+        self.user_to_room[user.user_id] = code
+        return True, previous
+
+    def remove_user(self, code: str, user_id: int, now: datetime) -> bool:
+        room = self.rooms.get(code)
+        if room is None:
+            return False
+        room.users = [u for u in room.users if u.user_id != user_id]
+        room.last_activity = now
+        if self.user_to_room.get(user_id) == code:
+            del self.user_to_room[user_id]
+        return True
+
+    def get_user_room(self, user_id: int) -> Optional[str]:
+        return self.user_to_room.get(user_id)
+
+    def delete_room(self, code: str) -> bool:
+        room = self.rooms.pop(code, None)
+        if room is None:
+            return False
+        for user in room.users:
+            if self.user_to_room.get(user.user_id) == code:
+                del self.user_to_room[user.user_id]
+        del self._seq_of[code]
+        # Compactar cuando la mitad del índice son huecos (amortizado O(1) por borrado)
+        if len(self._seqs) > 1024 and len(self._seqs) > 2 * len(self.rooms):
+            live = [(seq, c) for seq, c in zip(self._seqs, self._codes) if self._seq_of.get(c) == seq]
+            self._seqs = [seq for seq, _ in live]
+            self._codes = [c for _, c in live]
+        return True
+
+    def expired_rooms(self, cutoff: datetime) -> List[str]:
+        return [
+            code for code, room in self.rooms.items()
+            if not room.users and room.last_activity < cutoff
+        ]
+
+    def all_rooms(self) -> List[Room]:
+        return list(self.rooms.values())
+
+    def page(self, after: int, limit: int) -> List[Tuple[int, Room]]:
+        result = []
+        # Las secuencias crecen: el cursor se ubica con búsqueda binaria
+        position = bisect.bisect_right(self._seqs, after)
+        seqs, codes, seq_of = self._seqs, self._codes, self._seq_of
+        while position < len(seqs) and len(result) < limit:
+            seq, code = seqs[position], codes[position]
+            if seq_of.get(code) == seq:
+                result.append((seq, self.rooms[code]))
+            position += 1
+        return result
+
+    def get_stats(self) -> dict:
+        return {
+            "total_rooms": len(self.rooms),
+            "total_users": sum(len(room.users) for room in self.rooms.values()),
+            "empty_rooms": sum(1 for room in self.rooms.values() if not room.users)
+        }
+
+
+# id es el cursor de page(): con AUTOINCREMENT nunca se reutiliza (ni tras
+# borrar la última sala) y VACUUM no lo renumera
+_ROOM_COLUMNS = """
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    code TEXT NOT NULL UNIQUE,
+    created_at TEXT NOT NULL,
+    last_activity TEXT NOT NULL
+"""
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS room ({_ROOM_COLUMNS});
+CREATE TABLE IF NOT EXISTS room_member (
+    user_id INTEGER PRIMARY KEY,  -- Un usuario está en una sola sala
+    room_code TEXT NOT NULL REFERENCES room(code) ON DELETE CASCADE,
+    username TEXT NOT NULL,
+    joined_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_room_member_room ON room_member(room_code, joined_at);
+CREATE INDEX IF NOT EXISTS idx_room_last_activity ON room(last_activity);
+"""
+
+
+class SQLiteRoomStore(RoomStore):
+    """
+    Salas en un archivo SQLite (modo WAL) compartido entre procesos.
+    Las fechas se guardan como ISO 8601, que ordena igual que las fechas.
+    """
+
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión del proceso (un fork, ej: gunicorn --preload, abre la suya)"""
+        if self._conn is None or self._pid != os.getpid():
+            # Las llamadas corren en el event loop: esperar el lock de otro
+            # worker congela todos los sockets, así que la espera es corta
+            conn = sqlite3.connect(
+                self.path, timeout=settings.room_store_sqlite_busy_timeout_seconds,
+                isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._migrate(conn)
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(_SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        """
+        Archivos anteriores a la columna id: se reconstruye la tabla room
+        conservando el rowid como id (los cursores ya emitidos siguen valiendo).
+        Corre con las claves foráneas apagadas: borrar la tabla vieja no debe
+        arrastrar a los miembros.
+        """
+        def legacy() -> bool:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(room)")]
+            return bool(columns) and "id" not in columns
+
+        if not legacy():
+            return
+        # Todos los workers arrancan a la vez: aquí sí se espera al que migra
+        conn.execute("PRAGMA busy_timeout=10000")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if legacy():
+                conn.execute(f"CREATE TABLE room_migrated ({_ROOM_COLUMNS})")
+                conn.execute(
+                    "INSERT INTO room_migrated (id, code, created_at, last_activity) "
+                    "SELECT rowid, code, created_at, last_activity FROM room"
+                )
+                conn.execute("DROP TABLE room")
+                conn.execute("ALTER TABLE room_migrated RENAME TO room")
+                logger.info("Tabla room migrada a cursor AUTOINCREMENT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        conn.execute(f"PRAGMA busy_timeout={int(settings.room_store_sqlite_busy_timeout_seconds * 1000)}")
+
+    def _write(self, operation):
+        """Ejecuta operation(conn) en una transacción que toma el lock de escritura al empezar"""
+        with self._lock:
+            conn = self._connection()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError as e:
+                raise RoomStoreBusy(str(e)) from e
+            try:
+                result = operation(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    def _read(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def create_room(self, room: Room) -> bool:
+        def operation(conn):
+            # REPLACE borraría la sala existente y, en cascada, sus miembros
+            created = conn.execute(
+                "INSERT INTO room (code, created_at, last_activity) VALUES (?, ?, ?) ON CONFLICT(code) DO NOTHING",
+                (room.code, room.created_at.isoformat(), room.last_activity.isoformat())
+            ).rowcount > 0
+            if created:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO room_member (user_id, room_code, username, joined_at) VALUES (?, ?, ?, ?)",
+                    [(u.user_id, room.code, u.username, u.joined_at.isoformat()) for u in room.users]
+                )
+            return created
+        return self._write(operation)
+
+    def get_room(self, code: str) -> Optional[Room]:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT created_at, last_activity FROM room WHERE code = ?", (code,)).fetchone()
+            if row is None:
+                return None
+            members = conn.execute(
+                "SELECT user_id, username, joined_at FROM room_member WHERE room_code = ? ORDER BY joined_at",
+                (code,)
+            ).fetchall()
+        return Room(
+            code=code,
+            created_at=datetime.fromisoformat(row[0]),
+            last_activity=datetime.fromisoformat(row[1]),
+            users=[
+                RoomUser(user_id=user_id, username=username, joined_at=datetime.fromisoformat(joined_at))
+                for user_id, username, joined_at in members
+            ]
+        )
+
+    def room_exists(self, code: str) -> bool:
+        return bool(self._read("SELECT 1 FROM room WHERE code = ?", (code,)))
+
+    def existing_codes(self, codes: Iterable[str]) -> Set[str]:
+        # Una consulta por bloque (SQLite limita los parámetros por sentencia)
+        codes = list(codes)
+        existing = set()
+        for i in range(0, len(codes), 500):
+            block = codes[i:i + 500]
+            placeholders = ",".join("?" * len(block))
+            existing.update(code for code, in self._read(f"SELECT code FROM room WHERE code IN ({placeholders})", tuple(block)))
+        return existing
+
+    def room_codes(self) -> List[str]:
+        return [code for code, in self._read("SELECT code FROM room")]
+
+    def add_user(self, code: str, user: RoomUser, now: datetime) -> Tuple[bool, Optional[str]]:
+        def operation(conn):
+            if conn.execute("SELECT 1 FROM room WHERE code = ?", (code,)).fetchone() is None:
+                return False, None
+            row = conn.execute("SELECT room_code FROM room_member WHERE user_id = ?", (user.user_id,)).fetchone()
+            previous = row[0] if row else None
+            stamp = now.isoformat()
+            if previous is not None and previous != code:
+                conn.execute("UPDATE room SET last_activity = ? WHERE code = ?", (stamp, previous))
+            conn.execute(
+                "INSERT OR REPLACE INTO room_member (user_id, room_code, username, joined_at) VALUES (?, ?, ?, ?)",
+                (user.user_id, code, user.username, user.joined_at.isoformat())
+            )
+            conn.execute("UPDATE room SET last_activity = ? WHERE code = ?", (stamp, code))
+            return True, previous
+        return self._write(operation)
+
+    def remove_user(self, code: str, user_id: int, now: datetime) -> bool:
+        def operation(conn):
+            updated = conn.execute(
+                "UPDATE room SET last_activity = ? WHERE code = ?", (now.isoformat(), code)
+            ).rowcount
+            if not updated:
+                return False
+            conn.execute("DELETE FROM room_member WHERE user_id = ? AND room_code = ?", (user_id, code))
+            return True
+        return self._write(operation)
+
+    def get_user_room(self, user_id: int) -> Optional[str]:
+        rows = self._read("SELECT room_code FROM room_member WHERE user_id = ?", (user_id,))
+        return rows[0][0] if rows else None
+
+    def delete_room(self, code: str) -> bool:
+        def operation(conn):
+            conn.execute("DELETE FROM room_member WHERE room_code = ?", (code,))
+            return conn.execute("DELETE FROM room WHERE code = ?", (code,)).rowcount > 0
+        return self._write(operation)
+
+    def expired_rooms(self, cutoff: datetime) -> List[str]:
+        return [code for code, in self._read(
+            "SELECT code FROM room WHERE last_activity < ? "
+            "AND NOT EXISTS (SELECT 1 FROM room_member WHERE room_code = room.code)",
+            (cutoff.isoformat(),)
+        )]
+
+    def all_rooms(self) -> List[Room]:
+        rooms = [self.get_room(code) for code in self.room_codes()]
+        return [room for room in rooms if room is not None]
+
+    def page(self, after: int, limit: int) -> List[Tuple[int, Room]]:
+        # id (AUTOINCREMENT) solo crece y no se reutiliza: sirve de cursor
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                "SELECT id, code, created_at, last_activity FROM room WHERE id > ? ORDER BY id LIMIT ?",
+                (after, limit)
+            ).fetchall()
+            if not rows:
+                return []
+            placeholders = ",".join("?" * len(rows))
+            members = conn.execute(
+                f"SELECT room_code, user_id, username, joined_at FROM room_member "
+                f"WHERE room_code IN ({placeholders}) ORDER BY joined_at",
+                [row[1] for row in rows]
+            ).fetchall()
+        users: Dict[str, List[RoomUser]] = {}
+        for room_code, user_id, username, joined_at in members:
+            users.setdefault(room_code, []).append(
+                RoomUser(user_id=user_id, username=username, joined_at=datetime.fromisoformat(joined_at))
+            )
+        return [
+            (room_id, Room(
+                code=code,
+                created_at=datetime.fromisoformat(created_at),
+                last_activity=datetime.fromisoformat(last_activity),
+                users=users.get(code, [])
+            ))
+            for room_id, code, created_at, last_activity in rows
+        ]
+
+    def get_stats(self) -> dict:
+        total_rooms, empty_rooms = self._read(
+            "SELECT COUNT(*), COALESCE(SUM(NOT EXISTS "
+            "(SELECT 1 FROM room_member WHERE room_code = room.code)), 0) FROM room"
+        )[0]
+        total_users, = self._read("SELECT COUNT(*) FROM room_member")[0]
+        return {"total_rooms": total_rooms, "total_users": total_users, "empty_rooms": empty_rooms}
+
+
+class CachedRoomStore(RoomStore):
+    """Caché con TTL de las lecturas calientes delante de otro store"""
+
+    def __init__(self, backend: RoomStore, ttl_seconds: float, max_entries: int = 100000):
+        self.backend = backend
+        self.name = f"{backend.name}+cache"
+        self.shared = backend.shared
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._rooms: Dict[str, Tuple[float, Room]] = {}
+        self._user_rooms: Dict[int, Tuple[float, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _invalidate(self, *codes: Optional[str], user_id: Optional[int] = None):
+        for code in codes:
+            if code is not None:
+                self._rooms.pop(code, None)
+        if user_id is not None:
+            self._user_rooms.pop(user_id, None)
+
+    def _remember(self, cache: dict, key, value):
+        if len(cache) >= self.max_entries:
+            cache.clear()
+        cache[key] = (time.monotonic() + self.ttl, value)
+
+    def create_room(self, room: Room) -> bool:
+        created = self.backend.create_room(room)
+        self._invalidate(room.code)
+        return created
+
+    def get_room(self, code: str) -> Optional[Room]:
+        entry = self._rooms.get(code)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        room = self.backend.get_room(code)
+        # Solo se guardan aciertos: una sala recién creada en otro worker se ve al momento
+        if room is not None:
+            self._remember(self._rooms, code, room)
+        else:
+            self._rooms.pop(code, None)
+        return room
+
+    def room_codes(self) -> List[str]:
+        return self.backend.room_codes()
+
+    def existing_codes(self, codes: Iterable[str]) -> Set[str]:
+        # Sin caché: solo guarda aciertos y una sala borrada en otro worker seguiría ahí
+        return self.backend.existing_codes(codes)
+
+    def add_user(self, code: str, user: RoomUser, now: datetime) -> Tuple[bool, Optional[str]]:
+        added, previous = self.backend.add_user(code, user, now)
+        self._invalidate(code, previous, user_id=user.user_id)
+        return added, previous
+
+    def remove_user(self, code: str, user_id: int, now: datetime) -> bool:
+        removed = self.backend.remove_user(code, user_id, now)
+        self._invalidate(code, user_id=user_id)
+        return removed
+
+    def get_user_room(self, user_id: int) -> Optional[str]:
+        entry = self._user_rooms.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        code = self.backend.get_user_room(user_id)
+        if code is not None:
+            self._remember(self._user_rooms, user_id, code)
+        else:
+            self._user_rooms.pop(user_id, None)
+        return code
+
+    def delete_room(self, code: str) -> bool:
+        deleted = self.backend.delete_room(code)
+        self._invalidate(code)
+        # Los miembros de la sala borrada no se conocen aquí: se vacía el mapeo
+        self._user_rooms.clear()
+        return deleted
+
+    def expired_rooms(self, cutoff: datetime) -> List[str]:
+        return self.backend.expired_rooms(cutoff)
+
+    def all_rooms(self) -> List[Room]:
+        return self.backend.all_rooms()
+
+    def page(self, after: int, limit: int) -> List[Tuple[int, Room]]:
+        return self.backend.page(after, limit)
+
+    def get_stats(self) -> dict:
+        stats = self.backend.get_stats()
+        stats["cache_hits"] = self.hits
+        stats["cache_misses"] = self.misses
+        stats["cache_entries"] = len(self._rooms) + len(self._user_rooms)
+        return stats
+
+
+def create_room_store() -> RoomStore:
+    """Store configurado en `room_store_backend`"""
+    backend = settings.room_store_backend.lower()
+    if backend == "memory":
+        return MemoryRoomStore()
+    if backend == "sqlite":
+        store = SQLiteRoomStore(settings.room_store_sqlite_path)
+        if settings.room_store_cache_ttl_seconds > 0:
+            return CachedRoomStore(store, settings.room_store_cache_ttl_seconds, settings.room_store_cache_max_entries)
+        return store
+    raise ValueError(f"room_store_backend desconocido: {settings.room_store_backend}")
@@ -0,0 +1,29 @@
+"""
+Protección de los endpoints de administración.
+"""
+
+from typing import Optional
+from fastapi import Header, HTTPException, status
+from app.core.config import settings
+import secrets
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Dependency que exige la cabecera X-Admin-Token igual a `settings.admin_token`.
+    Si no hay token configurado, los endpoints de administración quedan desactivados.
+
+    Uso en endpoints:
+        @app.post("/debug/profile", dependencies=[Depends(require_admin)])
+    """
+    if not settings.admin_token:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Endpoints de administración desactivados"
+        )
+
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token de administración inválido"
+        )
@@ -0,0 +1,231 @@
+"""
+Índice espacial por sala para consultas de "amigos cercanos".
+
+Cada sala tiene una rejilla uniforme en metros (proyección equirectangular
+alrededor de la latitud de la primera ubicación recibida). Actualizar una
+posición es O(1); "amigos a menos de R metros" solo revisa las celdas que
+cubren el radio y "k más cercanos" recorre anillos de celdas hasta que el
+k-ésimo candidato está más cerca que el siguiente anillo.
+
+Si el área a revisar tiene más celdas que usuarios tiene la sala, se
+calcula la distancia a todos (nunca peor que un recorrido lineal).
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.services.polyline import EARTH_RADIUS_METERS
+import heapq
+import math
+
+# (lat, lon, x, y, celda)
+Position = Tuple[float, float, float, float, Tuple[int, int]]
+# (distancia en metros, username)
+Match = Tuple[float, str]
+
+
+class GridIndex:
+    """Rejilla uniforme de las últimas posiciones de una sala"""
+
+    __slots__ = ("cell_meters", "kx", "ky", "cells", "positions", "version")
+
+    def __init__(self, ref_lat: float, cell_meters: float):
+        self.cell_meters = cell_meters
+        self.kx = EARTH_RADIUS_METERS * math.cos(math.radians(ref_lat)) * math.pi / 180.0
+        self.ky = EARTH_RADIUS_METERS * math.pi / 180.0
+        self.cells: Dict[Tuple[int, int], Set[str]] = {}
+        self.positions: Dict[str, Position] = {}
+        self.version = 0  # Cambia con cada actualización (para evaluar solo salas con cambios)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def _project(self, lat: float, lon: float) -> Tuple[float, float]:
+        return lon * self.kx, lat * self.ky
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return math.floor(x / self.cell_meters), math.floor(y / self.cell_meters)
+
+    def update(self, username: str, lat: float, lon: float):
+        """Registra la última posición de un usuario"""
+        x, y = self._project(lat, lon)
+        cell = self._cell(x, y)
+        old = self.positions.get(username)
+        if old is None or old[4] != cell:
+            if old is not None:
+                self._discard_from_cell(username, old[4])
+            self.cells.setdefault(cell, set()).add(username)
+        self.positions[username] = (lat, lon, x, y, cell)
+        self.version += 1
+
+    def remove(self, username: str) -> bool:
+        old = self.positions.pop(username, None)
+        if old is None:
+            return False
+        self._discard_from_cell(username, old[4])
+        self.version += 1
+        return True
+
+    def _discard_from_cell(self, username: str, cell: Tuple[int, int]):
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(username)
+            if not members:
+                del self.cells[cell]
+
+    def _distances(self, x: float, y: float, usernames, exclude: Optional[str]) -> List[Match]:
+        positions = self.positions
+        matches = []
+        for username in usernames:
+            if username == exclude:
+                continue
+            position = positions[username]
+            matches.append((math.hypot(position[2] - x, position[3] - y), username))
+        return matches
+
+    def within(self, lat: float, lon: float, radius: float, exclude: Optional[str] = None) -> List[Match]:
+        """
+        Usuarios a menos de `radius` metros, ordenados por distancia.
+
+        Returns:
+            List[Match]: (distancia en metros, username)
+        """
+        x, y = self._project(lat, lon)
+        cx, cy = self._cell(x, y)
+        reach = math.ceil(radius / self.cell_meters)
+
+        if (2 * reach + 1) ** 2 > len(self.positions):
+            # El radio cubre más celdas que usuarios hay: es más barato revisarlos todos
+            candidates = self._distances(x, y, self.positions, exclude)
+        else:
+            candidates = []
+            for i in range(cx - reach, cx + reach + 1):
+                for j in range(cy - reach, cy + reach + 1):
+                    members = self.cells.get((i, j))
+                    if members:
+                        candidates.extend(self._distances(x, y, members, exclude))
+
+        matches = [match for match in candidates if match[0] <= radius]
+        matches.sort()
+        return matches
+
+    def nearest(
+        self, lat: float, lon: float, k: int,
+        max_radius: Optional[float] = None, exclude: Optional[str] = None
+    ) -> List[Match]:
+        """
+        Los `k` usuarios más cercanos (opcionalmente dentro de `max_radius`).
+
+        Returns:
+            List[Match]: (distancia en metros, username), del más cercano al más lejano
+        """
+        x, y = self._project(lat, lon)
+        cx, cy = self._cell(x, y)
+        candidates: List[Match] = []
+        ring = 0
+
+        while True:
+            if (2 * ring + 1) ** 2 > len(self.positions):
+                # Los anillos ya cubren más celdas que usuarios hay
+                candidates = self._distances(x, y, self.positions, exclude)
+                break
+
+            for i, j in self._ring_cells(cx, cy, ring):
+                members = self.cells.get((i, j))
+                if members:
+                    candidates.extend(self._distances(x, y, members, exclude))
+
+            # Todo lo que está fuera de este anillo está a más de ring * celda
+            covered = ring * self.cell_meters
+            if max_radius is not None and covered >= max_radius:
+                break
+            if len(candidates) >= k and heapq.nsmallest(k, candidates)[-1][0] <= covered:
+                break
+            ring += 1
+
+        if max_radius is not None:
+            candidates = [match for match in candidates if match[0] <= max_radius]
+        return heapq.nsmallest(k, candidates)
+
+    @staticmethod
+    def _ring_cells(cx: int, cy: int, ring: int):
+        """Celdas a distancia de Chebyshev exactamente `ring` de (cx, cy)"""
+        if ring == 0:
+            yield cx, cy
+            return
+        for i in range(cx - ring, cx + ring + 1):
+            yield i, cy - ring
+            yield i, cy + ring
+        for j in range(cy - ring + 1, cy + ring):
+            yield cx - ring, j
+            yield cx + ring, j
+
+
+class SpatialIndexRegistry:
+    """Índices espaciales de todas las salas: { "UPCH77": GridIndex }"""
+
+    def __init__(self):
+        self.rooms: Dict[str, GridIndex] = {}
+
+    def update(self, room_code: str, username: str, lat: float, lon: float):
+        """Actualiza la posición de un usuario (crea el índice de la sala si no existe)"""
+        if not settings.spatial_index_enabled:
+            return
+        index = self.rooms.get(room_code)
+        if index is None:
+            index = self.rooms[room_code] = GridIndex(lat, settings.spatial_cell_meters)
+        index.update(username, lat, lon)
+
+    def remove(self, room_code: str, username: str):
+        """Quita a un usuario; borra el índice si la sala queda vacía"""
+        index = self.rooms.get(room_code)
+        if index is not None and index.remove(username) and not index:
+            del self.rooms[room_code]
+
+    def get(self, room_code: str) -> Optional[GridIndex]:
+        return self.rooms.get(room_code)
+
+    def position(self, room_code: str, username: str) -> Optional[Tuple[float, float]]:
+        """Última posición conocida (lat, lon) de un usuario"""
+        index = self.rooms.get(room_code)
+        position = index.positions.get(username) if index is not None else None
+        return (position[0], position[1]) if position is not None else None
+
+    def nearby(
+        self, room_code: str, lat: float, lon: float,
+        radius: Optional[float] = None, k: Optional[int] = None,
+        exclude: Optional[str] = None
+    ) -> List[dict]:
+        """
+        Amigos dentro de `radius` metros y/o los `k` más cercanos.
+
+        Returns:
+            List[dict]: username, lat, lon y distance_m, del más cercano al más lejano
+        """
+        index = self.rooms.get(room_code)
+        if index is None:
+            return []
+        if k is not None:
+            matches = index.nearest(lat, lon, k, max_radius=radius, exclude=exclude)
+        else:
+            matches = index.within(lat, lon, radius, exclude=exclude)
+        return [
+            {
+                "username": username,
+                "lat": index.positions[username][0],
+                "lon": index.positions[username][1],
+                "distance_m": round(distance, 1)
+            }
+            for distance, username in matches
+        ]
+
+    def get_stats(self) -> dict:
+        """Obtiene estadísticas de los índices"""
+        return {
+            "rooms": len(self.rooms),
+            "positions": sum(len(index) for index in self.rooms.values()),
+            "cells": sum(len(index.cells) for index in self.rooms.values())
+        }
+
+
+# Instancia global de los índices espaciales
+spatial_index = SpatialIndexRegistry()
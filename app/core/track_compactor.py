@@ -0,0 +1,196 @@
+"""
+Compactación del historial de ubicaciones.
+
+Convierte los puntos crudos (location_point) más antiguos que
+`track_compaction_age_seconds` en tramos simplificados (location_track)
+codificados como polyline, y borra los puntos originales. Trabaja en lotes
+pequeños para no bloquear la base de datos ni el event loop.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.database.connection import get_engine
+from app.models.location import LocationPoint, LocationTrack
+from app.services.polyline import douglas_peucker, encode_polyline
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (recorded_at, lat, lon)
+RawPoint = Tuple[datetime, float, float]
+
+
+def build_tracks(room_code: str, username: str, points: Sequence[RawPoint]) -> List[dict]:
+    """
+    Divide los puntos de un usuario en tramos (cortando en huecos mayores a
+    `track_segment_gap_seconds`), los simplifica y los codifica.
+
+    Args:
+        points: Puntos del usuario ordenados por recorded_at
+
+    Returns:
+        List[dict]: Filas listas para LocationTrack
+    """
+    gap = timedelta(seconds=settings.track_segment_gap_seconds)
+    segments: List[List[RawPoint]] = []
+    for point in points:
+        if segments and point[0] - segments[-1][-1][0] <= gap:
+            segments[-1].append(point)
+        else:
+            segments.append([point])
+
+    tracks = []
+    for segment in segments:
+        start_at = segment[0][0]
+        track_points = [
+            (lat, lon, (recorded_at - start_at).total_seconds())
+            for recorded_at, lat, lon in segment
+        ]
+        simplified = douglas_peucker(track_points, settings.track_simplify_tolerance_meters)
+        tracks.append({
+            "room_code": room_code,
+            "username": username,
+            "start_at": start_at,
+            "end_at": segment[-1][0],
+            "point_count": len(segment),
+            "polyline": encode_polyline(simplified)
+        })
+    return tracks
+
+
+class TrackCompactor:
+    """
+    Tarea de compactación incremental del historial, al estilo de
+    RoomManager.cleanup_empty_rooms pero procesando por lotes.
+    """
+
+    def __init__(self):
+        self.compacted_points = 0
+        self.created_tracks = 0
+        self.runs = 0
+        self.errors = 0
+        self.engine = None  # Permite usar otro engine (ej: SQLite local)
+        self._compaction_task: Optional[asyncio.Task] = None
+
+    def compact_batch(self, engine, cutoff: datetime, batch_size: int) -> int:
+        """
+        Compacta un lote de puntos anteriores a `cutoff` (se ejecuta en un hilo).
+
+        Returns:
+            int: Número de puntos crudos procesados
+        """
+        with Session(engine) as session:
+            rows = session.exec(
+                select(
+                    LocationPoint.id,
+                    LocationPoint.room_code,
+                    LocationPoint.username,
+                    LocationPoint.recorded_at,
+                    LocationPoint.lat,
+                    LocationPoint.lon
+                )
+                .where(LocationPoint.recorded_at < cutoff)
+                .order_by(LocationPoint.id)
+                .limit(batch_size)
+            ).all()
+
+            if not rows:
+                return 0
+
+            grouped: Dict[Tuple[str, str], List[RawPoint]] = {}
+            for _, room_code, username, recorded_at, lat, lon in rows:
+                grouped.setdefault((room_code, username), []).append((recorded_at, lat, lon))
+
+            tracks = []
+            for (room_code, username), points in grouped.items():
+                points.sort(key=lambda p: p[0])
+                tracks.extend(build_tracks(room_code, username, points))
+
+            session.execute(insert(LocationTrack.__table__).values(tracks))
+            session.execute(
+                delete(LocationPoint.__table__).where(
+                    LocationPoint.__table__.c.id.in_([row[0] for row in rows])
+                )
+            )
+            session.commit()
+
+        self.compacted_points += len(rows)
+        self.created_tracks += len(tracks)
+        return len(rows)
+
+    async def run_once(self) -> int:
+        """
+        Ejecuta una pasada de compactación, lote a lote, cediendo el event loop
+        entre lotes.
+
+        Returns:
+            int: Número de puntos crudos procesados
+        """
+        engine = self.engine or get_engine()
+        if engine is None:
+            return 0
+
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.track_compaction_age_seconds)
+        batch_size = settings.track_compaction_batch_size
+        total = 0
+
+        for _ in range(settings.track_compaction_max_batches_per_run):
+            processed = await asyncio.to_thread(self.compact_batch, engine, cutoff, batch_size)
+            total += processed
+            if processed < batch_size:
+                break
+            await asyncio.sleep(0)
+
+        self.runs += 1
+        return total
+
+    async def compact_old_points(self):
+        """
+        Tarea que compacta el historial antiguo periódicamente.
+        Se ejecuta en background.
+        """
+        while True:
+            try:
+                await asyncio.sleep(settings.track_compaction_interval_seconds)
+
+                processed = await self.run_once()
+                if processed:
+                    logger.info("Compactación de historial: %d puntos procesados", processed)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error en compactación de historial: {e}")
+
+    def start_compaction_task(self):
+        """Inicia la tarea de compactación en background (si está activada)"""
+        if not settings.track_compaction_enabled:
+            return
+        if self._compaction_task is None or self._compaction_task.done():
+            self._compaction_task = asyncio.create_task(self.compact_old_points())
+            logger.info("Tarea de compactación de historial iniciada")
+
+    def stop_compaction_task(self):
+        """Detiene la tarea de compactación"""
+        if self._compaction_task and not self._compaction_task.done():
+            self._compaction_task.cancel()
+            logger.info("Tarea de compactación de historial detenida")
+
+    def get_stats(self) -> dict:
+        """Obtiene estadísticas de la compactación"""
+        return {
+            "enabled": settings.track_compaction_enabled,
+            "runs": self.runs,
+            "compacted_points": self.compacted_points,
+            "created_tracks": self.created_tracks,
+            "errors": self.errors
+        }
+
+
+# Instancia global del compactador
+track_compactor = TrackCompactor()
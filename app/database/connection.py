@@ -2,8 +2,11 @@
 Módulo de conexión a la base de datos MySQL.
 """
 
+from typing import Optional
 from sqlmodel import create_engine, SQLModel
 from app.core.config import settings
+from app.database.pool_metrics import pool_metrics, InstrumentedQueuePool
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,10 +14,44 @@ logger = logging.getLogger(__name__)
 # Crear engine de SQLModel
 engine = None
 
+# Tarea de creación diferida del esquema (db_schema_mode="deferred")
+_schema_task: Optional[asyncio.Task] = None
+
+
+def create_schema():
+    """
+    Crea las tablas definidas en los modelos que no existan.
+    Nota: init_mysql.sql ya crea las tablas, pero esto no hace daño
+    """
+    SQLModel.metadata.create_all(engine)
+
+
+async def _create_schema_in_background():
+    try:
+        await asyncio.to_thread(create_schema)
+        logger.info("Esquema de la BD verificado (en background)")
+    except Exception as e:
+        logger.error(f"Error al crear el esquema de la BD: {e}")
+
+
+def _schedule_schema_creation():
+    """Crea el esquema en un hilo sin retrasar el arranque (si hay event loop)"""
+    global _schema_task
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        create_schema()
+        return
+    _schema_task = loop.create_task(_create_schema_in_background())
+
+
 def init_db():
     """
     Inicializa la conexión a la base de datos MySQL y crea las tablas.
     Se llama desde app.main.py en el startup event.
+
+    El engine no abre conexiones hasta el primer uso; con db_schema_mode
+    "deferred" o "skip" el arranque no espera a MySQL.
     """
     global engine
     
@@ -23,19 +60,33 @@ def init_db():
         return None
     
     try:
-        # Configuración específica para MySQL
-        engine = create_engine(
-            settings.database_url,
-            echo=settings.debug,  # Log SQL queries en modo debug
-            pool_pre_ping=True,  # Verificar conexión antes de usar
-            pool_size=10,  # Número de conexiones en el pool
-            max_overflow=20,  # Conexiones adicionales permitidas
-            pool_recycle=3600,  # Reciclar conexiones cada hora (importante para MySQL)
-        )
+        if settings.database_url.startswith("sqlite"):
+            # SQLite local (desarrollo y pruebas del historial)
+            engine = create_engine(
+                settings.database_url,
+                echo=settings.debug,
+                connect_args={"check_same_thread": False},
+            )
+        else:
+            # Configuración específica para MySQL (ver db_pool_* en Settings)
+            engine = create_engine(
+                settings.database_url,
+                echo=settings.debug,  # Log SQL queries en modo debug
+                poolclass=InstrumentedQueuePool,
+                pool_pre_ping=settings.db_pool_pre_ping,
+                pool_size=settings.db_pool_size,
+                max_overflow=settings.db_max_overflow,
+                pool_timeout=settings.db_pool_timeout_seconds,
+                pool_recycle=settings.db_pool_recycle_seconds,
+            )
+        
+        pool_metrics.attach(engine)
         
         # Crear todas las tablas definidas en los modelos
-        # Nota: init.sql ya crea la tabla, pero esto no hace daño
-        SQLModel.metadata.create_all(engine)
+        if settings.db_schema_mode == "startup":
+            create_schema()
+        elif settings.db_schema_mode == "deferred":
+            _schedule_schema_creation()
         
         logger.info("✅ Base de datos MySQL conectada exitosamente")
         return engine
@@ -52,7 +103,11 @@ def get_engine():
 
 def close_db():
     """Cierra la conexión a la base de datos"""
-    global engine
+    global engine, _schema_task
+    if _schema_task is not None:
+        _schema_task.cancel()
+        _schema_task = None
     if engine:
         engine.dispose()
+        pool_metrics.detach()
         logger.info("Base de datos MySQL desconectada")
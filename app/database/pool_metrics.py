@@ -0,0 +1,122 @@
+"""
+Instrumentación del pool de conexiones de la base de datos.
+
+Registra la espera al obtener una conexión, conexiones en uso y overflow,
+fallos de pre-ping y rotación de conexiones (aperturas, cierres e
+invalidaciones) mediante los eventos del pool de SQLAlchemy.
+"""
+
+from typing import List
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+import bisect
+import time
+
+# Límites (en segundos) del histograma de espera al obtener una conexión
+CHECKOUT_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class PoolMetrics:
+    """Contadores del pool de conexiones"""
+
+    def __init__(self):
+        self.engine = None
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+        self.pre_ping_failures = 0
+        self.checkout_timeouts = 0
+        self.checkout_wait_sum = 0.0
+        self.checkout_wait_max = 0.0
+        # Un contador por límite más uno para +Inf
+        self.checkout_wait_counts: List[int] = [0] * (len(CHECKOUT_WAIT_BUCKETS) + 1)
+
+    def observe_checkout_wait(self, seconds: float):
+        """Registra el tiempo que tardó en obtenerse una conexión del pool"""
+        self.checkout_wait_counts[bisect.bisect_left(CHECKOUT_WAIT_BUCKETS, seconds)] += 1
+        self.checkout_wait_sum += seconds
+        if seconds > self.checkout_wait_max:
+            self.checkout_wait_max = seconds
+
+    def attach(self, engine):
+        """
+        Registra los listeners de eventos sobre el pool del engine.
+        Los listeners se conservan cuando SQLAlchemy recrea el pool.
+        """
+        self.engine = engine
+
+        @event.listens_for(engine.pool, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            self.connects += 1
+
+        @event.listens_for(engine.pool, "close")
+        def on_close(dbapi_connection, connection_record):
+            self.closes += 1
+
+        @event.listens_for(engine.pool, "close_detached")
+        def on_close_detached(dbapi_connection):
+            self.closes += 1
+
+        @event.listens_for(engine.pool, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            self.checkouts += 1
+
+        @event.listens_for(engine.pool, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            self.checkins += 1
+
+        @event.listens_for(engine.pool, "invalidate")
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            self.invalidations += 1
+            # El pre-ping fallido se reporta como DisconnectionError al hacer checkout
+            if isinstance(exception, exc.DisconnectionError):
+                self.pre_ping_failures += 1
+
+    def detach(self):
+        """Olvida el engine actual (los listeners mueren con él)"""
+        self.engine = None
+
+    def get_stats(self) -> dict:
+        """Obtiene estadísticas del pool de conexiones"""
+        waits = sum(self.checkout_wait_counts)
+        stats = {
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "connects": self.connects,
+            "closes": self.closes,
+            "invalidations": self.invalidations,
+            "pre_ping_failures": self.pre_ping_failures,
+            "checkout_timeouts": self.checkout_timeouts,
+            "checkout_wait_avg_ms": round(self.checkout_wait_sum / waits * 1000, 3) if waits else 0.0,
+            "checkout_wait_max_ms": round(self.checkout_wait_max * 1000, 3)
+        }
+        pool = self.engine.pool if self.engine is not None else None
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                # overflow() es negativo mientras el pool no se ha llenado
+                "overflow": max(0, pool.overflow())
+            })
+        return stats
+
+
+# Instancia global de métricas del pool
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mide la espera al obtener conexiones y los timeouts por agotamiento"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.checkout_timeouts += 1
+            raise
+        finally:
+            pool_metrics.observe_checkout_wait(time.perf_counter() - start)
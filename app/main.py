@@ -1,18 +1,34 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
 
 from app.core.config import settings
+from app.core.logging_config import setup_logging, get_logging_stats
 from app.core.room_manager import room_manager
-from app.api.routes import rooms, auth, websockets
+from app.core.room_store import RoomStoreBusy
+from app.core.connection_manager import connection_manager
+from app.core.spatial_index import spatial_index
+from app.core.geofences import geofence_manager
+from app.core.interest import interest_manager
+from app.core.room_aggregates import room_aggregates
+from app.core.rate_hints import rate_hints
+from app.core.room_events import room_events
+from app.core.rate_limiter import rate_limiter
+from app.core.location_history import location_history
+from app.core.location_batch import location_batches
+from app.core.memory_accounting import memory_accounting
+from app.core.track_compactor import track_compactor
+from app.core.metrics import metrics, MetricsMiddleware, event_loop_monitor, histogram_samples
+from app.core.profiler import loop_profiler
+from app.core.security import require_admin
+from app.api.routes import rooms, auth, websockets, history, admin
 from app.database.connection import init_db, close_db
+from app.database.pool_metrics import pool_metrics, CHECKOUT_WAIT_BUCKETS
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configurar logging (cola + hilo escritor, ver app/core/logging_config.py)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -33,17 +49,84 @@ async def lifespan(app: FastAPI):
         logger.error(f"Error al inicializar BD: {e}")
         # Continuar sin BD si falla (para desarrollo)
     
+    # Recuperar las salas que dejó el proceso anterior (si hay handoff)
+    if settings.room_state_file:
+        try:
+            room_manager.load_state(settings.room_state_file)
+        except Exception as e:
+            logger.error(f"Error al cargar el estado de salas: {e}")
+    
     # Iniciar tarea de limpieza de salas
     room_manager.start_cleanup_task()
     logger.info("Tarea de limpieza de salas iniciada")
     
+    # Iniciar medición del lag del event loop
+    if settings.metrics_enabled:
+        event_loop_monitor.start()
+    
+    # Profiler bajo demanda con señal POSIX (kill -USR1 <pid>)
+    loop_profiler.install_signal_handler()
+    
+    # Drain de los WebSockets al recibir SIGTERM (antes de que uvicorn los corte)
+    connection_manager.install_signal_handler()
+    
+    # Iniciar volcado del historial de ubicaciones (si está activado)
+    location_history.start_flush_task()
+    
+    # Iniciar compactación del historial (si está activada)
+    track_compactor.start_compaction_task()
+    
+    # Iniciar evaluación de geocercas (si está activada)
+    geofence_manager.start_tick_task()
+    
+    # Iniciar envío agrupado de posiciones lejanas (salas con política de reenvío)
+    interest_manager.start_flush_task()
+    
+    # Iniciar envío periódico de agregados de salas (ROOM_AGGREGATES)
+    room_aggregates.start_broadcast_task()
+    
+    # Iniciar ajuste del intervalo de GPS recomendado por sala (RATE_HINT)
+    rate_hints.start_tick_task()
+    
+    # Iniciar limpieza de los registros de eventos de salas sin sockets
+    room_events.start_cleanup_task()
+    
+    # Iniciar desalojo de cubetas inactivas del rate limiter
+    rate_limiter.start_eviction_task()
+    
     yield
     
     # Shutdown
     logger.info("Cerrando aplicación...")
+    
+    # Cerrar ordenadamente los sockets que queden (ya drenados si hubo SIGTERM)
+    if not connection_manager.draining:
+        await connection_manager.drain()
+    
+    if settings.room_state_file:
+        try:
+            room_manager.save_state(settings.room_state_file)
+        except Exception as e:
+            logger.error(f"Error al guardar el estado de salas: {e}")
+    
     room_manager.stop_cleanup_task()
     logger.info("Tarea de limpieza de salas detenida")
     
+    track_compactor.stop_compaction_task()
+    geofence_manager.stop_tick_task()
+    interest_manager.stop_flush_task()
+    room_aggregates.stop_broadcast_task()
+    rate_hints.stop_tick_task()
+    room_events.stop_cleanup_task()
+    rate_limiter.stop_eviction_task()
+    event_loop_monitor.stop()
+    
+    # Volcar los puntos pendientes antes de cerrar la BD
+    try:
+        await location_history.stop_flush_task()
+    except Exception as e:
+        logger.error(f"Error al volcar historial: {e}")
+    
     # Cerrar conexión a BD
     try:
         close_db()
@@ -68,10 +151,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Medir latencia de peticiones por ruta
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(RoomStoreBusy)
+async def room_store_busy_handler(request, exc: RoomStoreBusy):
+    """Otro worker retiene el lock de escritura de las salas: reintentar en breve"""
+    logger.warning("Store de salas ocupado: %s", exc, extra={"event": "room_store.busy"})
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Servicio ocupado, reintenta en un momento"},
+        headers={"Retry-After": "1"}
+    )
+
+
 # Registrar routers
 app.include_router(rooms.router)
 app.include_router(auth.router)
 app.include_router(websockets.router)
+app.include_router(history.router)
+app.include_router(admin.router)
 
 
 @app.get("/", tags=["health"])
@@ -85,20 +186,116 @@ async def root():
 
 
 @app.get("/health", tags=["health"])
-async def health_check():
-    """Health check endpoint"""
+async def health_check(response: Response):
+    """
+    Health check endpoint.
+    Durante el drain responde 503 para que el balanceador deje de enviar tráfico.
+    """
     stats = room_manager.get_stats()
+    if connection_manager.draining:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
     return {
-        "status": "healthy",
-        "rooms": stats
+        "status": "draining" if connection_manager.draining else "healthy",
+        "rooms": stats,
+        "websockets": connection_manager.get_stats(),
+        "spatial_index": spatial_index.get_stats(),
+        "geofences": geofence_manager.get_stats(),
+        "fanout": interest_manager.get_stats(),
+        "room_aggregates": room_aggregates.get_stats(),
+        "rate_hints": rate_hints.get_stats(),
+        "room_events": room_events.get_stats(),
+        "rate_limit": rate_limiter.get_stats(),
+        "location_history": location_history.get_stats(),
+        "location_batches": location_batches.get_stats(),
+        "memory": memory_accounting.get_stats(),
+        "track_compaction": track_compactor.get_stats(),
+        "database_pool": pool_metrics.get_stats(),
+        "logging": get_logging_stats()
     }
 
 
+
+@app.post("/debug/profile", tags=["health"], dependencies=[Depends(require_admin)])
+async def profile_event_loop(
+    seconds: float = Query(10, gt=0, description="Duración del perfilado"),
+    format: str = Query("json", pattern="^(json|collapsed)$", description="json o collapsed")
+):
+    """
+    Perfila el event loop durante N segundos (solo administradores).
+    
+    Requiere: Header X-Admin-Token
+    
+    Returns:
+        JSON con pilas colapsadas, pasos más lentos del loop e incidentes de
+        bloqueo, o solo las pilas colapsadas en texto (format=collapsed)
+    """
+    if seconds > settings.profiler_max_seconds:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"La duración máxima es {settings.profiler_max_seconds} segundos"
+        )
+    
+    try:
+        report = await loop_profiler.profile(seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    
+    if format == "collapsed":
+        return PlainTextResponse(report["collapsed"] + "\n")
+    return report
+
+
+def collect_component_metrics():
+    """Estadísticas de los componentes existentes, leídas al hacer scrape"""
+    rooms = room_manager.get_stats()
+    yield ("rooms_total", "gauge", "Salas registradas en el gestor",
+           [("rooms_total", {}, rooms["total_rooms"])])
+    yield ("rooms_users", "gauge", "Usuarios unidos a alguna sala",
+           [("rooms_users", {}, rooms["total_users"])])
+    yield ("rooms_empty", "gauge", "Salas vacías pendientes de limpieza",
+           [("rooms_empty", {}, rooms["empty_rooms"])])
+
+    yield ("rate_limit_rejected_total", "counter", "Peticiones rechazadas por el rate limiter",
+           [("rate_limit_rejected_total", {"scope": scope}, count)
+            for scope, count in rate_limiter.rejections.items()])
+
+    history = location_history.get_stats()
+    yield ("location_history_buffered_points", "gauge", "Puntos de historial pendientes de volcar",
+           [("location_history_buffered_points", {}, history["buffered_points"])])
+    yield ("location_history_dropped_points_total", "counter", "Puntos de historial descartados",
+           [("location_history_dropped_points_total", {}, history["dropped_points"])])
+    yield ("location_history_flushed_points_total", "counter", "Puntos de historial insertados",
+           [("location_history_flushed_points_total", {}, history["flushed_points"])])
+
+    pool = pool_metrics.get_stats()
+    yield ("db_pool_checked_out", "gauge", "Conexiones del pool en uso",
+           [("db_pool_checked_out", {}, pool.get("checked_out", 0))])
+    yield ("db_pool_overflow", "gauge", "Conexiones de overflow abiertas",
+           [("db_pool_overflow", {}, pool.get("overflow", 0))])
+    yield ("db_pool_events_total", "counter", "Eventos del pool de conexiones",
+           [("db_pool_events_total", {"event": name}, pool[name])
+            for name in ("checkouts", "connects", "closes", "invalidations",
+                         "pre_ping_failures", "checkout_timeouts")])
+    yield ("db_pool_checkout_wait_seconds", "histogram", "Espera al obtener una conexión del pool",
+           histogram_samples("db_pool_checkout_wait_seconds", CHECKOUT_WAIT_BUCKETS,
+                             pool_metrics.checkout_wait_counts, pool_metrics.checkout_wait_sum))
+
+
+metrics.register_collector(collect_component_metrics)
+
+
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=settings.debug
+        reload=settings.debug,
+        ws_per_message_deflate=settings.ws_per_message_deflate
     )
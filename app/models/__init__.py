@@ -4,6 +4,7 @@ Modelos de datos usando Pydantic y SQLModel.
 """
 
 from app.models.user import User, LoginRequest, TokenResponse
+from app.models.location import LocationPoint, LocationTrack
 from app.models.room import (
     Room,
     RoomUser,
@@ -17,6 +18,8 @@ __all__ = [
     "User",
     "LoginRequest",
     "TokenResponse",
+    "LocationPoint",
+    "LocationTrack",
     "Room",
     "RoomUser",
     "CreateRoomResponse",
@@ -0,0 +1,47 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Column, Index, Text
+from typing import Optional
+from datetime import datetime
+
+# Largo de las columnas (el historial recorta los nombres más largos y
+# descarta los puntos de códigos de sala que no caben)
+USERNAME_MAX_LENGTH = 255
+ROOM_CODE_MAX_LENGTH = 16
+
+
+class LocationPoint(SQLModel, table=True):
+    """
+    Punto del historial de ubicaciones de una sala.
+    Se escribe en lotes desde LocationHistorySink, nunca por cada mensaje.
+    """
+    __tablename__ = "location_point"
+    __table_args__ = (
+        Index("idx_location_point_room_time", "room_code", "recorded_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    room_code: str = Field(max_length=ROOM_CODE_MAX_LENGTH)
+    username: str = Field(max_length=USERNAME_MAX_LENGTH)
+    lat: float
+    lon: float
+    recorded_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class LocationTrack(SQLModel, table=True):
+    """
+    Tramo de trayectoria compactado a partir de LocationPoint.
+    `polyline` contiene los puntos simplificados codificados como
+    (lat, lon, segundos desde start_at).
+    """
+    __tablename__ = "location_track"
+    __table_args__ = (
+        Index("idx_location_track_room_time", "room_code", "start_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    room_code: str = Field(max_length=ROOM_CODE_MAX_LENGTH)
+    username: str = Field(max_length=USERNAME_MAX_LENGTH)
+    start_at: datetime
+    end_at: datetime
+    point_count: int  # Puntos originales antes de simplificar
+    polyline: str = Field(sa_column=Column(Text, nullable=False))
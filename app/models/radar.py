@@ -0,0 +1,102 @@
+"""
+Mensajes que el radar (Android) envía por el WebSocket, decodificados con
+msgspec directamente a structs tipados: sin dict intermedio, con el evento
+como discriminador y con los rangos de coordenadas validados al decodificar.
+
+En el socket multiplexado (/ws/mux/{username}) los mensajes de sala llevan
+además `"room"` y hay dos de control: SUBSCRIBE y UNSUBSCRIBE.
+
+También el lote de puntos que el radar acumula sin conexión y sube por REST
+al reconectar (POST /rooms/{code}/locations/batch).
+"""
+
+from typing import Annotated, List, Optional, Union
+import msgspec
+
+Latitude = Annotated[float, msgspec.Meta(ge=-90, le=90)]
+Longitude = Annotated[float, msgspec.Meta(ge=-180, le=180)]
+RoomCode = Annotated[str, msgspec.Meta(min_length=1, max_length=16)]
+Username = Annotated[str, msgspec.Meta(min_length=1, max_length=255)]
+
+
+class LocationData(msgspec.Struct):
+    """Ubicación del teléfono"""
+    lat: Latitude
+    lon: Longitude
+
+
+class UpdateLocation(msgspec.Struct, tag="UPDATE_LOCATION", tag_field="event"):
+    """{"event": "UPDATE_LOCATION", "data": {"lat": ..., "lon": ...}}"""
+    data: LocationData
+    room: Optional[RoomCode] = None  # Solo en el socket multiplexado
+
+
+class NearbyQueryData(msgspec.Struct):
+    """Parámetros de NEARBY_QUERY (todos opcionales)"""
+    radius: Optional[Annotated[float, msgspec.Meta(gt=0)]] = None
+    k: Optional[Annotated[int, msgspec.Meta(ge=1)]] = None
+    lat: Optional[Latitude] = None
+    lon: Optional[Longitude] = None
+
+
+class NearbyQuery(msgspec.Struct, tag="NEARBY_QUERY", tag_field="event"):
+    """{"event": "NEARBY_QUERY", "data": {"radius": ..., "k": ...}}"""
+    data: NearbyQueryData = msgspec.field(default_factory=NearbyQueryData)
+    room: Optional[RoomCode] = None  # Solo en el socket multiplexado
+
+
+class Subscribe(msgspec.Struct, tag="SUBSCRIBE", tag_field="event"):
+    """{"event": "SUBSCRIBE", "room": "UPCH77", "last_seq": N (opcional)}"""
+    room: RoomCode
+    last_seq: Optional[int] = None
+
+
+class Unsubscribe(msgspec.Struct, tag="UNSUBSCRIBE", tag_field="event"):
+    """{"event": "UNSUBSCRIBE", "room": "UPCH77"}"""
+    room: RoomCode
+
+
+InboundMessage = Union[UpdateLocation, NearbyQuery]
+MuxInboundMessage = Union[UpdateLocation, NearbyQuery, Subscribe, Unsubscribe]
+
+# Decodificadores reutilizables (construirlos por mensaje es caro)
+_decoder = msgspec.json.Decoder(InboundMessage)
+_mux_decoder = msgspec.json.Decoder(MuxInboundMessage)
+
+
+def decode_inbound(frame: Union[str, bytes]) -> InboundMessage:
+    """
+    Decodifica y valida un frame del radar.
+
+    Raises:
+        msgspec.DecodeError: Si el frame no es JSON válido
+        msgspec.ValidationError: Si el evento no existe o los datos no son
+            válidos (ej: latitud fuera de rango)
+    """
+    return _decoder.decode(frame)
+
+
+def decode_mux_inbound(frame: Union[str, bytes]) -> MuxInboundMessage:
+    """Como decode_inbound, pero con los mensajes de control del socket multiplexado"""
+    return _mux_decoder.decode(frame)
+
+
+class BatchPoint(msgspec.Struct):
+    """Punto acumulado sin conexión; ts en milisegundos desde epoch (System.currentTimeMillis)"""
+    lat: Latitude
+    lon: Longitude
+    ts: Annotated[int, msgspec.Meta(ge=0)]
+
+
+class LocationBatch(msgspec.Struct):
+    """{"username": "ana", "points": [{"lat": ..., "lon": ..., "ts": ...}, ...]}"""
+    username: Username
+    points: List[BatchPoint]
+
+
+_batch_decoder = msgspec.json.Decoder(LocationBatch)
+
+
+def decode_location_batch(body: bytes) -> LocationBatch:
+    """Decodifica y valida un lote de puntos (mismas excepciones que decode_inbound)"""
+    return _batch_decoder.decode(body)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 
@@ -24,6 +24,33 @@ class Room(BaseModel):
         from_attributes = True
 
 
+class Centroid(BaseModel):
+    """Centro de las posiciones de una sala"""
+    lat: float
+    lon: float
+
+
+class BoundingBox(BaseModel):
+    """Caja que contiene todas las posiciones de una sala (vista "ver a todos")"""
+    min_lat: float
+    min_lon: float
+    max_lat: float
+    max_lon: float
+
+
+class RoomAggregates(BaseModel):
+    """Agregados de las últimas posiciones de una sala"""
+    count: int
+    centroid: Centroid
+    bbox: BoundingBox
+    spread_m: float  # Distancia cuadrática media al centroide
+
+
+class RoomDetail(Room):
+    """Sala con los agregados de sus posiciones (si alguien envió ubicación)"""
+    aggregates: Optional[RoomAggregates] = None
+
+
 class CreateRoomResponse(BaseModel):
     """Response al crear una sala"""
     code: str
@@ -48,3 +75,57 @@ class LeaveRoomResponse(BaseModel):
     """Response al salir de una sala"""
     message: str
     code: Optional[str] = None
+
+
+class NearbyFriend(BaseModel):
+    """Amigo cercano con su última ubicación conocida"""
+    username: str
+    lat: float
+    lon: float
+    distance_m: float
+
+
+class NearbyResponse(BaseModel):
+    """Response de la consulta de amigos cercanos"""
+    code: str
+    friends: List[NearbyFriend]
+
+
+class LocationBatchResponse(BaseModel):
+    """Resultado de subir un lote de puntos acumulados sin conexión"""
+    code: str
+    username: str
+    accepted: int = Field(description="Puntos dentro de la ventana de tiempo aceptada")
+    rejected: int = Field(description="Puntos descartados por antiguos o con fecha futura")
+    position_updated: bool = Field(description="Si el punto más reciente pasó a ser la última ubicación")
+    forwarded: int = Field(description="Sockets a los que se reenvió el punto más reciente")
+
+
+class GeofenceCreate(BaseModel):
+    """Request para crear una geocerca circular (ej: punto de encuentro)"""
+    name: str = Field(min_length=1, max_length=100)
+    lat: float = Field(ge=-90, le=90)
+    lon: float = Field(ge=-180, le=180)
+    radius_m: float = Field(gt=0, description="Radio en metros")
+
+
+class Geofence(BaseModel):
+    """Geocerca circular de una sala"""
+    id: int
+    name: str
+    lat: float
+    lon: float
+    radius_m: float
+    created_at: datetime
+
+
+class FanoutPolicy(BaseModel):
+    """
+    Política de reenvío por distancia para salas grandes.
+    Cada actualización se reenvía al momento solo a los amigos a menos de
+    `radius_m` y/o a los `k` más cercanos; el resto recibe las posiciones
+    agrupadas cada `far_interval_seconds` (evento FRIENDS_MOVED).
+    """
+    radius_m: Optional[float] = Field(None, gt=0)
+    k: Optional[int] = Field(None, gt=0)
+    far_interval_seconds: float = Field(10, ge=1, le=300)
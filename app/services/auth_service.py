@@ -1,11 +1,12 @@
 """
 Servicio de autenticación con JWT
+
+jose y passlib (bcrypt) se importan en el primer uso y no al arrancar: la
+mayoría de workers nuevos atienden WebSockets antes que un login.
 """
 
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlmodel import Session, select
@@ -13,21 +14,30 @@ from app.models.user import User
 from app.database.session import get_session
 from app.core.config import settings
 
-# Configuración de password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Configuración de password hashing (se crea en el primer uso)
+_pwd_context = None
 
 # Security scheme
 security = HTTPBearer()
 
 
+def get_pwd_context():
+    """Retorna el CryptContext de bcrypt, importando passlib la primera vez"""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica si la contraseña es correcta"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
     """Genera hash de la contraseña"""
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -38,6 +48,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         data: Datos a incluir en el token (típicamente user_id y username)
         expires_delta: Tiempo de expiración (default: 30 minutos)
     """
+    from jose import jwt
+
     to_encode = data.copy()
     
     if expires_delta:
@@ -52,6 +64,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 def decode_token(token: str) -> dict:
     """Decodifica y valida un JWT token"""
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         return payload
@@ -78,7 +92,9 @@ def get_current_user(
     token = credentials.credentials
     payload = decode_token(token)
     
-    user_id: int = payload.get("sub")
+    # "sub" es un string en el JWT (jose rechaza otros tipos)
+    subject = payload.get("sub")
+    user_id = int(subject) if subject is not None and str(subject).isdigit() else None
     if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
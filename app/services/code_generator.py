@@ -1,35 +1,29 @@
-import time
-import random
+import secrets
 import string
 from app.core.config import settings
 
 
 class CodeGenerator:
     """
-    Generador de códigos únicos de sala usando milisegundos del sistema.
+    Generador de códigos de sala aleatorios.
     """
     
     @staticmethod
     def generate_room_code() -> str:
         """
         Genera un código alfanumérico de 6 caracteres.
-        Usa milisegundos del sistema como seed para el algoritmo.
+        Usa el generador del sistema operativo: dos workers que crean una sala
+        en el mismo milisegundo no obtienen el mismo código.
         
         Returns:
             str: Código de 6 caracteres (números y letras mayúsculas)
         """
-        # Obtener milisegundos actuales como seed
-        milliseconds = int(time.time() * 1000)
-        
-        # Usar milisegundos como seed para random
-        random.seed(milliseconds)
-        
         # Caracteres permitidos: A-Z y 0-9 (excluyendo letras confusas como O, I)
         # Para evitar confusión entre 0/O y 1/I
         characters = string.ascii_uppercase.replace('O', '').replace('I', '') + string.digits
         
         # Generar código de longitud configurada
-        code = ''.join(random.choices(characters, k=settings.room_code_length))
+        code = ''.join(secrets.choice(characters) for _ in range(settings.room_code_length))
         
         return code
     
@@ -47,8 +41,9 @@ class CodeGenerator:
         if not code or len(code) != settings.room_code_length:
             return False
         
-        # Verificar que solo contenga caracteres alfanuméricos
-        return code.isalnum() and code.isupper()
+        # Verificar que solo contenga caracteres alfanuméricos en mayúsculas
+        # (isupper() rechazaría los códigos generados que son solo dígitos)
+        return code.isascii() and code.isalnum() and code == code.upper()
 
 
 # Instancia global del generador
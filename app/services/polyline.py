@@ -0,0 +1,126 @@
+"""
+Simplificación y codificación de trayectorias.
+
+- Douglas-Peucker sobre una proyección equirectangular local (tolerancia en metros).
+- Codificación "encoded polyline" de Google extendida a tres dimensiones:
+  (lat, lon, segundos desde el inicio del tramo).
+"""
+
+from typing import List, Sequence, Tuple
+import math
+
+# (lat, lon, segundos desde el inicio del tramo)
+TrackPoint = Tuple[float, float, float]
+
+EARTH_RADIUS_METERS = 6_371_000.0
+POLYLINE_PRECISION = (1e5, 1e5, 1)
+
+
+def douglas_peucker(points: Sequence[TrackPoint], tolerance_meters: float) -> List[TrackPoint]:
+    """
+    Simplifica una trayectoria conservando los puntos que se desvían más de
+    `tolerance_meters` de la recta entre sus vecinos retenidos.
+    Implementación iterativa (sin recursión) para tramos largos.
+
+    Args:
+        points: Puntos ordenados por tiempo
+        tolerance_meters: Desviación máxima permitida
+
+    Returns:
+        List[TrackPoint]: Puntos retenidos (siempre incluye el primero y el último)
+    """
+    count = len(points)
+    if count <= 2:
+        return list(points)
+
+    # Proyectar a metros alrededor de la latitud media
+    lat0 = math.radians(sum(p[0] for p in points) / count)
+    kx = EARTH_RADIUS_METERS * math.cos(lat0) * math.pi / 180.0
+    ky = EARTH_RADIUS_METERS * math.pi / 180.0
+    xs = [p[1] * kx for p in points]
+    ys = [p[0] * ky for p in points]
+
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance_meters * tolerance_meters
+    stack = [(0, count - 1)]
+
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xs[first], ys[first]
+        dx, dy = xs[last] - ax, ys[last] - ay
+        length_sq = dx * dx + dy * dy
+
+        max_dist_sq = -1.0
+        index = first
+        for i in range(first + 1, last):
+            px, py = xs[i] - ax, ys[i] - ay
+            if length_sq > 0:
+                t = (px * dx + py * dy) / length_sq
+                if t < 0:
+                    t = 0.0
+                elif t > 1:
+                    t = 1.0
+                px -= t * dx
+                py -= t * dy
+            dist_sq = px * px + py * py
+            if dist_sq > max_dist_sq:
+                max_dist_sq = dist_sq
+                index = i
+
+        if max_dist_sq > tolerance_sq:
+            keep[index] = True
+            if index - first > 1:
+                stack.append((first, index))
+            if last - index > 1:
+                stack.append((index, last))
+
+    return [p for p, kept in zip(points, keep) if kept]
+
+
+def _encode_value(value: int, out: List[str]):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_polyline(points: Sequence[TrackPoint]) -> str:
+    """Codifica puntos (lat, lon, segundos) como polyline de 3 dimensiones"""
+    out: List[str] = []
+    previous = [0, 0, 0]
+    for point in points:
+        for dim in range(3):
+            value = int(round(point[dim] * POLYLINE_PRECISION[dim]))
+            _encode_value(value - previous[dim], out)
+            previous[dim] = value
+    return "".join(out)
+
+
+def decode_polyline(encoded: str) -> List[TrackPoint]:
+    """Decodifica una polyline de 3 dimensiones generada por encode_polyline"""
+    points: List[TrackPoint] = []
+    values = [0, 0, 0]
+    index = 0
+    length = len(encoded)
+
+    while index < length:
+        for dim in range(3):
+            result = 0
+            shift = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            values[dim] += ~(result >> 1) if result & 1 else result >> 1
+        points.append((
+            values[0] / POLYLINE_PRECISION[0],
+            values[1] / POLYLINE_PRECISION[1],
+            values[2] / POLYLINE_PRECISION[2]
+        ))
+
+    return points
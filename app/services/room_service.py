@@ -16,22 +16,19 @@ class RoomService:
         Returns:
             CreateRoomResponse: Información de la sala creada
         """
-        # Generar código único
+        # Generar código único: create_room no pisa una sala existente, así
+        # que si otro worker ocupó el código entre medias se prueba otro
         max_attempts = 10
-        code = None
+        room = None
         
         for _ in range(max_attempts):
-            candidate_code = code_generator.generate_room_code()
-            if not room_manager.room_exists(candidate_code):
-                code = candidate_code
+            room = room_manager.create_room(code_generator.generate_room_code())
+            if room is not None:
                 break
         
-        if not code:
+        if room is None:
             raise Exception("No se pudo generar un código único después de varios intentos")
         
-        # Crear sala
-        room = room_manager.create_room(code)
-        
         return CreateRoomResponse(
             code=room.code,
             created_at=room.created_at,
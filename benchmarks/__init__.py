@@ -0,0 +1,4 @@
+"""
+Benchmarks
+Scripts de rendimiento. Se ejecutan con `python -m benchmarks.<modulo>`.
+"""
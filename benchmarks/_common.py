@@ -0,0 +1,76 @@
+"""
+Utilidades compartidas por los benchmarks: percentiles, uso de CPU/memoria
+y comparación contra resultados anteriores para detectar regresiones.
+"""
+
+from typing import Dict, List, Optional, Sequence
+import json
+import os
+import resource
+import sys
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Percentil por interpolación lineal (q entre 0 y 100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def cpu_seconds() -> float:
+    """Tiempo de CPU (usuario + sistema) consumido por el proceso"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def rss_bytes() -> int:
+    """Memoria residente actual del proceso (pico si no hay /proc)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def write_results(results: dict, output: Optional[str]):
+    """Imprime los resultados y opcionalmente los guarda como JSON"""
+    text = json.dumps(results, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+
+
+def compare_to_baseline(
+    results: Dict[str, float],
+    baseline_path: str,
+    higher_is_better: Sequence[str],
+    lower_is_better: Sequence[str],
+    max_regression: float
+) -> List[str]:
+    """
+    Compara métricas planas con un JSON anterior.
+
+    Returns:
+        List[str]: Descripción de cada métrica que empeoró más de `max_regression`
+        (fracción, ej: 0.2 = 20%)
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for key in higher_is_better:
+        old, new = baseline.get(key), results.get(key)
+        if old and new is not None and new < old * (1 - max_regression):
+            regressions.append(f"{key}: {old} -> {new}")
+    for key in lower_is_better:
+        old, new = baseline.get(key), results.get(key)
+        if old and new is not None and new > old * (1 + max_regression):
+            regressions.append(f"{key}: {old} -> {new}")
+    return regressions
@@ -0,0 +1,158 @@
+"""
+Benchmark de arranque en frío.
+
+Mide, en procesos nuevos (sin caché de imports):
+- Tiempo de `import app.main` y qué módulos pesados quedan cargados
+  (jose y passlib/bcrypt deberían cargarse solo en el primer login;
+  email_validator lo importa fastapi.openapi.models de todas formas)
+- Los módulos con mayor tiempo de import acumulado (python -X importtime)
+- Tiempo hasta la primera respuesta: desde lanzar uvicorn hasta el primer
+  200 de /health, para cada DB_SCHEMA_MODE
+
+Por defecto usa una BD SQLite nueva en cada arranque para que create_all
+tenga trabajo real; con --database-url se mide contra MySQL.
+
+Uso:
+    python -m benchmarks.cold_start --runs 5
+    python -m benchmarks.cold_start --database-url mysql+pymysql://... --output cold.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks._common import compare_to_baseline, percentile, write_results
+
+HEAVY_MODULES = ["jose", "passlib", "email_validator", "bcrypt"]
+
+IMPORT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({"import_s": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def base_env(database_url: str) -> dict:
+    env = dict(os.environ)
+    env["DATABASE_URL"] = database_url
+    env["LOG_LEVEL"] = "WARNING"
+    return env
+
+
+def measure_import(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def top_imports(env: dict, top: int) -> list:
+    """Módulos con mayor tiempo acumulado entre los importados directamente por app.*"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], env=env, capture_output=True, text=True
+    ).stderr
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # cabecera
+        # Solo el primer nivel bajo la raíz (indentación de 1-2 espacios)
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            entries.append((int(cumulative) / 1000, name.strip()))
+    entries.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(ms, 1)} for ms, name in entries[:top]]
+
+
+def time_to_first_request(env: dict, schema_mode: str, timeout: float = 30.0) -> float:
+    """Segundos desde lanzar uvicorn hasta el primer 200 de /health"""
+    port = free_port()
+    env = dict(env, DB_SCHEMA_MODE=schema_mode)
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+        raise TimeoutError(f"uvicorn no respondió en {timeout}s (DB_SCHEMA_MODE={schema_mode})")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Arranques por medición")
+    parser.add_argument("--database-url", help="BD a usar (default: SQLite temporal nueva por arranque)")
+    parser.add_argument("--modes", default="startup,deferred,skip", help="DB_SCHEMA_MODE a comparar")
+    parser.add_argument("--top", type=int, default=12, help="Módulos más lentos a listar")
+    parser.add_argument("--output", help="Guardar resultados en este JSON")
+    parser.add_argument("--baseline", help="JSON anterior para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="cold_start_")
+
+    def env_for_run(run: int) -> dict:
+        url = args.database_url or f"sqlite:///{os.path.join(tmpdir, f'run{run}.db')}"
+        return base_env(url)
+
+    imports = [measure_import(env_for_run(run)) for run in range(args.runs)]
+    import_ms = [entry["import_s"] * 1000 for entry in imports]
+    results = {
+        "runs": args.runs,
+        "import_p50_ms": round(percentile(import_ms, 50), 1),
+        "import_max_ms": round(max(import_ms), 1),
+        "heavy_modules_loaded_at_import": imports[-1]["loaded"],
+        "top_imports": top_imports(env_for_run(0), args.top),
+    }
+
+    run = args.runs
+    for mode in args.modes.split(","):
+        samples = []
+        for _ in range(args.runs):
+            run += 1
+            samples.append(time_to_first_request(env_for_run(run), mode) * 1000)
+        results[f"first_request_{mode}_p50_ms"] = round(percentile(samples, 50), 1)
+        results[f"first_request_{mode}_max_ms"] = round(max(samples), 1)
+
+    write_results(results, args.output)
+
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results,
+            args.baseline,
+            higher_is_better=[],
+            lower_is_better=[key for key in results if key.endswith("_p50_ms")],
+            max_regression=args.max_regression,
+        )
+        if regressions:
+            print("Regresiones detectadas:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark del reenvío por distancia (app/core/interest.py).
+
+Simula una sala grande de sockets (WebSocket falsos que no escriben nada,
+pero con la cola y la tarea escritora reales de RadarConnection) y mide el
+coste de reenviar U actualizaciones de ubicación hasta entregarlas todas:
+
+- broadcast: cada actualización a toda la sala (comportamiento por defecto)
+- política k / radio: solo a los cercanos, más un FRIENDS_MOVED agrupado
+
+Uso:
+    python -m benchmarks.fanout_bench --members 100,500,1000 --updates 2000 --k 10 --radius 300
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from app.core.config import settings
+from app.core.connection_manager import connection_manager
+from app.core.interest import interest_manager
+from app.core.room_manager import room_manager
+from app.core.spatial_index import spatial_index
+from app.models.room import FanoutPolicy
+
+from benchmarks._common import compare_to_baseline, write_results
+
+CENTER = (19.4326, -99.1332)
+
+
+class NullWebSocket:
+    """WebSocket falso: las escrituras no cuestan nada"""
+
+    async def send_text(self, message: str):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def run_room(members: int, updates: int, policy, spread_deg: float, rng: random.Random) -> dict:
+    room_code = f"B{members:05d}"
+    room_manager.create_room(room_code)
+    connections = [connection_manager.add(NullWebSocket(), room_code, f"user{i}") for i in range(members)]
+    positions = {}
+    for i in range(members):
+        positions[f"user{i}"] = (CENTER[0] + rng.uniform(-spread_deg, spread_deg),
+                                 CENTER[1] + rng.uniform(-spread_deg, spread_deg))
+        spatial_index.update(room_code, f"user{i}", *positions[f"user{i}"])
+    if policy is not None:
+        interest_manager.set_policy(room_code, policy)
+
+    moves = [rng.randrange(members) for _ in range(updates)]
+    start = time.perf_counter()
+    delivered = 0
+    for i in moves:
+        username = f"user{i}"
+        lat, lon = positions[username]
+        lat, lon = lat + rng.uniform(-5e-5, 5e-5), lon + rng.uniform(-5e-5, 5e-5)
+        positions[username] = (lat, lon)
+        spatial_index.update(room_code, username, lat, lon)
+        message = json.dumps({"event": "FRIEND_MOVED", "data": {"username": username, "lat": lat, "lon": lon}})
+        delivered += interest_manager.fanout(room_code, username, lat, lon, message, exclude=connections[i])
+        # Dejar trabajar a los escritores (como entre mensajes reales)
+        await asyncio.sleep(0)
+    # Un único FRIENDS_MOVED agrupado para toda la sala
+    if policy is not None and interest_manager.flush_due(now=float("inf")):
+        delivered += members
+    await asyncio.gather(*(connection.flush() for connection in connections))
+    elapsed = time.perf_counter() - start
+
+    interest_manager.clear_policy(room_code)
+    for connection in connections:
+        connection_manager.remove(connection)
+        await connection.close()
+        spatial_index.remove(room_code, connection.username)
+    room_manager.delete_room(room_code)
+    return {
+        "us_per_update": round(elapsed / updates * 1e6, 1),
+        "messages_per_update": round(delivered / updates, 1),
+    }
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    spread_deg = args.spread_km / 111.0
+    results = {"updates": args.updates, "k": args.k, "radius_m": args.radius}
+    policies = {
+        "broadcast": None,
+        "k": FanoutPolicy(k=args.k, far_interval_seconds=10),
+        "radius": FanoutPolicy(radius_m=args.radius, far_interval_seconds=10),
+    }
+    for members in (int(m) for m in args.members.split(",")):
+        for name, policy in policies.items():
+            room = await run_room(members, args.updates, policy, spread_deg, rng)
+            results[f"m{members}_{name}_us_per_update"] = room["us_per_update"]
+            results[f"m{members}_{name}_messages_per_update"] = room["messages_per_update"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", default="100,500,1000")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--radius", type=float, default=300.0)
+    parser.add_argument("--spread-km", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Guardar resultados en este JSON")
+    parser.add_argument("--baseline", help="JSON anterior para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Que la cola de salida no descarte mensajes durante la medición
+    settings.ws_send_queue_size = max(settings.ws_send_queue_size, args.updates + 10)
+    results = asyncio.run(run(args))
+    write_results(results, args.output)
+
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results,
+            args.baseline,
+            higher_is_better=[],
+            lower_is_better=[key for key in results if key.endswith("_us_per_update")],
+            max_regression=args.max_regression,
+        )
+        if regressions:
+            print("Regresiones detectadas:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark de la evaluación de geocercas (app/core/geofences.py).
+
+Para cada combinación miembros x geocercas mueve a todos los miembros un poco
+entre ticks (el peor caso: todas las salas con cambios) y mide el tiempo de
+RoomGeofences.evaluate, que calcula con NumPy los pares (miembro, geocerca)
+que están dentro y los compara con los del tick anterior. Como referencia se
+mide el mismo cálculo con un bucle de Python en la combinación más pequeña.
+
+Uso:
+    python -m benchmarks.geofence_bench --members 1000,5000 --fences 100,1000,5000 --ticks 20
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime
+
+from app.core.geofences import RoomGeofences
+from app.core.spatial_index import GridIndex
+from app.models.room import Geofence
+
+from benchmarks._common import compare_to_baseline, percentile, write_results
+
+CENTER = (19.4326, -99.1332)
+
+
+def build_room(members: int, fences: int, spread_deg: float, rng: random.Random):
+    index = GridIndex(CENTER[0], 250)
+    for i in range(members):
+        index.update(f"user{i}", CENTER[0] + rng.uniform(-spread_deg, spread_deg),
+                     CENTER[1] + rng.uniform(-spread_deg, spread_deg))
+    room = RoomGeofences()
+    now = datetime.utcnow()
+    for i in range(fences):
+        fence = Geofence(
+            id=i + 1, name=f"fence{i}", created_at=now, radius_m=rng.uniform(50, 500),
+            lat=CENTER[0] + rng.uniform(-spread_deg, spread_deg),
+            lon=CENTER[1] + rng.uniform(-spread_deg, spread_deg),
+        )
+        room.fences[fence.id] = fence
+    return index, room
+
+
+def move_all(index: GridIndex, rng: random.Random):
+    for username, position in list(index.positions.items()):
+        index.update(username, position[0] + rng.uniform(-2e-4, 2e-4), position[1] + rng.uniform(-2e-4, 2e-4))
+
+
+def python_loop(index: GridIndex, room: RoomGeofences) -> int:
+    """Mismo cálculo que evaluate() sin vectorizar (solo como referencia)"""
+    inside = 0
+    fences = [(f.lon * index.kx, f.lat * index.ky, f.radius_m ** 2) for f in room.fences.values()]
+    for position in index.positions.values():
+        x, y = position[2], position[3]
+        for fx, fy, r2 in fences:
+            if (x - fx) ** 2 + (y - fy) ** 2 <= r2:
+                inside += 1
+    return inside
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", default="1000,5000")
+    parser.add_argument("--fences", default="100,1000,5000")
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--spread-km", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Guardar resultados en este JSON")
+    parser.add_argument("--baseline", help="JSON anterior para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    spread_deg = args.spread_km / 111.0
+    results = {"ticks": args.ticks}
+    member_counts = [int(m) for m in args.members.split(",")]
+    fence_counts = [int(f) for f in args.fences.split(",")]
+
+    for members in member_counts:
+        for fences in fence_counts:
+            index, room = build_room(members, fences, spread_deg, rng)
+            room.evaluate(index)  # Primer tick: estado inicial
+            samples, events = [], 0
+            for _ in range(args.ticks):
+                move_all(index, rng)
+                start = time.perf_counter()
+                events += len(room.evaluate(index))
+                samples.append((time.perf_counter() - start) * 1000)
+            key = f"m{members}_f{fences}"
+            results[f"{key}_tick_p50_ms"] = round(percentile(samples, 50), 3)
+            results[f"{key}_tick_p95_ms"] = round(percentile(samples, 95), 3)
+            results[f"{key}_pairs_per_sec"] = round(members * fences / (percentile(samples, 50) / 1000), 1)
+            results[f"{key}_events_per_tick"] = round(events / args.ticks, 1)
+
+    # Referencia sin NumPy (y comprobación de que ambos cuentan los mismos pares)
+    index, room = build_room(member_counts[0], fence_counts[0], spread_deg, rng)
+    start = time.perf_counter()
+    inside = python_loop(index, room)
+    results[f"m{member_counts[0]}_f{fence_counts[0]}_python_loop_ms"] = round(
+        (time.perf_counter() - start) * 1000, 3)
+    room.evaluate(index)
+    assert len(room.inside_keys) == inside, "NumPy y el bucle de Python no coinciden"
+
+    write_results(results, args.output)
+
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results,
+            args.baseline,
+            higher_is_better=[key for key in results if key.endswith("_pairs_per_sec")],
+            lower_is_better=[key for key in results if key.endswith("_tick_p50_ms")],
+            max_regression=args.max_regression,
+        )
+        if regressions:
+            print("Regresiones detectadas:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark de la subida de puntos acumulados sin conexión.
+
+Mide puntos por segundo de extremo a extremo (descomprimir gzip, decodificar
+con msgspec y procesar el lote con location_batches.ingest, con el historial
+activado) para varios tamaños de lote, en una sala con M sockets falsos. Como
+referencia, los mismos puntos enviados uno a uno como UPDATE_LOCATION por el
+socket (decodificar, historial, índice espacial, agregados y reenvío a la
+sala por cada punto).
+
+Uso:
+    python -m benchmarks.location_batch_bench --batch-sizes 10,100,1000,5000 --points 50000 --members 50
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import random
+import sys
+import time
+
+from app.core.config import settings
+from app.core.connection_manager import connection_manager
+from app.core.interest import interest_manager
+from app.core.location_batch import decompress_body, location_batches
+from app.core.location_history import location_history
+from app.core.room_aggregates import room_aggregates
+from app.core.room_events import room_events
+from app.core.room_manager import room_manager
+from app.core.spatial_index import spatial_index
+from app.models.radar import decode_inbound, decode_location_batch
+
+from benchmarks._common import compare_to_baseline, write_results
+
+CENTER = (19.4326, -99.1332)
+ROOM = "BATCH1"
+
+
+class NullWebSocket:
+    """WebSocket falso: las escrituras no cuestan nada"""
+
+    async def send_text(self, message: str):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def make_track(count: int, rng: random.Random) -> list:
+    """Trayectoria de un teléfono: un punto por segundo terminando ahora"""
+    now_ms = int(time.time() * 1000)
+    lat, lon = CENTER
+    points = []
+    for i in range(count):
+        lat += rng.uniform(-5e-5, 5e-5)
+        lon += rng.uniform(-5e-5, 5e-5)
+        points.append({"lat": lat, "lon": lon, "ts": now_ms - (count - i) * 1000})
+    return points
+
+
+async def run_batches(points: list, batch_size: int, connections: list) -> float:
+    """Segundos para subir todos los puntos en lotes comprimidos de batch_size"""
+    bodies = [
+        gzip.compress(json.dumps({"username": "offline", "points": points[i:i + batch_size]}).encode())
+        for i in range(0, len(points), batch_size)
+    ]
+    start = time.perf_counter()
+    for body in bodies:
+        data = decompress_body(body, "gzip", settings.location_batch_max_bytes)
+        batch = decode_location_batch(data)
+        location_batches.ingest(ROOM, batch.username, batch.points)
+        await asyncio.sleep(0)
+    await asyncio.gather(*(connection.flush() for connection in connections))
+    return time.perf_counter() - start
+
+
+async def run_per_point(points: list, connections: list) -> float:
+    """Segundos para los mismos puntos como UPDATE_LOCATION uno a uno"""
+    frames = [json.dumps({"event": "UPDATE_LOCATION", "data": {"lat": p["lat"], "lon": p["lon"]}}).encode()
+              for p in points]
+    start = time.perf_counter()
+    for frame in frames:
+        message = decode_inbound(frame)
+        lat, lon = message.data.lat, message.data.lon
+        location_history.record(ROOM, "offline", lat, lon)
+        spatial_index.update(ROOM, "offline", lat, lon)
+        room_aggregates.update(ROOM, "offline", lat, lon)
+        outbound = room_events.record(ROOM, {"event": "FRIEND_MOVED", "data": {"username": "offline", "lat": lat, "lon": lon}})
+        interest_manager.fanout(ROOM, "offline", lat, lon, outbound)
+        await asyncio.sleep(0)
+    await asyncio.gather(*(connection.flush() for connection in connections))
+    return time.perf_counter() - start
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    room_manager.create_room(ROOM)
+    connections = [connection_manager.add(NullWebSocket(), ROOM, f"user{i}") for i in range(args.members)]
+    points = make_track(args.points, rng)
+    results = {"points": args.points, "members": args.members}
+
+    for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+        location_history.buffers.clear()
+        location_history.buffered = 0
+        elapsed = await run_batches(points, batch_size, connections)
+        results[f"batch{batch_size}_points_per_sec"] = round(args.points / elapsed, 1)
+        results[f"batch{batch_size}_us_per_point"] = round(elapsed / args.points * 1e6, 2)
+
+    location_history.buffers.clear()
+    location_history.buffered = 0
+    elapsed = await run_per_point(points, connections)
+    results["per_point_points_per_sec"] = round(args.points / elapsed, 1)
+    results["per_point_us_per_point"] = round(elapsed / args.points * 1e6, 2)
+
+    for connection in connections:
+        connection_manager.remove(connection)
+        await connection.close()
+    room_manager.delete_room(ROOM)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", default="10,100,1000,5000")
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Guardar resultados en este JSON")
+    parser.add_argument("--baseline", help="JSON anterior para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Historial activo sin tarea de volcado: se mide solo el buffer en memoria
+    settings.location_history_enabled = True
+    settings.location_history_max_buffered_points = args.points + 1
+    settings.ws_send_queue_size = max(settings.ws_send_queue_size, args.points + 10)
+    results = asyncio.run(run(args))
+    write_results(results, args.output)
+
+    if args.baseline:
+        largest = args.batch_sizes.split(",")[-1]
+        regressions = compare_to_baseline(
+            results,
+            args.baseline,
+            higher_is_better=[f"batch{largest}_points_per_sec"],
+            lower_is_better=[f"batch{largest}_us_per_point"],
+            max_regression=args.max_regression,
+        )
+        if regressions:
+            print("Regresiones detectadas:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark del pipeline de logging.
+
+Compara el coste en el hilo que registra (el event loop en producción) entre:
+- basicConfig con StreamHandler síncrono (configuración anterior)
+- QueueHandler + hilo escritor (app/core/logging_config.py), texto y JSON
+- mensajes filtrados por nivel con f-string frente a formato diferido (%s)
+
+También mide el lag máximo de un event loop mientras registra a ritmo alto.
+Se prueban dos destinos: /dev/null (escritura gratis, solo se ve el coste de
+CPU) y un destino lento que simula un pipe de stderr con backpressure (ej:
+driver de logs de Docker saturado), que es donde el handler síncrono bloquea
+el event loop.
+
+Uso:
+    python -m benchmarks.logging_bench --lines 100000 --slow-write-us 200
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from app.core import logging_config
+from app.core.config import settings
+
+
+class SlowStream:
+    """Stream que tarda `delay` segundos en cada write (pipe con backpressure)"""
+
+    def __init__(self, target, delay: float):
+        self.target = target
+        self.delay = delay
+
+    def write(self, text: str):
+        time.sleep(self.delay)
+        return self.target.write(text)
+
+    def flush(self):
+        self.target.flush()
+
+
+def reset_root():
+    logging_config.shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+
+def configure(mode: str):
+    """mode: sync, queue-text, queue-json"""
+    reset_root()
+    if mode == "sync":
+        logging.basicConfig(level=logging.INFO, format=logging_config.TEXT_FORMAT, force=True)
+        return
+    settings.log_queue_enabled = True
+    settings.log_format = "json" if mode == "queue-json" else "text"
+    logging_config.setup_logging()
+
+
+def per_call_us(logger: logging.Logger, lines: int, event: str = None) -> float:
+    extra = {"event": event, "room": "ABC123"} if event else {"room": "ABC123"}
+    start = time.perf_counter()
+    for i in range(lines):
+        logger.info("Usuario %s (%s) se unió a sala %s", f"user{i}", i, "ABC123", extra=extra)
+    return (time.perf_counter() - start) / lines * 1e6
+
+
+async def loop_lag_while_logging(logger: logging.Logger, lines: int) -> float:
+    """Lag máximo de un latido de 1 ms mientras se registran `lines` líneas en ráfagas"""
+    max_lag = 0.0
+    done = False
+
+    async def heartbeat():
+        nonlocal max_lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            max_lag = max(max_lag, time.perf_counter() - start - 0.001)
+
+    beat = asyncio.create_task(heartbeat())
+    for i in range(0, lines, 100):
+        for j in range(100):
+            logger.info("Ubicación de %s en sala %s", f"user{i + j}", "ABC123")
+        await asyncio.sleep(0)
+    done = True
+    await beat
+    return max_lag * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=100_000)
+    parser.add_argument("--slow-write-us", type=float, default=200,
+                        help="Retardo por escritura del destino lento")
+    args = parser.parse_args()
+
+    results_stream = sys.stdout
+    devnull = open(os.devnull, "w")
+    sinks = {"devnull": devnull, "slow": SlowStream(devnull, args.slow_write_us / 1e6)}
+
+    logger = logging.getLogger("bench")
+    results = {}
+
+    for sink_name, sink in sinks.items():
+        # Los handlers toman sys.stderr al configurarse
+        sys.stderr = sink
+        lines = args.lines if sink_name == "devnull" else max(1, args.lines // 20)
+        for mode in ("sync", "queue-text", "queue-json"):
+            configure(mode)
+            call_us = per_call_us(logger, lines)
+            drain_start = time.perf_counter()
+            logging_config.shutdown_logging()  # Espera a que el hilo vacíe la cola
+            drain_s = time.perf_counter() - drain_start
+            configure(mode)
+            lag_ms = asyncio.run(loop_lag_while_logging(logger, lines))
+            logging_config.shutdown_logging()
+            results[f"{sink_name}/{mode}"] = {
+                "lines": lines,
+                "caller_us_per_line": round(call_us, 2),
+                "writer_drain_s": round(drain_s, 3),
+                "max_loop_lag_ms": round(lag_ms, 2)
+            }
+    sys.stderr = devnull
+
+    # Muestreo: 1 de cada 100 eventos "ws.location" llega a la cola
+    settings.log_sample_rates = "ws.location=0.01"
+    configure("queue-text")
+    results["devnull/queue-text-sampled-1%"] = {"caller_us_per_line": round(per_call_us(logger, args.lines, "ws.location"), 2)}
+    logging_config.shutdown_logging()
+
+    # Mensajes filtrados por nivel: f-string se formatea igualmente, %s no
+    logger.setLevel(logging.WARNING)
+    start = time.perf_counter()
+    for i in range(args.lines):
+        logger.info(f"Usuario user{i} ({i}) se unió a sala ABC123")
+    fstring_us = (time.perf_counter() - start) / args.lines * 1e6
+    start = time.perf_counter()
+    for i in range(args.lines):
+        logger.info("Usuario %s (%s) se unió a sala %s", f"user{i}", i, "ABC123")
+    lazy_us = (time.perf_counter() - start) / args.lines * 1e6
+    results["filtered_out"] = {"fstring_us": round(fstring_us, 3), "lazy_us": round(lazy_us, 3)}
+
+    reset_root()
+    sys.stderr = sys.__stderr__
+    results_stream.write(json.dumps(results, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
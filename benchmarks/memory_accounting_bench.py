@@ -0,0 +1,162 @@
+"""
+Benchmark de la contabilidad de memoria (app/core/memory_accounting.py).
+
+Llena R salas con M miembros cada una: sala en RoomManager, posiciones,
+agregados, registro de eventos y un socket por miembro con Q mensajes
+atascados en su cola (el teléfono no lee). Mide con tracemalloc lo que
+realmente se asignó y lo compara con lo que contabiliza memory_accounting:
+
+- bytes por sala, por socket y por mensaje encolado (medidos)
+- cobertura: bytes contabilizados / bytes medidos
+- tiempo de generar el reporte completo
+
+Uso:
+    python -m benchmarks.memory_accounting_bench --rooms 2000 --members 8 --queued 20
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import random
+import sys
+import time
+import tracemalloc
+
+from app.core.config import settings
+from app.core.connection_manager import connection_manager
+from app.core.memory_accounting import memory_accounting
+from app.core.room_aggregates import room_aggregates
+from app.core.room_events import room_events
+from app.core.room_manager import room_manager
+from app.core.spatial_index import spatial_index
+
+from benchmarks._common import compare_to_baseline, write_results
+
+CENTER = (19.4326, -99.1332)
+
+
+class StalledWebSocket:
+    """WebSocket de un teléfono que no lee: la cola de salida se llena"""
+
+    def __init__(self):
+        self.released = asyncio.Event()
+
+    async def send_text(self, message: str):
+        await self.released.wait()
+
+    async def send_bytes(self, message: bytes):
+        await self.released.wait()
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def traced() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    codes = [f"M{i:05d}" for i in range(args.rooms)]
+    tracemalloc.start()
+
+    before = traced()
+    for code in codes:
+        room_manager.create_room(code)
+        for j in range(args.members):
+            username = f"{code}-u{j}"
+            room_manager.add_user_to_room(code, hash(username), username)
+            lat, lon = CENTER[0] + rng.uniform(-0.05, 0.05), CENTER[1] + rng.uniform(-0.05, 0.05)
+            spatial_index.update(code, username, lat, lon)
+            room_aggregates.update(code, username, lat, lon)
+            room_events.record(code, {"event": "FRIEND_MOVED", "data": {"username": username, "lat": lat, "lon": lon}})
+    rooms_bytes = traced() - before
+
+    before = traced()
+    connections = [
+        connection_manager.add(StalledWebSocket(), code, f"{code}-u{j}")
+        for code in codes for j in range(args.members)
+    ]
+    await asyncio.sleep(0)
+    sockets_bytes = traced() - before
+
+    before = traced()
+    message = json.dumps({"event": "FRIEND_MOVED", "data": {"username": "someone", "lat": CENTER[0], "lon": CENTER[1]}})
+    for _ in range(args.queued + 1):
+        for connection in connections:
+            # Un mensaje distinto por socket (como tras etiquetar/comprimir)
+            connection.send(message + " ")
+        await asyncio.sleep(0)
+    queued_bytes = traced() - before
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    report = await memory_accounting.report(top=10)
+    report_seconds = time.perf_counter() - start
+
+    measured = rooms_bytes + sockets_bytes + queued_bytes
+    total_sockets = len(connections)
+    total_queued = max(1, report["queued_messages"])
+    results = {
+        "rooms": args.rooms,
+        "members": args.members,
+        "queued_per_socket": args.queued,
+        "measured_bytes_per_room": round(rooms_bytes / args.rooms, 1),
+        "accounted_bytes_per_room": round(
+            (report["accounted_bytes"] - report["totals"]["connections"]) / args.rooms, 1),
+        "measured_bytes_per_socket": round(sockets_bytes / total_sockets, 1),
+        # La tarea de envío y su frame no se contabilizan: la diferencia es eso
+        "accounted_bytes_per_socket": round(
+            (report["totals"]["connections"] - report["queued_bytes"]) / total_sockets, 1),
+        "measured_bytes_per_queued_message": round(queued_bytes / total_queued, 1),
+        "accounted_bytes_per_queued_message": round(report["queued_bytes"] / total_queued, 1),
+        "coverage": round(report["accounted_bytes"] / measured, 3) if measured else None,
+        "report_ms": round(report_seconds * 1000, 1),
+        "report_us_per_room": round(report_seconds / args.rooms * 1e6, 1),
+    }
+
+    for connection in connections:
+        await connection.close()
+        connection_manager.remove(connection)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=2000)
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--queued", type=int, default=20, help="Mensajes atascados por socket")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Guardar resultados en este JSON")
+    parser.add_argument("--baseline", help="JSON anterior para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Los logs por operación dominarían la medición
+    logging.disable(logging.INFO)
+    settings.ws_send_queue_size = max(settings.ws_send_queue_size, args.queued + 10)
+    settings.rate_hint_enabled = False
+    results = asyncio.run(run(args))
+    write_results(results, args.output)
+
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results,
+            args.baseline,
+            higher_is_better=[],
+            lower_is_better=[
+                "measured_bytes_per_room", "measured_bytes_per_socket",
+                "measured_bytes_per_queued_message", "report_us_per_room",
+            ],
+            max_regression=args.max_regression,
+        )
+        if regressions:
+            print("Regresiones detectadas:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
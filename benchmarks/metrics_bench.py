@@ -0,0 +1,52 @@
+"""
+Benchmark del registro de métricas.
+
+Mide el coste de las actualizaciones que se hacen en el hot path del
+WebSocket del radar (contador, contador con etiqueta e histograma) y el
+coste de generar la exposición completa de /metrics.
+
+Uso:
+    python -m benchmarks.metrics_bench --ops 1000000
+"""
+
+import argparse
+import json
+import time
+
+from app.core.metrics import MetricsRegistry
+
+
+def per_op_ns(fn, ops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(ops):
+        fn()
+    return (time.perf_counter() - start) / ops * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+    counter = registry.counter("bench_counter", "Contador")
+    labeled = registry.counter("bench_labeled", "Contador con etiqueta", labelnames=("reason",))
+    histogram = registry.histogram("bench_latency_seconds", "Histograma")
+    baseline = per_op_ns(lambda: None, args.ops)
+
+    results = {
+        "loop_baseline_ns": round(baseline, 1),
+        "counter_inc_ns": round(per_op_ns(counter.inc, args.ops) - baseline, 1),
+        "labeled_counter_inc_ns": round(per_op_ns(lambda: labeled.labels("normal").inc(), args.ops) - baseline, 1),
+        "histogram_observe_ns": round(per_op_ns(lambda: histogram.observe(0.0007), args.ops) - baseline, 1),
+    }
+
+    start = time.perf_counter()
+    for _ in range(100):
+        registry.render()
+    results["render_us"] = round((time.perf_counter() - start) / 100 * 1e6, 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark del limitador de peticiones (token bucket).
+
+Mide el coste por llamada de RateLimiter.hit con claves repetidas (cubetas
+calientes), claves nuevas (creación de cubetas) y el coste del desalojo.
+
+Uso:
+    python -m benchmarks.rate_limiter_bench --ops 200000 --keys 10000
+"""
+
+import argparse
+import json
+import time
+
+from app.core.rate_limiter import RateLimiter
+
+
+def bench_hot_keys(limiter: RateLimiter, ops: int, keys: int) -> float:
+    """Microsegundos por llamada con un conjunto fijo de claves"""
+    key_list = [f"ip:10.0.{i // 256}.{i % 256}" for i in range(keys)]
+    start = time.perf_counter()
+    for i in range(ops):
+        limiter.hit("login", key_list[i % keys])
+    return (time.perf_counter() - start) / ops * 1e6
+
+
+def bench_new_keys(limiter: RateLimiter, ops: int) -> float:
+    """Microsegundos por llamada creando una cubeta nueva en cada una"""
+    key_list = [f"user:{i}@example.com" for i in range(ops)]
+    start = time.perf_counter()
+    for key in key_list:
+        limiter.hit("register", key)
+    return (time.perf_counter() - start) / ops * 1e6
+
+
+def bench_eviction(limiter: RateLimiter) -> dict:
+    """Tiempo de un desalojo completo con todas las cubetas inactivas"""
+    buckets = len(limiter.buckets)
+    start = time.perf_counter()
+    # Simular que ha pasado una hora: todas las cubetas están llenas
+    evicted = limiter.evict_idle(time.monotonic() + 3600)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return {"buckets": buckets, "evicted": evicted, "ms": round(elapsed_ms, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=200_000)
+    parser.add_argument("--keys", type=int, default=10_000)
+    args = parser.parse_args()
+
+    limiter = RateLimiter()
+    results = {
+        "hot_keys_us_per_op": round(bench_hot_keys(limiter, args.ops, args.keys), 3),
+        "new_keys_us_per_op": round(bench_new_keys(limiter, args.ops), 3),
+        "eviction": bench_eviction(limiter),
+        "stats": limiter.get_stats()
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Micro-benchmark de RoomManager y RoomService a gran escala.
+
+Crea N salas, las llena de usuarios, aplica churn realista (usuarios que se
+cambian de sala o salen) y mide ops/seg de cada operación y la memoria por
+sala (tracemalloc, en una pasada aparte para no distorsionar los tiempos).
+Con --baseline falla (código de salida 1) si alguna operación empeora más
+de --max-regression respecto a un JSON anterior.
+
+Uso:
+    python -m benchmarks.room_manager_bench --rooms 10000 --output rooms.json
+    python -m benchmarks.room_manager_bench --rooms 1000000 --baseline rooms.json
+"""
+
+import argparse
+import gc
+import importlib
+import logging
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.core.room_manager import RoomManager
+from app.core.room_store import MemoryRoomStore
+from app.services.room_service import RoomService
+
+from benchmarks._common import compare_to_baseline, write_results
+
+
+def timed(results: dict, name: str, ops: int, fn):
+    """Ejecuta fn() y guarda ops/seg bajo `<name>_ops_per_sec`"""
+    gc.collect()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    results[f"{name}_ops_per_sec"] = round(ops / elapsed, 1) if elapsed > 0 else float("inf")
+    return elapsed
+
+
+def bench_manager(rooms: int, users_per_room: int, churn_ops: int, rng: random.Random) -> dict:
+    manager = RoomManager(MemoryRoomStore())
+    results: dict = {}
+    codes = [f"{i:06X}" for i in range(rooms)]
+    total_users = rooms * users_per_room
+
+    timed(results, "create_room", rooms, lambda: [manager.create_room(code) for code in codes])
+
+    def fill():
+        user_id = 0
+        for code in codes:
+            for _ in range(users_per_room):
+                manager.add_user_to_room(code, user_id, f"user{user_id}")
+                user_id += 1
+    timed(results, "add_user_to_room", total_users, fill)
+
+    # Churn: 70% cambio de sala, 30% salida
+    moves = [(rng.randrange(total_users), codes[rng.randrange(rooms)], rng.random() < 0.7)
+             for _ in range(churn_ops)]
+
+    def churn():
+        for user_id, code, is_join in moves:
+            if is_join:
+                manager.add_user_to_room(code, user_id, f"user{user_id}")
+            else:
+                manager.remove_user_from_current_room(user_id)
+    timed(results, "churn_join_leave", churn_ops, churn)
+
+    leaves = [(codes[(i // users_per_room) % rooms], i) for i in range(0, total_users, max(1, total_users // churn_ops))]
+    timed(results, "remove_user_from_room", len(leaves),
+          lambda: [manager.remove_user_from_room(code, user_id) for code, user_id in leaves])
+
+    stats_calls = 20
+    timed(results, "get_stats", stats_calls, lambda: [manager.get_stats() for _ in range(stats_calls)])
+
+    # Una pasada de limpieza con todas las salas vacías expiradas
+    for code in codes[: rooms // 2]:
+        for user in list(manager.get_room(code).users):
+            manager.remove_user_from_room(code, user.user_id)
+    future = datetime.utcnow() + timedelta(seconds=settings.room_empty_timeout_seconds + 1)
+    empty_rooms = manager.get_stats()["empty_rooms"]
+    elapsed = timed(results, "cleanup_pass", 1, lambda: manager.purge_empty_rooms(future))
+    results["cleanup_pass_ms"] = round(elapsed * 1000, 2)
+    results["cleanup_rooms_deleted"] = empty_rooms
+
+    remaining = manager.room_codes()
+    timed(results, "delete_room", len(remaining), lambda: [manager.delete_room(code) for code in remaining])
+    return results
+
+
+def bench_service(rooms: int, users_per_room: int) -> dict:
+    """RoomService usa el room_manager global; se sustituye por uno limpio"""
+    # app.services exporta la instancia `room_service`, que oculta al módulo
+    room_service_module = importlib.import_module("app.services.room_service")
+    original_manager = room_service_module.room_manager
+    room_service_module.room_manager = RoomManager(MemoryRoomStore())
+    results: dict = {}
+    failures = 0
+    created = []
+
+    def create():
+        nonlocal failures
+        for _ in range(rooms):
+            try:
+                created.append(RoomService.create_room().code)
+            except Exception:
+                failures += 1
+    timed(results, "service_create_room", rooms, create)
+    results["service_create_room_failures"] = failures
+
+    def join():
+        user_id = 0
+        for code in created:
+            for _ in range(users_per_room):
+                RoomService.join_room(code, user_id, f"user{user_id}")
+                user_id += 1
+    joins = max(1, len(created) * users_per_room)
+    timed(results, "service_join_room", joins, join)
+    room_service_module.room_manager = original_manager
+    return results
+
+
+def bench_memory(rooms: int, users_per_room: int) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    manager = RoomManager(MemoryRoomStore())
+    before = tracemalloc.get_traced_memory()[0]
+    user_id = 0
+    for i in range(rooms):
+        code = f"{i:06X}"
+        manager.create_room(code)
+        for _ in range(users_per_room):
+            manager.add_user_to_room(code, user_id, f"user{user_id}")
+            user_id += 1
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return {"bytes_per_room": round(used / rooms, 1), "total_mb": round(used / 1e6, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=10_000)
+    parser.add_argument("--users-per-room", type=int, default=4)
+    parser.add_argument("--churn-ops", type=int, default=50_000)
+    parser.add_argument("--service-rooms", type=int, default=2_000,
+                        help="Salas creadas vía RoomService (genera códigos reales)")
+    parser.add_argument("--memory-rooms", type=int, default=None,
+                        help="Salas para medir memoria (default: --rooms, máximo 100000)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Guardar resultados en este JSON")
+    parser.add_argument("--baseline", help="JSON anterior para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Los logs por operación dominarían la medición
+    logging.disable(logging.INFO)
+    rng = random.Random(args.seed)
+
+    results = {"rooms": args.rooms, "users_per_room": args.users_per_room, "churn_ops": args.churn_ops}
+    results.update(bench_manager(args.rooms, args.users_per_room, args.churn_ops, rng))
+    results.update(bench_service(args.service_rooms, args.users_per_room))
+    results.update(bench_memory(args.memory_rooms or min(args.rooms, 100_000), args.users_per_room))
+    write_results(results, args.output)
+
+    if args.baseline:
+        ops_keys = [key for key in results if key.endswith("_ops_per_sec")]
+        regressions = compare_to_baseline(
+            results,
+            args.baseline,
+            higher_is_better=ops_keys,
+            lower_is_better=["bytes_per_room", "cleanup_pass_ms"],
+            max_regression=args.max_regression,
+        )
+        if regressions:
+            print("Regresiones detectadas:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Benchmark de los backends de salas (app/core/room_store.py).
+
+Para cada backend (memory, sqlite, sqlite+cache) llena R salas y mide la
+latencia p50/p95/p99 por operación de RoomManager:
+
+- join: add_user_to_room (incluye salir de la sala anterior)
+- get_room / room_exists / user_room: lecturas, con el 80% de las consultas
+  sobre el 20% de las salas (salas calientes)
+
+Con --workers N además lanza N procesos que hacen joins a la vez sobre el
+mismo archivo SQLite (lo que pasa con `uvicorn --workers N`) y mide joins/seg
+totales y que ningún usuario quede en dos salas.
+
+Uso:
+    python -m benchmarks.room_store_bench --rooms 2000 --ops 20000 --workers 4
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from app.core.config import settings
+from app.core.room_manager import RoomManager
+from app.core.room_store import CachedRoomStore, MemoryRoomStore, SQLiteRoomStore
+
+from benchmarks._common import compare_to_baseline, percentile, write_results
+
+
+def make_store(backend: str, path: str):
+    if backend == "memory":
+        return MemoryRoomStore()
+    if backend == "sqlite":
+        return SQLiteRoomStore(path)
+    return CachedRoomStore(SQLiteRoomStore(path), settings.room_store_cache_ttl_seconds)
+
+
+def latencies(fn, args_list: list) -> dict:
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return {
+        "p50_us": round(percentile(samples, 50) * 1e6, 2),
+        "p95_us": round(percentile(samples, 95) * 1e6, 2),
+        "p99_us": round(percentile(samples, 99) * 1e6, 2),
+    }
+
+
+def hot_choice(codes: list, rng: random.Random) -> str:
+    """80% de las consultas van al 20% de las salas"""
+    hot = max(1, len(codes) // 5)
+    if rng.random() < 0.8:
+        return codes[rng.randrange(hot)]
+    return codes[rng.randrange(len(codes))]
+
+
+def bench_backend(backend: str, rooms: int, users: int, ops: int, path: str, rng: random.Random) -> dict:
+    manager = RoomManager(make_store(backend, path))
+    codes = [f"{i:06X}" for i in range(rooms)]
+    for code in codes:
+        manager.create_room(code)
+
+    results = {}
+    joins = [(codes[rng.randrange(rooms)], rng.randrange(users), "user") for _ in range(ops)]
+    for key, value in latencies(manager.add_user_to_room, joins).items():
+        results[f"{backend}_join_{key}"] = value
+
+    lookups = [(hot_choice(codes, rng),) for _ in range(ops)]
+    for name, fn in (("get_room", manager.get_room), ("room_exists", manager.room_exists)):
+        for key, value in latencies(fn, lookups).items():
+            results[f"{backend}_{name}_{key}"] = value
+    user_lookups = [(rng.randrange(users // 5) if rng.random() < 0.8 else rng.randrange(users),) for _ in range(ops)]
+    for key, value in latencies(manager.get_user_current_room, user_lookups).items():
+        results[f"{backend}_user_room_{key}"] = value
+    return results
+
+
+def worker_joins(path: str, codes: list, users: int, ops: int, seed: int, queue):
+    rng = random.Random(seed)
+    manager = RoomManager(SQLiteRoomStore(path))
+    start = time.perf_counter()
+    for _ in range(ops):
+        manager.add_user_to_room(codes[rng.randrange(len(codes))], rng.randrange(users), "user")
+    queue.put(time.perf_counter() - start)
+
+
+def bench_workers(workers: int, rooms: int, users: int, ops: int, path: str) -> dict:
+    """N procesos haciendo joins a la vez sobre el mismo archivo"""
+    manager = RoomManager(SQLiteRoomStore(path))
+    codes = [f"W{i:05X}" for i in range(rooms)]
+    for code in codes:
+        manager.create_room(code)
+
+    queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker_joins, args=(path, codes, users, ops, seed, queue))
+        for seed in range(workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    stats = manager.get_stats()
+    members = sum(len(manager.get_room(code).users) for code in codes)
+    return {
+        "workers": workers,
+        "workers_joins_per_sec": round(workers * ops / elapsed, 1),
+        # Cada usuario en una sola sala: los miembros suman lo mismo que el mapeo
+        "workers_consistent": members == stats["total_users"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--backends", default="memory,sqlite,sqlite+cache")
+    parser.add_argument("--workers", type=int, default=0, help="Procesos concurrentes sobre SQLite (0 = no)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Guardar resultados en este JSON")
+    parser.add_argument("--baseline", help="JSON anterior para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Los logs por operación dominarían la medición
+    logging.disable(logging.INFO)
+    rng = random.Random(args.seed)
+    results = {"rooms": args.rooms, "users": args.users, "ops": args.ops}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends.split(","):
+            path = os.path.join(tmp, f"{backend}.db")
+            results.update(bench_backend(backend, args.rooms, args.users, args.ops, path, rng))
+        if args.workers:
+            results.update(bench_workers(args.workers, args.rooms, args.users, args.ops, os.path.join(tmp, "workers.db")))
+
+    write_results(results, args.output)
+
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results,
+            args.baseline,
+            higher_is_better=[key for key in results if key.endswith("_per_sec")],
+            lower_is_better=[key for key in results if key.endswith("_p95_us")],
+            max_regression=args.max_regression,
+        )
+        if regressions:
+            print("Regresiones detectadas:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark del índice espacial por sala (app/core/spatial_index.py).
+
+Para salas de miles de miembros repartidos por una ciudad mide:
+- Actualizaciones de posición por segundo (movimientos pequeños, como el radar)
+- "Amigos a menos de R metros" y "k más cercanos" con el índice frente a un
+  recorrido lineal de todos los miembros (lo que hace hoy cada teléfono)
+
+Antes de medir comprueba que el índice devuelve lo mismo que el recorrido lineal.
+
+Uso:
+    python -m benchmarks.spatial_index_bench --members 1000,5000,20000 --radius 500 --k 10
+"""
+
+import argparse
+import heapq
+import math
+import random
+import sys
+import time
+
+from app.core.spatial_index import GridIndex
+
+from benchmarks._common import compare_to_baseline, percentile, write_results
+
+CENTER = (19.4326, -99.1332)  # CDMX
+
+
+def brute_within(index: GridIndex, lat: float, lon: float, radius: float):
+    x, y = index._project(lat, lon)
+    matches = []
+    for username, position in index.positions.items():
+        distance = math.hypot(position[2] - x, position[3] - y)
+        if distance <= radius:
+            matches.append((distance, username))
+    matches.sort()
+    return matches
+
+
+def brute_nearest(index: GridIndex, lat: float, lon: float, k: int):
+    x, y = index._project(lat, lon)
+    return heapq.nsmallest(k, ((math.hypot(p[2] - x, p[3] - y), u) for u, p in index.positions.items()))
+
+
+def per_call_us(fn, queries) -> list:
+    samples = []
+    for lat, lon in queries:
+        start = time.perf_counter()
+        fn(lat, lon)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def bench_room(members: int, spread_km: float, cell: float, radius: float, k: int,
+               queries: int, rng: random.Random) -> dict:
+    index = GridIndex(CENTER[0], cell)
+    spread_deg = spread_km / 111.0
+    points = {
+        f"user{i}": (CENTER[0] + rng.uniform(-spread_deg, spread_deg),
+                     CENTER[1] + rng.uniform(-spread_deg, spread_deg))
+        for i in range(members)
+    }
+    for username, (lat, lon) in points.items():
+        index.update(username, lat, lon)
+
+    # Movimientos de ~10 m (lo habitual entre dos UPDATE_LOCATION)
+    moves = [(f"user{rng.randrange(members)}", rng.uniform(-1e-4, 1e-4), rng.uniform(-1e-4, 1e-4))
+             for _ in range(100_000)]
+    start = time.perf_counter()
+    for username, dlat, dlon in moves:
+        lat, lon = points[username]
+        index.update(username, lat + dlat, lon + dlon)
+    update_ops = len(moves) / (time.perf_counter() - start)
+
+    sample = [points[f"user{rng.randrange(members)}"] for _ in range(queries)]
+
+    # Correctitud frente al recorrido lineal
+    for lat, lon in sample[:50]:
+        assert index.within(lat, lon, radius) == brute_within(index, lat, lon, radius)
+        assert [d for d, _ in index.nearest(lat, lon, k)] == [d for d, _ in brute_nearest(index, lat, lon, k)]
+
+    within_us = per_call_us(lambda lat, lon: index.within(lat, lon, radius), sample)
+    brute_within_us = per_call_us(lambda lat, lon: brute_within(index, lat, lon, radius), sample)
+    nearest_us = per_call_us(lambda lat, lon: index.nearest(lat, lon, k), sample)
+    brute_nearest_us = per_call_us(lambda lat, lon: brute_nearest(index, lat, lon, k), sample)
+
+    prefix = f"m{members}"
+    return {
+        f"{prefix}_update_ops_per_sec": round(update_ops, 1),
+        f"{prefix}_within_p50_us": round(percentile(within_us, 50), 1),
+        f"{prefix}_within_brute_p50_us": round(percentile(brute_within_us, 50), 1),
+        f"{prefix}_nearest_p50_us": round(percentile(nearest_us, 50), 1),
+        f"{prefix}_nearest_brute_p50_us": round(percentile(brute_nearest_us, 50), 1),
+        f"{prefix}_occupied_cells": len(index.cells),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", default="1000,5000,20000", help="Tamaños de sala separados por coma")
+    parser.add_argument("--spread-km", type=float, default=10.0, help="Lado del área donde se reparten")
+    parser.add_argument("--cell", type=float, default=250.0, help="Lado de la celda en metros")
+    parser.add_argument("--radius", type=float, default=500.0)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Guardar resultados en este JSON")
+    parser.add_argument("--baseline", help="JSON anterior para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {"spread_km": args.spread_km, "cell_m": args.cell, "radius_m": args.radius, "k": args.k}
+    for members in (int(m) for m in args.members.split(",")):
+        results.update(bench_room(members, args.spread_km, args.cell, args.radius, args.k, args.queries, rng))
+    write_results(results, args.output)
+
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results,
+            args.baseline,
+            higher_is_better=[key for key in results if key.endswith("_ops_per_sec")],
+            lower_is_better=[key for key in results if key.endswith("_us") and "brute" not in key],
+            max_regression=args.max_regression,
+        )
+        if regressions:
+            print("Regresiones detectadas:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark de la compactación del historial de ubicaciones.
+
+Genera un día de puntos a 1 Hz para varios usuarios de una sala en una BD
+SQLite temporal, compacta el historial y compara el tamaño almacenado y la
+latencia de leer el día completo antes y después.
+
+Uso:
+    python -m benchmarks.track_compaction_bench --users 4 --hours 24
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlmodel import SQLModel, create_engine
+
+from app.core.config import settings
+from app.core.track_compactor import TrackCompactor
+from app.api.routes.history import _stream_tracks
+from app.models.location import LocationPoint
+
+ROOM_CODE = "BENCH1"
+
+
+def generate_points(users: int, hours: float, start: datetime):
+    """Paseos aleatorios suaves a 1 Hz con paradas ocasionales"""
+    seconds = int(hours * 3600)
+    for user in range(users):
+        lat, lon = 19.4326 + user * 0.01, -99.1332
+        heading = random.uniform(0, 2 * math.pi)
+        rows = []
+        for second in range(seconds):
+            if second % 600 < 480:  # 8 minutos en movimiento, 2 parado
+                heading += random.gauss(0, 0.05)
+                lat += math.cos(heading) * 1.2e-5
+                lon += math.sin(heading) * 1.2e-5
+            rows.append({
+                "room_code": ROOM_CODE,
+                "username": f"user{user}",
+                "lat": lat + random.gauss(0, 2e-6),
+                "lon": lon + random.gauss(0, 2e-6),
+                "recorded_at": start + timedelta(seconds=second)
+            })
+            if len(rows) >= 5000:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+
+def read_window(engine, start: datetime, end: datetime) -> dict:
+    """Lee la ventana completa con el mismo generador que usa el endpoint"""
+    begin = time.perf_counter()
+    lines = list(_stream_tracks(engine, ROOM_CODE, start, end, None))
+    return {
+        "ms": round((time.perf_counter() - begin) * 1000, 1),
+        "tracks": len(lines),
+        "bytes": sum(len(line) for line in lines)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--tolerance", type=float, default=settings.track_simplify_tolerance_meters)
+    args = parser.parse_args()
+
+    settings.track_simplify_tolerance_meters = args.tolerance
+    settings.track_compaction_age_seconds = 0
+    settings.track_compaction_max_batches_per_run = 1_000_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "history.db")
+        engine = create_engine(f"sqlite:///{path}")
+        SQLModel.metadata.create_all(engine)
+
+        start = datetime.utcnow() - timedelta(hours=args.hours + 1)
+        end = start + timedelta(hours=args.hours)
+        raw_points = 0
+        with engine.begin() as conn:
+            for rows in generate_points(args.users, args.hours, start):
+                conn.execute(insert(LocationPoint.__table__).values(rows))
+                raw_points += len(rows)
+
+        with engine.begin() as conn:
+            conn.exec_driver_sql("VACUUM")
+        raw_size = os.path.getsize(path)
+        raw_read = read_window(engine, start, end)
+
+        compactor = TrackCompactor()
+        begin = time.perf_counter()
+        settings.track_compaction_batch_size = 20_000
+        while compactor.compact_batch(engine, datetime.utcnow(), settings.track_compaction_batch_size):
+            pass
+        compaction_s = time.perf_counter() - begin
+
+        with engine.begin() as conn:
+            conn.exec_driver_sql("VACUUM")
+        compacted_size = os.path.getsize(path)
+        compacted_read = read_window(engine, start, end)
+        engine.dispose()
+
+    print(json.dumps({
+        "raw_points": raw_points,
+        "compaction_seconds": round(compaction_s, 2),
+        "tracks": compactor.created_tracks,
+        "db_bytes": {"raw": raw_size, "compacted": compacted_size,
+                     "ratio": round(raw_size / max(compacted_size, 1), 1)},
+        "read_day": {"raw": raw_read, "compacted": compacted_read}
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
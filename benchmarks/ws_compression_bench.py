@@ -0,0 +1,139 @@
+"""
+Benchmark de la compresión de los mensajes del radar: CPU frente a bytes.
+
+Para cada tamaño de sala N reenvía B mensajes típicos (mayoría de
+FRIEND_MOVED, más FRIENDS_MOVED agrupados, ROOM_AGGREGATES y NEARBY_RESULT)
+a N sockets y compara:
+
+- plain: sin comprimir
+- per_socket: permessage-deflate como lo hace el servidor de WebSockets de
+  uvicorn (un compresor por socket con contexto compartido entre mensajes):
+  cada broadcast se comprime N veces
+- shared: radar.deflate (app/core/connection_manager.py): cada broadcast se
+  comprime una vez sin contexto y el mismo frame va a los N sockets
+
+Uso:
+    python -m benchmarks.ws_compression_bench --sizes 10,100,1000 --broadcasts 200
+"""
+
+import argparse
+import json
+import random
+import sys
+import zlib
+
+from app.core.config import settings
+from app.core.connection_manager import deflate_frame
+
+from benchmarks._common import compare_to_baseline, cpu_seconds, write_results
+
+CENTER = (19.4326, -99.1332)
+
+
+def typical_messages(count: int, room_size: int, rng: random.Random) -> list:
+    """Mezcla de mensajes del radar con posiciones y usernames realistas"""
+    def friend():
+        return {
+            "username": f"user{rng.randrange(room_size)}",
+            "lat": CENTER[0] + rng.uniform(-0.05, 0.05),
+            "lon": CENTER[1] + rng.uniform(-0.05, 0.05),
+        }
+
+    messages = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.85:
+            message = {"event": "FRIEND_MOVED", "data": friend()}
+        elif kind < 0.93:
+            message = {"event": "FRIENDS_MOVED", "data": {"friends": [friend() for _ in range(min(room_size, 50))]}}
+        elif kind < 0.97:
+            message = {"event": "NEARBY_RESULT", "data": {"friends": [
+                dict(friend(), distance_m=round(rng.uniform(10, 3000), 1)) for _ in range(10)
+            ]}}
+        else:
+            message = {"event": "ROOM_AGGREGATES", "data": {
+                "count": room_size,
+                "centroid": {"lat": CENTER[0], "lon": CENTER[1]},
+                "bbox": {"min_lat": CENTER[0] - 0.05, "min_lon": CENTER[1] - 0.05,
+                         "max_lat": CENTER[0] + 0.05, "max_lon": CENTER[1] + 0.05},
+                "spread_m": round(rng.uniform(100, 5000), 1)
+            }}
+        messages.append(json.dumps(message))
+    return messages
+
+
+def run_plain(messages: list, sockets: int) -> tuple:
+    return 0.0, sum(len(message.encode()) for message in messages) * sockets
+
+
+def run_per_socket(messages: list, sockets: int, level: int) -> tuple:
+    """Un compresor por socket, como permessage-deflate con context takeover"""
+    compressors = [zlib.compressobj(level, zlib.DEFLATED, -15, 8) for _ in range(sockets)]
+    total = 0
+    start = cpu_seconds()
+    for message in messages:
+        data = message.encode()
+        for compressor in compressors:
+            frame = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            # RFC 7692: se quita la cola 00 00 ff ff
+            total += len(frame) - 4
+    return cpu_seconds() - start, total
+
+
+def run_shared(messages: list, sockets: int) -> tuple:
+    """Un frame por mensaje compartido por todos los sockets (radar.deflate)"""
+    total = 0
+    start = cpu_seconds()
+    for message in messages:
+        frame = deflate_frame(message)
+        total += (len(frame) if frame is not None else len(message.encode())) * sockets
+    return cpu_seconds() - start, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000")
+    parser.add_argument("--broadcasts", type=int, default=200)
+    parser.add_argument("--level", type=int, default=settings.ws_shared_compression_level)
+    parser.add_argument("--min-bytes", type=int, default=settings.ws_shared_compression_min_bytes)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Guardar resultados en este JSON")
+    parser.add_argument("--baseline", help="JSON anterior para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    settings.ws_shared_compression_level = args.level
+    settings.ws_shared_compression_min_bytes = args.min_bytes
+    rng = random.Random(args.seed)
+    results = {"broadcasts": args.broadcasts, "level": args.level, "min_bytes": args.min_bytes}
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        messages = typical_messages(args.broadcasts, size, rng)
+        plain_bytes = run_plain(messages, size)[1]
+        for mode, (cpu, total) in (
+            ("plain", (0.0, plain_bytes)),
+            ("per_socket", run_per_socket(messages, size, args.level)),
+            ("shared", run_shared(messages, size)),
+        ):
+            key = f"n{size}_{mode}"
+            results[f"{key}_cpu_us_per_broadcast"] = round(cpu / args.broadcasts * 1e6, 1)
+            results[f"{key}_bytes_per_recipient"] = round(total / args.broadcasts / size, 1)
+            results[f"{key}_bytes_saved_pct"] = round(100 * (1 - total / plain_bytes), 1)
+
+    write_results(results, args.output)
+
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results,
+            args.baseline,
+            higher_is_better=[key for key in results if key.endswith("_shared_bytes_saved_pct")],
+            lower_is_better=[key for key in results if key.endswith("_shared_cpu_us_per_broadcast")],
+            max_regression=args.max_regression,
+        )
+        if regressions:
+            print("Regresiones detectadas:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark de la decodificación de los frames que envía el radar.
+
+Compara, sobre la misma mezcla de frames (mayoría de UPDATE_LOCATION, algunos
+NEARBY_QUERY y un porcentaje de frames inválidos):
+
+- json_dict: el camino anterior, json.loads a dict y acceso por claves
+  (sin validar tipos ni rangos)
+- pydantic: TypeAdapter de pydantic con la misma validación, como referencia
+- msgspec: decode_inbound (app/models/radar.py), structs tipados validados
+
+Uso:
+    python -m benchmarks.ws_decode_bench --frames 200000 --invalid-pct 2
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from typing import Annotated, Literal, Optional, Union
+
+import msgspec
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+
+from app.models.radar import UpdateLocation, decode_inbound
+
+from benchmarks._common import compare_to_baseline, write_results
+
+CENTER = (19.4326, -99.1332)
+
+
+class PydanticLocation(BaseModel):
+    lat: float = Field(ge=-90, le=90)
+    lon: float = Field(ge=-180, le=180)
+
+
+class PydanticUpdate(BaseModel):
+    event: Literal["UPDATE_LOCATION"]
+    data: PydanticLocation
+
+
+class PydanticNearbyData(BaseModel):
+    radius: Optional[float] = Field(None, gt=0)
+    k: Optional[int] = Field(None, ge=1)
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
+
+
+class PydanticNearby(BaseModel):
+    event: Literal["NEARBY_QUERY"]
+    data: PydanticNearbyData = PydanticNearbyData()
+
+
+pydantic_adapter = TypeAdapter(Annotated[Union[PydanticUpdate, PydanticNearby], Field(discriminator="event")])
+
+
+def make_frames(count: int, invalid_pct: float, rng: random.Random) -> list:
+    frames = []
+    for _ in range(count):
+        kind = rng.random() * 100
+        if kind < invalid_pct:
+            frame = rng.choice([
+                '{"event": "UPDATE_LOCATION", "data": {"lat": 123.0, "lon": 0}}',
+                '{"event": "UPDATE_LOCATION"}',
+                '{"event": "UPDATE_LOCATION", "data": {"lat": "19.4", "lon": -99.1}}',
+                '{not json',
+            ])
+        elif kind < 95:
+            frame = json.dumps({"event": "UPDATE_LOCATION", "data": {
+                "lat": CENTER[0] + rng.uniform(-0.05, 0.05),
+                "lon": CENTER[1] + rng.uniform(-0.05, 0.05),
+            }})
+        else:
+            frame = json.dumps({"event": "NEARBY_QUERY", "data": {"radius": 500, "k": 10}})
+        frames.append(frame.encode())
+    return frames
+
+
+def run_json_dict(frames: list) -> int:
+    valid = 0
+    for frame in frames:
+        try:
+            payload = json.loads(frame)
+            if payload.get("event") == "UPDATE_LOCATION":
+                payload["data"].get("lat"), payload["data"].get("lon")
+            valid += 1
+        except (ValueError, KeyError, AttributeError):
+            pass
+    return valid
+
+
+def run_pydantic(frames: list) -> int:
+    valid = 0
+    for frame in frames:
+        try:
+            message = pydantic_adapter.validate_json(frame)
+            if message.event == "UPDATE_LOCATION":
+                message.data.lat, message.data.lon
+            valid += 1
+        except ValidationError:
+            pass
+    return valid
+
+
+def run_msgspec(frames: list) -> int:
+    valid = 0
+    for frame in frames:
+        try:
+            message = decode_inbound(frame)
+            if type(message) is UpdateLocation:
+                message.data.lat, message.data.lon
+            valid += 1
+        except msgspec.DecodeError:
+            pass
+    return valid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=200000)
+    parser.add_argument("--invalid-pct", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Guardar resultados en este JSON")
+    parser.add_argument("--baseline", help="JSON anterior para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames, args.invalid_pct, random.Random(args.seed))
+    results = {"frames": args.frames, "invalid_pct": args.invalid_pct}
+    for name, run in (("json_dict", run_json_dict), ("pydantic", run_pydantic), ("msgspec", run_msgspec)):
+        start = time.perf_counter()
+        valid = run(frames)
+        elapsed = time.perf_counter() - start
+        results[f"{name}_frames_per_sec"] = round(args.frames / elapsed, 1)
+        results[f"{name}_ns_per_frame"] = round(elapsed / args.frames * 1e9, 1)
+        results[f"{name}_accepted"] = valid
+    results["msgspec_speedup_vs_json_dict"] = round(
+        results["msgspec_frames_per_sec"] / results["json_dict_frames_per_sec"], 2)
+
+    write_results(results, args.output)
+
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results,
+            args.baseline,
+            higher_is_better=["msgspec_frames_per_sec"],
+            lower_is_better=["msgspec_ns_per_frame"],
+            max_regression=args.max_regression,
+        )
+        if regressions:
+            print("Regresiones detectadas:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
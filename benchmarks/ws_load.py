@@ -0,0 +1,240 @@
+"""
+Prueba de carga del WebSocket del radar.
+
+Levanta la app de app/main.py con uvicorn en un hilo del mismo proceso y
+conecta N salas x M teléfonos simulados a /ws/{room_code}/{username}. Cada
+teléfono envía UPDATE_LOCATION a la frecuencia indicada y mide la latencia
+extremo a extremo hasta recibir el FRIEND_MOVED correspondiente en los demás
+teléfonos de la sala.
+
+CPU y RSS son del proceso completo (servidor + clientes simulados), así que
+sirven para comparar versiones entre sí, no como coste absoluto del servidor.
+Por defecto se ignora DATABASE_URL para no depender de MySQL (--with-db).
+
+Las conexiones que fallan o no abren en --connect-timeout segundos se cuentan
+en `connect_failures` y la medición empieza con las que sí abrieron (a la
+escala que se quiere probar es justo lo que puede pasar).
+
+Uso:
+    python -m benchmarks.ws_load --rooms 50 --phones 8 --rate 1 --duration 20 \\
+        --output ws_load.json [--baseline anterior.json --max-regression 0.2]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import uvicorn
+import websockets
+
+from benchmarks._common import (
+    compare_to_baseline,
+    cpu_seconds,
+    percentile,
+    rss_bytes,
+    write_results,
+)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, with_db: bool) -> Tuple[uvicorn.Server, threading.Thread]:
+    """Arranca uvicorn en un hilo con su propio event loop"""
+    from app.core.config import settings
+    from app.main import app
+
+    if not with_db:
+        settings.database_url = None
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+class LoadStats:
+    def __init__(self, phones: int):
+        # (username, lat) -> instante de envío
+        self.sent_at: Dict[Tuple[str, float], float] = {}
+        self.latencies: List[float] = []
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+        self.connected = 0
+        self.connect_failures = 0
+        self.connect_error_types: Dict[str, int] = {}
+        # Se activa cuando cada teléfono conectó o falló
+        self.phones = phones
+        self.settled = asyncio.Event()
+        # Fin de la ventana de medición; se fija cuando todos están conectados
+        self.stop_at = float("inf")
+
+    def settle(self, error: Optional[Exception] = None):
+        """Un teléfono terminó de conectar (o falló al hacerlo)"""
+        if error is None:
+            self.connected += 1
+        else:
+            self.connect_failures += 1
+            name = type(error).__name__
+            self.connect_error_types[name] = self.connect_error_types.get(name, 0) + 1
+        if self.connected + self.connect_failures >= self.phones:
+            self.settled.set()
+
+
+async def phone(url: str, username: str, rate: float, stats: LoadStats, connect_timeout: float):
+    """Teléfono simulado: envía su posición periódicamente y escucha a sus amigos"""
+    try:
+        ws = await websockets.connect(url, max_queue=None, open_timeout=connect_timeout)
+    except Exception as e:
+        stats.settle(e)
+        return
+    stats.settle()
+    try:
+        await stats.settled.wait()
+
+        async def reader():
+            async for raw in ws:
+                now = time.perf_counter()
+                message = json.loads(raw)
+                if message.get("event") != "FRIEND_MOVED":
+                    continue
+                data = message["data"]
+                sent_at = stats.sent_at.get((data["username"], data["lat"]))
+                stats.received += 1
+                if sent_at is not None:
+                    stats.latencies.append(now - sent_at)
+
+        reader_task = asyncio.create_task(reader())
+        interval = 1.0 / rate
+        seq = 0
+        base_lat = 19.0 + random.random()
+        await asyncio.sleep(random.random() * interval)
+
+        try:
+            while time.perf_counter() < stats.stop_at:
+                seq += 1
+                # La latitud lleva el número de secuencia para emparejar el FRIEND_MOVED
+                lat = round(base_lat + seq * 1e-7, 7)
+                stats.sent_at[(username, lat)] = time.perf_counter()
+                await ws.send(json.dumps({
+                    "event": "UPDATE_LOCATION",
+                    "data": {"lat": lat, "lon": -99.13}
+                }))
+                stats.sent += 1
+                await asyncio.sleep(interval)
+            # Dar tiempo a que lleguen los últimos mensajes
+            await asyncio.sleep(0.5)
+        except websockets.ConnectionClosed:
+            stats.errors += 1
+        finally:
+            reader_task.cancel()
+    finally:
+        await ws.close()
+
+
+async def run_load(port: int, rooms: int, phones: int, rate: float, duration: float, connect_timeout: float) -> LoadStats:
+    stats = LoadStats(rooms * phones)
+
+    tasks = []
+    for r in range(rooms):
+        room_code = f"L{r:05d}"
+        for p in range(phones):
+            username = f"u{r}_{p}"
+            url = f"ws://127.0.0.1:{port}/ws/{room_code}/{username}"
+            tasks.append(asyncio.create_task(phone(url, username, rate, stats, connect_timeout)))
+
+    # Todos conectados (o fallidos): empezar la ventana de medición. El
+    # timeout de cada conexión ya acota la espera; este es por si acaso
+    try:
+        await asyncio.wait_for(stats.settled.wait(), timeout=connect_timeout * 2)
+    except asyncio.TimeoutError:
+        stats.settled.set()
+    if stats.connect_failures:
+        print(
+            f"{stats.connect_failures} de {stats.phones} conexiones fallaron: {stats.connect_error_types}",
+            file=sys.stderr
+        )
+    stats.stop_at = time.perf_counter() + duration
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--phones", type=int, default=8, help="Teléfonos por sala")
+    parser.add_argument("--rate", type=float, default=1.0, help="Actualizaciones por segundo por teléfono")
+    parser.add_argument("--duration", type=float, default=20.0, help="Segundos de medición")
+    parser.add_argument("--connect-timeout", type=float, default=10.0, help="Segundos para abrir cada conexión")
+    parser.add_argument("--with-db", action="store_true", help="Inicializar la BD configurada")
+    parser.add_argument("--output", help="Guardar resultados en este JSON")
+    parser.add_argument("--baseline", help="JSON anterior para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    port = free_port()
+    server, thread = start_server(port, args.with_db)
+    rss_before = rss_bytes()
+    cpu_before = cpu_seconds()
+    wall_start = time.perf_counter()
+
+    stats = asyncio.run(run_load(port, args.rooms, args.phones, args.rate, args.duration, args.connect_timeout))
+
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_before
+    server.should_exit = True
+    thread.join(timeout=10)
+
+    latencies_ms = [latency * 1000 for latency in stats.latencies]
+    results = {
+        "rooms": args.rooms,
+        "phones_per_room": args.phones,
+        "connections": args.rooms * args.phones,
+        "connected": stats.connected,
+        "connect_failures": stats.connect_failures,
+        "rate_per_phone": args.rate,
+        "duration_s": round(wall, 2),
+        "updates_sent": stats.sent,
+        "friend_moved_received": stats.received,
+        "updates_per_second": round(stats.sent / args.duration, 1),
+        "messages_delivered_per_second": round(stats.received / args.duration, 1),
+        "latency_p50_ms": round(percentile(latencies_ms, 50), 3),
+        "latency_p95_ms": round(percentile(latencies_ms, 95), 3),
+        "latency_p99_ms": round(percentile(latencies_ms, 99), 3),
+        "latency_max_ms": round(max(latencies_ms, default=0.0), 3),
+        "cpu_seconds": round(cpu, 2),
+        "cpu_percent": round(cpu / wall * 100, 1),
+        "rss_mb": round(rss_bytes() / 1e6, 1),
+        "rss_growth_mb": round((rss_bytes() - rss_before) / 1e6, 1),
+        "errors": stats.errors,
+    }
+    write_results(results, args.output)
+
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results,
+            args.baseline,
+            higher_is_better=["messages_delivered_per_second"],
+            lower_is_better=["latency_p50_ms", "latency_p95_ms", "latency_p99_ms", "cpu_seconds"],
+            max_regression=args.max_regression,
+        )
+        if regressions:
+            print("Regresiones detectadas:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,29 @@ CREATE TABLE IF NOT EXISTS user (
     INDEX idx_email (email)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Crear tabla de historial de ubicaciones (se llena en lotes desde la API)
+CREATE TABLE IF NOT EXISTS location_point (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    room_code VARCHAR(16) NOT NULL,
+    username VARCHAR(255) NOT NULL,
+    lat DOUBLE NOT NULL,
+    lon DOUBLE NOT NULL,
+    recorded_at DATETIME NOT NULL,
+    INDEX idx_location_point_room_time (room_code, recorded_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Crear tabla de tramos compactados (polyline de lat, lon, segundos)
+CREATE TABLE IF NOT EXISTS location_track (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    room_code VARCHAR(16) NOT NULL,
+    username VARCHAR(255) NOT NULL,
+    start_at DATETIME NOT NULL,
+    end_at DATETIME NOT NULL,
+    point_count INT NOT NULL,
+    polyline MEDIUMTEXT NOT NULL,
+    INDEX idx_location_track_room_time (room_code, start_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Insertar usuario de prueba
 -- Password: "test123" (ya hasheado con bcrypt)
 INSERT INTO user (username, email, hashed_password) 